@@ -24,6 +24,8 @@ class Settings:
     # --- API Keys ---
     # Esta es la clave que se usará para los servicios de Google/Gemini en el backend.
     GEMINI_API_KEY_BACKEND: Optional[str] = os.getenv("GEMINI_API_KEY_BACKEND")
+    # URL base de la API REST de Gemini. Puede apuntar a un stand-in local (app/standins/gemini_api.py) para pruebas sin red.
+    GEMINI_API_BASE_URL: str = os.getenv("GEMINI_API_BASE_URL", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
     
     # Modelo de embedding (singular)
     EMBEDDING_MODEL_NAME: str = os.getenv("EMBEDDING_MODEL_NAME", "models/embedding-001")
@@ -59,6 +61,9 @@ class Settings:
     RAG_NUM_SOURCE_CHUNKS: int = int(os.getenv("RAG_NUM_SOURCE_CHUNKS", "4"))
     
     PROCESSED_DATA_DIR: str = os.getenv("PROCESSED_DATA_DIR", "processed_data")
+    # Caché LRU en memoria del texto de los PDFs (por pdf_id, invalidada por mtime del archivo).
+    PDF_CONTENT_CACHE_MAX_ENTRIES: int = int(os.getenv("PDF_CONTENT_CACHE_MAX_ENTRIES", "64"))
+    PDF_CONTENT_CACHE_MAX_BYTES: int = int(os.getenv("PDF_CONTENT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
     
     DEFAULT_GEMINI_MODEL_RAG: str = os.getenv("DEFAULT_GEMINI_MODEL_RAG", "gemini-1.5-flash-latest")
     RAG_LLM_TEMPERATURE: float = float(os.getenv("RAG_LLM_TEMPERATURE", "0.3"))
@@ -73,6 +78,94 @@ class Settings:
     DEFAULT_GEMINI_MODEL_EXAM_GEN: str = os.getenv("DEFAULT_GEMINI_MODEL_EXAM_GEN", "gemini-1.5-flash-latest")
     EXAM_GEN_LLM_TEMPERATURE: float = float(os.getenv("EXAM_GEN_LLM_TEMPERATURE", "0.4"))
     EXAM_GEN_LLM_TIMEOUT_SECONDS: float = float(os.getenv("EXAM_GEN_LLM_TIMEOUT_SECONDS", "180.0"))
+    # Selección de contexto por cobertura (clustering de fragmentos) en lugar de truncar por el inicio.
+    CONTEXT_SELECTOR_ENABLED: bool = os.getenv("CONTEXT_SELECTOR_ENABLED", "True").lower() == "true"
+    CONTEXT_SELECTOR_METHOD: str = os.getenv("CONTEXT_SELECTOR_METHOD", "kmeans") # "kmeans" o "fps" (farthest-point sampling)
+    CONTEXT_SELECTOR_USE_INDEX_EMBEDDINGS: bool = os.getenv("CONTEXT_SELECTOR_USE_INDEX_EMBEDDINGS", "True").lower() == "true"
+    EXAM_GEN_CONTEXT_TOKEN_BUDGET: int = int(os.getenv("EXAM_GEN_CONTEXT_TOKEN_BUDGET", "8000"))
+    EXAM_GEN_REGEN_CONTEXT_TOKEN_BUDGET: int = int(os.getenv("EXAM_GEN_REGEN_CONTEXT_TOKEN_BUDGET", "2500"))
+    ACTIVITIES_CONTEXT_TOKEN_BUDGET: int = int(os.getenv("ACTIVITIES_CONTEXT_TOKEN_BUDGET", "6000"))
+    # Extracción local de palabras clave (TF-IDF sobre processed_data/) para las actividades
+    KEYWORD_EXTRACTOR_ENABLED: bool = os.getenv("KEYWORD_EXTRACTOR_ENABLED", "True").lower() == "true"
+    KEYWORD_STATS_PATH: str = os.getenv("KEYWORD_STATS_PATH", os.path.join(PROCESSED_DATA_DIR, "keyword_stats.json.gz"))
+    KEYWORD_CACHE_TOP_N: int = int(os.getenv("KEYWORD_CACHE_TOP_N", "60"))
+    # Almacén LRU de resultados de actividades y herramientas (JSON comprimido en memoria)
+    RESULT_STORE_ENABLED: bool = os.getenv("RESULT_STORE_ENABLED", "True").lower() == "true"
+    RESULT_STORE_MAX_ENTRIES: int = int(os.getenv("RESULT_STORE_MAX_ENTRIES", "512"))
+    RESULT_STORE_MAX_BYTES: int = int(os.getenv("RESULT_STORE_MAX_BYTES", str(32 * 1024 * 1024)))
+    # Mapas conceptuales/mentales en modo jerárquico (map-reduce por secciones) para documentos largos
+    TOOLS_HIERARCHICAL_MIN_CHARS: int = int(os.getenv("TOOLS_HIERARCHICAL_MIN_CHARS", "60000"))
+    TOOLS_MAP_SECTION_CHARS: int = int(os.getenv("TOOLS_MAP_SECTION_CHARS", "20000"))
+    TOOLS_MAP_MAX_SECTIONS: int = int(os.getenv("TOOLS_MAP_MAX_SECTIONS", "12"))
+    TOOLS_MAP_MAX_CONCURRENCY: int = int(os.getenv("TOOLS_MAP_MAX_CONCURRENCY", "6"))
+    TOOLS_MAP_SECTION_MAX_NODES: int = int(os.getenv("TOOLS_MAP_SECTION_MAX_NODES", "10"))
+    TOOLS_MAP_FINAL_MAX_NODES: int = int(os.getenv("TOOLS_MAP_FINAL_MAX_NODES", "30"))
+    TOOLS_MAP_SIMILARITY_THRESHOLD: float = float(os.getenv("TOOLS_MAP_SIMILARITY_THRESHOLD", "0.9"))
+    TOOLS_MAP_USE_EMBEDDINGS: bool = os.getenv("TOOLS_MAP_USE_EMBEDDINGS", "True").lower() == "true"
+    # Post-procesado de mapas: normalización del grafo y posiciones precalculadas (x/y) para el frontend
+    TOOLS_MAP_LAYOUT_ENABLED: bool = os.getenv("TOOLS_MAP_LAYOUT_ENABLED", "True").lower() == "true"
+    TOOLS_MAP_LAYOUT_ITERATIONS: int = int(os.getenv("TOOLS_MAP_LAYOUT_ITERATIONS", "100"))
+    # Expansión bajo demanda de nodos del mapa mental (solo los fragmentos relevantes para la rama)
+    TOOLS_EXPAND_NUM_CHUNKS: int = int(os.getenv("TOOLS_EXPAND_NUM_CHUNKS", "6"))
+    TOOLS_EXPAND_MAX_CHILDREN: int = int(os.getenv("TOOLS_EXPAND_MAX_CHILDREN", "5"))
+    TOOLS_EXPAND_MAX_CONTEXT_CHARS: int = int(os.getenv("TOOLS_EXPAND_MAX_CONTEXT_CHARS", "12000"))
+    # Motor de sopas de letras (backtracking sobre cuadrícula NumPy)
+    WORD_SEARCH_MAX_SIZE: int = int(os.getenv("WORD_SEARCH_MAX_SIZE", "40"))
+    WORD_SEARCH_BRANCHING: int = int(os.getenv("WORD_SEARCH_BRANCHING", "8"))
+    WORD_SEARCH_NODE_BUDGET: int = int(os.getenv("WORD_SEARCH_NODE_BUDGET", "2000"))
+    WORD_SEARCH_PROCESS_WORKERS: int = int(os.getenv("WORD_SEARCH_PROCESS_WORKERS", "0")) # 0 = núcleos disponibles
+    WORD_SEARCH_PROCESS_MIN_VARIANTS: int = int(os.getenv("WORD_SEARCH_PROCESS_MIN_VARIANTS", "4"))
+    # Motor de crucigramas (beam search con índice letra -> posiciones)
+    CROSSWORD_BEAM_WIDTH: int = int(os.getenv("CROSSWORD_BEAM_WIDTH", "12"))
+    CROSSWORD_MAX_SIZE: int = int(os.getenv("CROSSWORD_MAX_SIZE", "25"))
+    # Detección local de preguntas casi duplicadas (MinHash + coseno TF-IDF sobre términos con contenido)
+    QUESTION_DEDUP_ENABLED: bool = os.getenv("QUESTION_DEDUP_ENABLED", "True").lower() == "true"
+    QUESTION_DEDUP_JACCARD_THRESHOLD: float = float(os.getenv("QUESTION_DEDUP_JACCARD_THRESHOLD", "0.5"))
+    QUESTION_DEDUP_COSINE_THRESHOLD: float = float(os.getenv("QUESTION_DEDUP_COSINE_THRESHOLD", "0.7"))
+    REGEN_MAX_NEGATIVE_QUESTIONS: int = int(os.getenv("REGEN_MAX_NEGATIVE_QUESTIONS", "8"))
+    # Intervalo de comentarios keep-alive en los endpoints SSE mientras se espera al LLM.
+    SSE_HEARTBEAT_SECONDS: float = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+    EXAM_GEN_MAX_CONCURRENT_SHARDS: int = int(os.getenv("EXAM_GEN_MAX_CONCURRENT_SHARDS", "4"))
+    EXAM_GEN_SHARD_MAX_RETRIES: int = int(os.getenv("EXAM_GEN_SHARD_MAX_RETRIES", "2"))
+
+    # --- Banco de preguntas por PDF ---
+    # Preguntas precalculadas (por tipo, dificultad e idioma) para armar exámenes sin esperar al LLM.
+    # Es opcional: cada solicitud lo activa con use_question_bank y el llenado al subir un PDF está desactivado por defecto.
+    QUESTION_BANK_ENABLED: bool = os.getenv("QUESTION_BANK_ENABLED", "True").lower() == "true"
+    QUESTION_BANK_DIR: str = os.getenv("QUESTION_BANK_DIR", os.path.join(PROCESSED_DATA_DIR, "question_bank"))
+    QUESTION_BANK_FILL_ON_UPLOAD: bool = os.getenv("QUESTION_BANK_FILL_ON_UPLOAD", "False").lower() == "true"
+    QUESTION_BANK_TARGET_PER_TYPE: int = int(os.getenv("QUESTION_BANK_TARGET_PER_TYPE", "10"))
+    QUESTION_BANK_DIFFICULTIES_STR: str = os.getenv("QUESTION_BANK_DIFFICULTIES", "facil,medio,dificil")
+    QUESTION_BANK_DIFFICULTIES: List[str] = [
+        s.strip() for s in QUESTION_BANK_DIFFICULTIES_STR.split(',') if s.strip()
+    ]
+    QUESTION_BANK_LANGUAGE: str = os.getenv("QUESTION_BANK_LANGUAGE", "es")
+    QUESTION_BANK_SHARD_SIZE: int = int(os.getenv("QUESTION_BANK_SHARD_SIZE", "10"))
+
+    # --- Trabajos masivos de generación de exámenes ---
+    BULK_JOBS_DIR: str = os.getenv("BULK_JOBS_DIR", os.path.join(PROCESSED_DATA_DIR, "bulk_jobs"))
+    BULK_JOBS_MAX_WORKERS: int = int(os.getenv("BULK_JOBS_MAX_WORKERS", "4"))
+    BULK_JOBS_MAX_ATTEMPTS: int = int(os.getenv("BULK_JOBS_MAX_ATTEMPTS", "2"))
+    BULK_JOBS_RESUME_ON_STARTUP: bool = os.getenv("BULK_JOBS_RESUME_ON_STARTUP", "True").lower() == "true"
+    # Límite de peticiones al modelo por minuto compartido por los workers de los trabajos masivos.
+    GEMINI_REQUESTS_PER_MINUTE: int = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))
+    GEMINI_BATCH_POLL_SECONDS: float = float(os.getenv("GEMINI_BATCH_POLL_SECONDS", "30"))
+    GEMINI_BATCH_TIMEOUT_SECONDS: float = float(os.getenv("GEMINI_BATCH_TIMEOUT_SECONDS", str(24 * 3600)))
+
+    # --- Gemini Context Caching (cachedContents) ---
+    # Registra el texto de un PDF una sola vez como contenido cacheado y lo referencia en llamadas posteriores.
+    GEMINI_CONTEXT_CACHE_ENABLED: bool = os.getenv("GEMINI_CONTEXT_CACHE_ENABLED", "False").lower() == "true"
+    GEMINI_CONTEXT_CACHE_TTL_SECONDS: int = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+    GEMINI_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS: int = int(os.getenv("GEMINI_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS", "120"))
+    # La API rechaza contenidos cacheados por debajo de un mínimo de tokens; textos más cortos se envían en línea.
+    GEMINI_CONTEXT_CACHE_MIN_CHARS: int = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_CHARS", "16000"))
+
+    # --- Escrituras masivas en Firestore (WriteBatch, máximo 500 documentos por lote) ---
+    FIRESTORE_BATCH_SIZE: int = int(os.getenv("FIRESTORE_BATCH_SIZE", "500"))
+    FIRESTORE_BATCH_MAX_CONCURRENCY: int = int(os.getenv("FIRESTORE_BATCH_MAX_CONCURRENCY", "4"))
+    # --- Importación de respuestas desde CSV (WriteBatch de Firestore) ---
+    CSV_IMPORT_BATCH_SIZE: int = int(os.getenv("CSV_IMPORT_BATCH_SIZE", "500")) # Máximo 500 (límite de Firestore)
+    CSV_IMPORT_MAX_CONCURRENCY: int = int(os.getenv("CSV_IMPORT_MAX_CONCURRENCY", "4"))
 
     # --- Google Forms Configuration ---
     GOOGLE_FORMS_API_ENABLED: bool = os.getenv("GOOGLE_FORMS_API_ENABLED", "True").lower() == "true"
@@ -80,6 +173,10 @@ class Settings:
         'https://www.googleapis.com/auth/forms.body',
         'https://www.googleapis.com/auth/forms.responses.readonly'
     ]
+    # Endpoint alternativo de la API de Forms (p. ej. el stand-in local app/standins/forms_api.py: "http://127.0.0.1:8766/").
+    GOOGLE_FORMS_API_BASE_URL: Optional[str] = os.getenv("GOOGLE_FORMS_API_BASE_URL") or None
+    # Sincronización incremental de respuestas (forms.responses.list con filtro por timestamp y páginas)
+    GOOGLE_FORMS_SYNC_PAGE_SIZE: int = int(os.getenv("GOOGLE_FORMS_SYNC_PAGE_SIZE", "1000"))
 
     def __init__(self):
         # Procesar FIREBASE_SERVICE_ACCOUNT_KEY_RAW
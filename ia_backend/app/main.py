@@ -1,9 +1,12 @@
 # ia_backend/app/main.py
+import asyncio
 import logging
+import json
 import os 
 from typing import List, Dict, Any, Optional, Union # Asegúrate que Union esté importado
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Body, Depends, Query, Request
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Body, Depends, Query, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv # No es estrictamente necesario si config.py ya lo hace, pero no daña.
 import uvicorn
 import firebase_admin
@@ -24,11 +27,25 @@ from app.services.feedback_service import save_feedback
 from app.services.exam_generator_service import (
     generate_exam_questions_service,
     regenerate_one_question_service, # <--- NUEVA IMPORTACIÓN
-    get_pdf_content_for_exam_generation
+    regenerate_questions_batch_service,
+    get_pdf_context_for_generation,
+    get_pdf_content_for_exam_generation,
+    fill_question_bank_for_pdf,
+    generate_exam_variants_service,
+    stream_exam_generation_events
 )
+from app.services.bulk_exam_jobs import bulk_exam_job_manager
 from app.services.google_forms_service import create_google_form
-from app.services.csv_import_service import import_csv_responses
+from app.services.csv_import_service import import_csv_responses_stream
+from app.services.grading_engine import grade_exam_attempts
+from app.services.exam_analytics import get_exam_analytics
+from app.services.forms_sync_service import sync_form_responses
 from app.services.llm import call_gemini
+from app.services.gemini_context_cache import context_cache_manager
+from app.services.pdf_content_cache import invalidate_pdf_caches
+from app.services.result_store import activity_result_store
+from app.services.question_bank import question_bank
+from app.services.sse_utils import sse_stream_with_heartbeat
 from .services.activities_service import activities_service
 from .services.tools_service import tools_service
 
@@ -45,12 +62,20 @@ from app.models.schemas import (
     GeneratedExamResponse as GeneratedExam,                 # Usando el alias definido en el servicio
     # --- NUEVAS IMPORTACIONES DE SCHEMAS ---
     RegenerateQuestionRequest,
+    BatchRegenerateQuestionsRequest,
+    BatchRegenerateQuestionsResponse,
+    ExamVariantsRequest,
+    GeneratedExamVariantsResponse,
+    BulkExamJobRequest,
+    BulkExamJobStatus,
     QuestionOutput, # El Union de los tipos de pregunta de salida
     TrueFalseQuestionOutput,
     MultipleChoiceQuestionOutput,
     OpenQuestionOutput,
     GoogleFormRequest,
-    GoogleFormResponse
+    GoogleFormResponse,
+    GradeExamResponsesRequest,
+    SyncGoogleFormRequest,
 )
 from app.core.config import settings 
 
@@ -70,6 +95,12 @@ if not firebase_admin._apps:
 
 db = firestore.client()
 
+@app.on_event("startup")
+async def resume_bulk_exam_jobs():
+    # Los trabajos masivos que quedaron a medias (reinicio del servidor) continúan desde su último checkpoint.
+    if settings.BULK_JOBS_RESUME_ON_STARTUP:
+        bulk_exam_job_manager.resume_incomplete_jobs()
+
 if settings.BACKEND_CORS_ORIGINS:
     app.add_middleware(
         CORSMiddleware,
@@ -101,6 +132,7 @@ async def root():
 
 @app.post("/upload-pdf/", response_model=PDFProcessResponse, tags=["PDF Processing"])
 async def upload_and_process_pdf_endpoint(
+    background_tasks: BackgroundTasks,
     user_id: str = Form(...),
     pdf_id: str = Form(...), 
     file: UploadFile = File(...)
@@ -113,6 +145,9 @@ async def upload_and_process_pdf_endpoint(
          raise HTTPException(status_code=400, detail="El archivo no es un PDF válido.")
     try:
         result = await process_uploaded_pdf(file, user_id, pdf_id) 
+        if settings.QUESTION_BANK_ENABLED and settings.QUESTION_BANK_FILL_ON_UPLOAD and str(result.get("status", "")).startswith("processed"):
+            # El banco de preguntas se llena después de responder, para no retrasar la subida.
+            background_tasks.add_task(fill_question_bank_for_pdf, result.get("pdf_id", pdf_id), user_id)
         return PDFProcessResponse(message=result.get("message", "Error procesando PDF subido."), pdf_id=result.get("pdf_id", pdf_id), filename=file.filename, status=result.get("status", "unknown"))
     except HTTPException as http_exc:
         logger.error(f"HTTPException during PDF upload for user {user_id}: {http_exc.detail}")
@@ -149,6 +184,9 @@ async def delete_pdf_endpoint(pdf_id: str, user_id: str = Query(..., description
         db_storage_deleted = await delete_pdf_from_firestore_and_storage(pdf_id, user_id)
         if not db_storage_deleted:
             logger.warning(f"Failed to delete PDF metadata/storage for pdf_id: {pdf_id} by user: {user_id}.")
+
+        invalidate_pdf_caches(pdf_id)
+        await context_cache_manager.invalidate_pdf(pdf_id)
             
         return {"message": f"Solicitud de eliminación para PDF {pdf_id} procesada. Verifique los logs para detalles."}
     except PermissionError as pe: 
@@ -271,6 +309,95 @@ async def regenerate_specific_question_endpoint(
         logger.error(f"Unexpected error in regenerate_specific_question_endpoint for PDF {request.pdf_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error interno inesperado al regenerar la pregunta: {str(e)}")
 
+@app.post(
+    "/exams/regenerate-questions/",
+    response_model=BatchRegenerateQuestionsResponse,
+    tags=["Exams"],
+    summary="Regenerate Several Exam Questions in One Call",
+    description="Regenerates a list of exam questions with a single structured LLM call. The PDF content and existing questions are processed only once."
+)
+async def regenerate_questions_batch_endpoint(request: BatchRegenerateQuestionsRequest):
+    logger.info(f"Received request to regenerate {len(request.questions_to_regenerate)} questions for PDF ID: {request.pdf_id}")
+    try:
+        return await regenerate_questions_batch_service(request)
+    except ValueError as ve:
+        logger.warning(f"Validation error during batch question regeneration for PDF ID {request.pdf_id}: {str(ve)}", exc_info=True)
+        raise HTTPException(status_code=422, detail=str(ve))
+    except RuntimeError as rte:
+        logger.error(f"Runtime error during batch question regeneration for PDF ID {request.pdf_id}: {str(rte)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(rte))
+    except Exception as e:
+        logger.error(f"Unexpected error in regenerate_questions_batch_endpoint for PDF {request.pdf_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error interno inesperado al regenerar las preguntas: {str(e)}")
+
+@app.post("/exams/generate-questions/stream", tags=["Exams"])
+async def api_generate_exam_questions_stream_endpoint(request: ExamGenerationRequest = Body(...)):
+    """
+    Variante SSE de /exams/generate-questions: emite eventos de etapa ("stage"), cada pregunta validada
+    ("question"), "type_completed" por tipo y al final "done" (examen completo) o "error".
+    """
+    logger.info(f"Received SSE request to generate exam for PDF ID: {request.pdf_id}, Title: '{request.title}'")
+    return StreamingResponse(
+        sse_stream_with_heartbeat(stream_exam_generation_events(request), settings.SSE_HEARTBEAT_SECONDS),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/exams/generate-variants", response_model=GeneratedExamVariantsResponse, tags=["Exams"])
+async def api_generate_exam_variants_endpoint(request: ExamVariantsRequest = Body(...)):
+    """Genera un único conjunto de preguntas y construye N versiones barajadas del examen (una sola llamada al LLM)."""
+    logger.info(f"Received request to generate {request.num_variants} exam variants for PDF ID: {request.pdf_id}, Title: '{request.title}'")
+    try:
+        variants_data = await generate_exam_variants_service(request)
+        if variants_data.error:
+            logger.warning(f"Error during exam variants generation for PDF {request.pdf_id}: {variants_data.error}")
+            status_code = 500
+            if "demasiado corto" in variants_data.error.lower(): status_code = 400
+            elif "modelo de ia no pudo generar" in variants_data.error.lower(): status_code = 502
+            raise HTTPException(status_code=status_code, detail=variants_data.error)
+        return variants_data
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error during exam variants generation for PDF {request.pdf_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Ocurrió un error interno inesperado al generar las versiones del examen: {str(e)}")
+
+@app.post("/exams/bulk-jobs", response_model=BulkExamJobStatus, status_code=202, tags=["Exams"])
+async def create_bulk_exam_job_endpoint(request: BulkExamJobRequest = Body(...)):
+    """Programa la generación de un examen por entrada (pdf_id + configuración) con un pool de workers acotado."""
+    logger.info(f"Received bulk exam job with {len(request.entries)} entries (mode: {request.mode})")
+    try:
+        return bulk_exam_job_manager.create_job(request)
+    except Exception as e:
+        logger.error(f"Error creating bulk exam job: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"No se pudo crear el trabajo: {str(e)}")
+
+@app.get("/exams/bulk-jobs/{job_id}", response_model=BulkExamJobStatus, tags=["Exams"])
+async def get_bulk_exam_job_endpoint(job_id: str, include_results: bool = Query(False)):
+    status = bulk_exam_job_manager.get_status(job_id, include_results=include_results)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo {job_id} no encontrado.")
+    return status
+
+@app.delete("/exams/bulk-jobs/{job_id}", tags=["Exams"])
+async def cancel_bulk_exam_job_endpoint(job_id: str):
+    if not await bulk_exam_job_manager.cancel_job(job_id):
+        raise HTTPException(status_code=404, detail=f"Trabajo {job_id} no encontrado o ya terminado.")
+    return {"message": f"Trabajo {job_id} cancelado."}
+
+@app.get("/exams/question-bank/{pdf_id}/", tags=["Exams"])
+async def get_question_bank_stats_endpoint(pdf_id: str):
+    """Cantidad de preguntas del banco por dificultad/idioma y tipo."""
+    return {"pdf_id": pdf_id, "buckets": question_bank.stats(pdf_id)}
+
+@app.post("/exams/question-bank/{pdf_id}/fill", status_code=202, tags=["Exams"])
+async def fill_question_bank_endpoint(pdf_id: str, background_tasks: BackgroundTasks, user_id: str = Query(...)):
+    """Completa en segundo plano el banco de preguntas del PDF (solo genera las que falten)."""
+    if not settings.QUESTION_BANK_ENABLED:
+        raise HTTPException(status_code=409, detail="El banco de preguntas está deshabilitado.")
+    background_tasks.add_task(fill_question_bank_for_pdf, pdf_id, user_id)
+    return {"message": f"Llenado del banco de preguntas para {pdf_id} programado."}
+
 @app.post("/api/v1/exam-generator/create-google-form", response_model=GoogleFormResponse, tags=["Exams"])
 async def create_google_form_endpoint(request: GoogleFormRequest):
     """
@@ -296,7 +423,8 @@ async def create_google_form_endpoint(request: GoogleFormRequest):
         
         # Actualizar el examen con el link del formulario
         exam_ref.update({
-            'google_form_link': form_data['google_form_link']
+            'google_form_link': form_data['google_form_link'],
+            'google_form_id': form_data['form_id'],  # Para sincronizar sus respuestas
         })
         
         return GoogleFormResponse(**form_data)
@@ -311,67 +439,192 @@ async def create_google_form_endpoint(request: GoogleFormRequest):
 async def import_csv_responses_endpoint(
     file: UploadFile = File(...),
     exam_id: str = Form(...),
-    group_id: str = Form(...)
+    group_id: str = Form(...),
+    auto_grade: bool = Form(False),
 ):
     """
     Importa respuestas desde un archivo CSV de Google Forms.
+    Las filas se leen en streaming y se escriben en lotes (WriteBatch) fuera del bucle de eventos.
+    Con `auto_grade` se califican a continuación todos los intentos importados del grupo.
     """
     try:
-        file_content = await file.read()
-        result = import_csv_responses(file_content, exam_id, group_id)
-        return result
+        result = await asyncio.to_thread(import_csv_responses_stream, file.file, exam_id, group_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if auto_grade and result['imported']:
+        try:
+            # Solo los intentos recién importados; las estadísticas del examen se actualizan con su contribución.
+            result['grading'], _ = await asyncio.to_thread(grade_exam_attempts, exam_id, group_id, write=True, only_new=True)
+        except Exception as e:
+            logger.error(f"Error calificando el examen {exam_id} tras la importación: {e}", exc_info=True)
+            result['grading'] = {'error': str(e)}
+    return result
+
+@app.post("/api/v1/exam-responses/grade", tags=["Exams"])
+async def grade_exam_responses_endpoint(request: GradeExamResponsesRequest):
+    """
+    Califica automáticamente (V/F, opción múltiple y completar) los intentos importados de un examen
+    con su clave de respuestas y guarda score/total/feedback en cada intento.
+    """
+    try:
+        summary, _ = await asyncio.to_thread(
+            grade_exam_attempts, request.exam_id, request.group_id,
+            write=request.write, only_new=request.only_new, rebuild_analytics=request.rebuild_analytics,
+        )
+        return summary
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error calificando el examen {request.exam_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error al calificar el examen: {str(e)}")
+
+@app.post("/api/v1/exam-responses/sync-google-form", tags=["Exams"])
+async def sync_google_form_responses_endpoint(request: SyncGoogleFormRequest):
+    """
+    Sincroniza de forma incremental las respuestas del formulario de Google del examen: solo se traen
+    (por páginas) las respuestas nuevas o editadas desde la última sincronización.
+    """
+    try:
+        result = await asyncio.to_thread(sync_form_responses, request.exam_id, request.group_id, request.form_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error sincronizando el formulario del examen {request.exam_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error al sincronizar el formulario de Google: {str(e)}")
+    if request.auto_grade and result['imported']:
+        try:
+            result['grading'], _ = await asyncio.to_thread(grade_exam_attempts, request.exam_id, request.group_id, write=True, only_new=True)
+        except Exception as e:
+            logger.error(f"Error calificando el examen {request.exam_id} tras la sincronización: {e}", exc_info=True)
+            result['grading'] = {'error': str(e)}
+    return result
+
+@app.get("/api/v1/exam-analytics/{exam_id}", tags=["Exams"])
+async def get_exam_analytics_endpoint(exam_id: str, group_id: Optional[str] = None, import_id: Optional[str] = None):
+    """
+    Estadísticas precalculadas del examen (o de un grupo / una importación): dificultad y discriminación
+    por pregunta, frecuencias de cada opción y distribución de puntuaciones. Es una sola lectura.
+    """
+    summary = await asyncio.to_thread(get_exam_analytics, db, exam_id, group_id, import_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="No hay estadísticas para este examen. Califica sus respuestas primero.")
+    return summary
 
 @app.post("/api/v1/activities/generate-word-search")
-async def generate_word_search(pdf_id: str):
+async def generate_word_search(
+    pdf_id: str,
+    size: int = Query(15, ge=5, le=40, description="Lado de la cuadrícula."),
+    seed: Optional[int] = Query(None, description="Semilla para reproducir la misma sopa de letras."),
+    num_variants: int = Query(1, ge=1, le=50, description="Número de variantes con las mismas palabras."),
+    force_new: bool = Query(False, description="Ignora el resultado almacenado y genera uno nuevo."),
+):
     try:
         # Obtener el contenido del PDF desde la base de datos
-        pdf_content = await get_pdf_content_for_exam_generation(pdf_id, user_id="system")
+        pdf_content = await get_pdf_context_for_generation(pdf_id, user_id="system", token_budget=settings.ACTIVITIES_CONTEXT_TOKEN_BUDGET)
         if not pdf_content:
             raise HTTPException(status_code=404, detail="PDF no encontrado")
             
         # Generar la sopa de letras
-        result = await activities_service.generate_word_search(pdf_content)
+        result = await activity_result_store.get_or_create(
+            pdf_id, pdf_content, "word_search",
+            lambda: activities_service.generate_word_search(pdf_content, pdf_id=pdf_id, size=size, seed=seed, num_variants=num_variants),
+            params={"size": size, "num_variants": num_variants}, seed=seed, force_new=force_new,
+        )
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/v1/activities/generate-crossword")
-async def generate_crossword(pdf_id: str):
+async def generate_crossword(
+    pdf_id: str,
+    force_new: bool = Query(False, description="Ignora el resultado almacenado y genera uno nuevo."),
+):
     try:
-        pdf_content = await get_pdf_content_for_exam_generation(pdf_id, user_id="system")
+        pdf_content = await get_pdf_context_for_generation(pdf_id, user_id="system", token_budget=settings.ACTIVITIES_CONTEXT_TOKEN_BUDGET)
         if not pdf_content:
             raise HTTPException(status_code=404, detail="PDF no encontrado")
             
-        result = await activities_service.generate_crossword(pdf_content)
+        result = await activity_result_store.get_or_create(
+            pdf_id, pdf_content, "crossword",
+            lambda: activities_service.generate_crossword(pdf_content, pdf_id=pdf_id),
+            force_new=force_new,
+        )
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/v1/activities/generate-word-connection")
-async def generate_word_connection(pdf_id: str):
+async def generate_word_connection(
+    pdf_id: str,
+    force_new: bool = Query(False, description="Ignora el resultado almacenado y genera uno nuevo."),
+):
     try:
-        pdf_content = await get_pdf_content_for_exam_generation(pdf_id, user_id="system")
+        pdf_content = await get_pdf_context_for_generation(pdf_id, user_id="system", token_budget=settings.ACTIVITIES_CONTEXT_TOKEN_BUDGET)
         if not pdf_content:
             raise HTTPException(status_code=404, detail="PDF no encontrado")
             
-        result = await activities_service.generate_word_connection(pdf_content)
+        result = await activity_result_store.get_or_create(
+            pdf_id, pdf_content, "word_connection",
+            lambda: activities_service.generate_word_connection(pdf_content, pdf_id=pdf_id),
+            force_new=force_new,
+        )
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/v1/activities/generate-pack")
+async def generate_activity_pack(
+    pdf_id: str,
+    size: int = Query(15, ge=5, le=40, description="Lado de la cuadrícula de la sopa de letras."),
+    seed: Optional[int] = Query(None, description="Semilla para reproducir la misma sopa de letras."),
+    force_new: bool = Query(False, description="Ignora el resultado almacenado y genera uno nuevo."),
+):
+    """Sopa de letras, crucigrama y asociación de palabras del mismo PDF con una sola carga del texto y un análisis compartido."""
+    try:
+        pdf_content = await get_pdf_context_for_generation(pdf_id, user_id="system", token_budget=settings.ACTIVITIES_CONTEXT_TOKEN_BUDGET)
+        if not pdf_content:
+            raise HTTPException(status_code=404, detail="PDF no encontrado")
+
+        result = await activity_result_store.get_or_create(
+            pdf_id, pdf_content, "activity_pack",
+            lambda: activities_service.generate_activity_pack(pdf_content, pdf_id=pdf_id, size=size, seed=seed),
+            params={"size": size}, seed=seed, force_new=force_new,
+        )
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 class PdfIdRequest(BaseModel):
     pdfId: str
+    forceNew: bool = False  # Ignora el resultado almacenado y genera uno nuevo
+    hierarchical: Optional[bool] = None  # Map-reduce por secciones; None = automático según la longitud del documento
+
+async def _load_full_text_for_maps(request: PdfIdRequest) -> Optional[str]:
+    if request.hierarchical is False:
+        return None
+    return await get_pdf_content_for_exam_generation(request.pdfId, user_id="system", truncate=False)
 
 @app.post("/api/v1/tools/generate-concept-map")
 async def generate_concept_map(request: PdfIdRequest):
     pdf_id = request.pdfId
     try:
-        pdf_content = await get_pdf_content_for_exam_generation(pdf_id, user_id="system")
+        pdf_content = await get_pdf_context_for_generation(pdf_id, user_id="system", token_budget=settings.ACTIVITIES_CONTEXT_TOKEN_BUDGET)
         if not pdf_content:
             raise HTTPException(status_code=404, detail="PDF no encontrado")
-        result = await tools_service.generate_concept_map(pdf_content)
+
+        async def produce_map():
+            # El texto completo solo se carga si el resultado no está en el almacén.
+            full_text = await _load_full_text_for_maps(request)
+            return await tools_service.generate_concept_map(pdf_content, pdf_id=pdf_id, full_text=full_text, hierarchical=request.hierarchical)
+
+        result = await activity_result_store.get_or_create(
+            pdf_id, pdf_content, "concept_map", produce_map,
+            params={"hierarchical": request.hierarchical}, force_new=request.forceNew,
+        )
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -380,14 +633,51 @@ async def generate_concept_map(request: PdfIdRequest):
 async def generate_mind_map(request: PdfIdRequest):
     pdf_id = request.pdfId
     try:
-        pdf_content = await get_pdf_content_for_exam_generation(pdf_id, user_id="system")
+        pdf_content = await get_pdf_context_for_generation(pdf_id, user_id="system", token_budget=settings.ACTIVITIES_CONTEXT_TOKEN_BUDGET)
         if not pdf_content:
             raise HTTPException(status_code=404, detail="PDF no encontrado")
-        result = await tools_service.generate_mind_map(pdf_content)
+
+        async def produce_map():
+            # El texto completo solo se carga si el resultado no está en el almacén.
+            full_text = await _load_full_text_for_maps(request)
+            return await tools_service.generate_mind_map(pdf_content, pdf_id=pdf_id, full_text=full_text, hierarchical=request.hierarchical)
+
+        result = await activity_result_store.get_or_create(
+            pdf_id, pdf_content, "mind_map", produce_map,
+            params={"hierarchical": request.hierarchical}, force_new=request.forceNew,
+        )
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+class ExpandMindMapNodeRequest(BaseModel):
+    pdfId: str
+    nodeId: str
+    map: Dict[str, Any]  # Mapa mental actual ({"nodes": [...], "edges": [...]})
+    maxChildren: Optional[int] = None
+    forceNew: bool = False
+
+@app.post("/api/v1/tools/expand-mind-map-node")
+async def expand_mind_map_node(request: ExpandMindMapNodeRequest):
+    """Genera solo los hijos de un nodo del mapa mental con los fragmentos del PDF relevantes para su rama."""
+    pdf_id = request.pdfId
+    try:
+        # El texto completo solo se carga como respaldo si la búsqueda vectorial no devuelve fragmentos.
+        async def load_fallback_text() -> Optional[str]:
+            return await get_pdf_content_for_exam_generation(pdf_id, user_id="system", truncate=False)
+
+        map_json = json.dumps(request.map, sort_keys=True, ensure_ascii=False)
+        result = await activity_result_store.get_or_create(
+            pdf_id, map_json, "mind_map_expand",
+            lambda: tools_service.expand_mind_map_node(pdf_id, request.map, request.nodeId, request.maxChildren, load_fallback_text),
+            params={"nodeId": request.nodeId, "maxChildren": request.maxChildren}, force_new=request.forceNew,
+        )
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 if __name__ == "__main__":
     host_to_run = getattr(settings, "HOST", "127.0.0.1")
     port_to_run = int(getattr(settings, "PORT", 8000))
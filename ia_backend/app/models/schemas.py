@@ -136,6 +136,9 @@ class ExamGenerationRequestFrontend(BaseModel):
     language: Language = Field(default=Language.ES) # Usar el Enum
     model_id: Optional[ModelChoice] = Field(default=ModelChoice.GEMINI_1_5_FLASH) # Usar el Enum
     user_id: str 
+    generation_mode: Literal["single", "stream", "parallel"] = Field(default="single", description="'single': una llamada generateContent. 'stream': streamGenerateContent con parser incremental que conserva las preguntas completas si la respuesta se trunca. 'parallel': sub-generaciones concurrentes por tipo de pregunta (o grupos de shard_size).")
+    shard_size: Optional[int] = Field(default=None, ge=1, le=20, description="Solo en modo 'parallel': máximo de preguntas por sub-generación. Si es None se divide solo por tipo de pregunta.")
+    use_question_bank: bool = Field(default=False, description="Opcional. Si es True, el examen se arma con preguntas del banco precalculado del PDF y solo se pide al LLM lo que falte.")
 
     class Config:
         use_enum_values = True
@@ -147,6 +150,9 @@ class GeneratedExamResponse(BaseModel):
     questions: List[QuestionOutput]
     config_used: Optional[QuestionConfigForExam] = None 
     error: Optional[str] = None 
+    is_partial: bool = Field(default=False, description="True si la respuesta del LLM llegó truncada o el examen tiene menos preguntas de las pedidas.")
+    warning: Optional[str] = Field(default=None, description="Aviso no bloqueante, p. ej. cuántas preguntas faltan respecto a las pedidas.")
+    bank_question_count: int = Field(default=0, description="Cuántas de las preguntas se tomaron del banco de preguntas precalculado.")
 
     class Config:
         use_enum_values = True
@@ -223,6 +229,75 @@ class RegenerateQuestionRequest(BaseModel):
             }
         }
 
+class BatchRegenerateQuestionsRequest(BaseModel):
+    pdf_id: str
+    questions_to_regenerate: List[Dict[str, Any]] = Field(..., min_length=1, max_length=20)
+    exam_config: QuestionConfigForExam
+    existing_questions: Optional[List[Dict[str, Any]]] = None
+
+    class Config:
+        use_enum_values = True
+
+class RegeneratedQuestionResult(BaseModel):
+    original_id: str
+    question: Optional[QuestionOutput] = None
+    error: Optional[str] = None
+
+class BatchRegenerateQuestionsResponse(BaseModel):
+    pdf_id: str
+    results: List[RegeneratedQuestionResult]
+
+class ExamVariantsRequest(ExamGenerationRequestFrontend):
+    num_variants: int = Field(default=2, ge=1, le=26, description="Cantidad de versiones del examen a construir a partir de un único conjunto de preguntas.")
+    questions_per_variant: Optional[int] = Field(default=None, ge=1, description="Si se indica, cada versión usa un subconjunto (proporcional por tipo) de este tamaño.")
+    shuffle_options: bool = Field(default=True, description="Baraja las opciones de las preguntas de opción múltiple en cada versión.")
+    seed: Optional[int] = Field(default=None, description="Semilla base; con la misma semilla y el mismo conjunto se obtienen las mismas versiones.")
+
+class ExamVariant(BaseModel):
+    label: str
+    seed: int
+    questions: List[QuestionOutput]
+    # id de pregunta -> índices de las opciones originales en el orden mostrado (solo opción múltiple)
+    option_orders: Dict[str, List[int]] = Field(default_factory=dict)
+
+class GeneratedExamVariantsResponse(BaseModel):
+    pdf_id: str
+    title: str
+    difficulty: DifficultyLevel
+    seed: int
+    question_pool: List[QuestionOutput]
+    variants: List[ExamVariant]
+    config_used: Optional[QuestionConfigForExam] = None
+    error: Optional[str] = None
+    is_partial: bool = False
+
+    class Config:
+        use_enum_values = True
+
+class BulkExamJobRequest(BaseModel):
+    entries: List[ExamGenerationRequestFrontend] = Field(..., min_length=1, max_length=500, description="Un examen por entrada (pdf_id + configuración).")
+    mode: Literal["online", "batch"] = Field(default="online", description="'online': llamadas normales con un pool de workers acotado. 'batch': un lote batchGenerateContent por modelo.")
+
+class BulkExamJobEntryResult(BaseModel):
+    index: int
+    pdf_id: str
+    status: Literal["completed", "failed"]
+    attempts: int = 1
+    exam: Optional[GeneratedExamResponse] = None
+    error: Optional[str] = None
+
+class BulkExamJobStatus(BaseModel):
+    job_id: str
+    mode: Literal["online", "batch"]
+    status: Literal["pending", "running", "completed", "completed_with_errors", "cancelled", "failed"]
+    total: int
+    completed: int = 0
+    failed: int = 0
+    created_at: float
+    updated_at: float
+    error: Optional[str] = None
+    results: Optional[List[BulkExamJobEntryResult]] = None
+
 class GoogleFormRequest(BaseModel):
     exam_id: str
     user_id: str
@@ -232,5 +307,18 @@ class GoogleFormResponse(BaseModel):
     google_form_link: str
     form_id: str
 
+class GradeExamResponsesRequest(BaseModel):
+    exam_id: str
+    group_id: Optional[str] = Field(default=None, description="Si se indica, solo se califican los intentos de ese grupo.")
+    write: bool = Field(default=True, description="Si es False solo se calcula el resumen, sin guardar las calificaciones.")
+    only_new: bool = Field(default=False, description="Solo califica los intentos importados que aún no se han calificado.")
+    rebuild_analytics: bool = Field(default=False, description="Recalifica todos los intentos del examen y recalcula sus estadísticas desde cero.")
+
+class SyncGoogleFormRequest(BaseModel):
+    exam_id: str
+    group_id: str
+    form_id: Optional[str] = Field(default=None, description="Si no se indica, se usa el formulario creado para el examen.")
+    auto_grade: bool = Field(default=False, description="Califica a continuación los intentos nuevos y actualiza las estadísticas.")
+
 class PdfIdRequest(BaseModel):
     pdfId: str = Field(..., description="ID del PDF a procesar")
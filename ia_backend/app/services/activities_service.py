@@ -1,7 +1,12 @@
-from typing import List, Dict, Any
+import asyncio
+import logging
+from typing import List, Dict, Any, Optional
 import google.generativeai as genai
 from ..core.config import settings
-from .llm import call_gemini
+from .llm import call_gemini_with_pdf_context
+from .crossword_engine import generate_crossword_layout
+from .keyword_extractor import keyword_extractor
+from .word_search_engine import normalize_word, generate_word_search as build_word_search_layout, generate_word_search_variants
 
 # NUEVO: Importar la librería de crucigramas
 import random
@@ -10,99 +15,154 @@ try:
 except ImportError:
     Crossword = None  # Para evitar errores si no está instalada
 
+logger = logging.getLogger(__name__)
+
 class ActivitiesService:
     def __init__(self):
         self.model = genai.GenerativeModel('gemini-pro')
         
-    async def generate_word_search(self, pdf_content: str) -> Dict[str, Any]:
-        prompt = f"""
+    async def generate_word_search(
+        self,
+        pdf_content: str,
+        pdf_id: Optional[str] = None,
+        size: int = 15,
+        seed: Optional[int] = None,
+        num_variants: int = 1,
+    ) -> Dict[str, Any]:
+        # La cuadrícula se construye localmente (reproducible con `seed`); al modelo solo se le piden palabras y pistas.
+        words = await self._local_keywords(pdf_id, 10, max_length=size)
+        if words:
+            clue_by_word = await self._generate_word_clues(words, pdf_id, pdf_content)
+            hints = [clue_by_word.get(w, '') for w in words]
+        else:
+            words, hints = await self._llm_word_search_words(pdf_id, pdf_content, size)
+        return await self._assemble_word_search(words, hints, size, seed, num_variants)
+
+    async def _assemble_word_search(
+        self,
+        words: List[str],
+        hints: Optional[List[str]],
+        size: int,
+        seed: Optional[int],
+        num_variants: int = 1,
+    ) -> Dict[str, Any]:
+        if num_variants > 1:
+            if seed is None:
+                # La semilla base se elige aquí para devolverla; cada variante lleva su semilla derivada en `variants`.
+                seed = random.SystemRandom().randrange(2**31)
+            variants = await asyncio.to_thread(generate_word_search_variants, words, num_variants, size, seed)
+            layout = variants[0]
+        else:
+            layout = await asyncio.to_thread(build_word_search_layout, words, size, seed)
+            variants = None
+
+        # Solo se listan las palabras que realmente están en la cuadrícula.
+        placed_originals = {p['original'] for p in layout['placed']}
+        kept = [i for i, w in enumerate(words) if w in placed_originals]
+        result = {
+            'words': [words[i] for i in kept],
+            'grid': layout['grid'],
+            'hints': [hints[i] for i in kept] if hints else [],
+            'seed': layout['seed'] if variants is None else seed,
+            'placed': layout['placed'],
+            'unplaced': layout['unplaced'],
+        }
+        if variants is not None:
+            result['variants'] = variants
+        return result
+
+    async def _llm_word_search_words(self, pdf_id: Optional[str], pdf_content: str, size: int):
+        def build_prompt(prompt_content: str) -> str:
+            return f"""
         Analiza el siguiente contenido y genera una sopa de letras educativa:
         
-        {pdf_content}
+        {prompt_content}
         
         Genera:
-        1. Una lista de 10 palabras clave relevantes del texto
-        2. Una cuadrícula de 15x15 con las palabras ocultas
-        3. Pistas para encontrar cada palabra
+        1. Una lista de 10 palabras clave relevantes del texto (una sola palabra cada una, máximo {size} letras)
+        2. Pistas para encontrar cada palabra, en el mismo orden
         
         Formato de respuesta JSON:
         {{
             "words": ["palabra1", "palabra2", ...],
-            "grid": [["A", "B", ...], ...],
             "hints": ["pista1", "pista2", ...]
         }}
         """
-        response = call_gemini(prompt)
-        # Validar y adaptar la respuesta
+        response = await call_gemini_with_pdf_context(build_prompt, pdf_id, pdf_content)
         words = response.get('words') if isinstance(response, dict) else None
-        grid = response.get('grid') if isinstance(response, dict) else None
         hints = response.get('hints') if isinstance(response, dict) else None
-        # Si no hay grid válido, generarla localmente
-        if not grid or not isinstance(grid, list) or not all(isinstance(row, list) for row in grid):
-            if words and isinstance(words, list) and len(words) > 0:
-                grid = self._generate_word_search_grid(words, size=15)
-            else:
-                words = []
-                grid = [['' for _ in range(15)] for _ in range(15)]
+        if not isinstance(words, list):
+            words = []
+        words = [w for w in words if isinstance(w, str) and w.strip()]
+        hints = hints if isinstance(hints, list) and len(hints) == len(words) else None
+        return words, hints
+
+    async def _local_keywords(self, pdf_id: Optional[str], count: int, max_length: Optional[int] = None) -> List[str]:
+        """Palabras clave del extractor local (TF-IDF); lista vacía si no hay suficientes y hay que pedirlas al LLM."""
+        if not pdf_id or not settings.KEYWORD_EXTRACTOR_ENABLED:
+            return []
+        keywords = await asyncio.to_thread(keyword_extractor.extract, pdf_id, None, count, 4, max_length)
+        return keywords if len(keywords) >= count else []
+        
+    async def generate_crossword(self, pdf_content: str, pdf_id: Optional[str] = None) -> Dict[str, Any]:
+        # 1. Palabras clave: extractor local; si no hay suficientes, se piden al LLM
+        palabras = await self._local_keywords(pdf_id, 10, max_length=settings.CROSSWORD_MAX_SIZE)
+        if not palabras:
+            palabras = await self._llm_crossword_words(pdf_id, pdf_content)
+        # 2. Disposición del crucigrama (cruces válidos, cuadrícula ajustada a las palabras)
+        layout = await self._crossword_layout(palabras)
+
+        # 3. Pistas de todas las palabras en una sola llamada estructurada
+        clue_by_word = await self._generate_word_clues([p['word'] for p in layout['placed']], pdf_id, pdf_content)
+        return self._assemble_crossword(layout, clue_by_word)
+
+    async def _crossword_layout(self, palabras: List[str]) -> Dict[str, Any]:
+        palabras = [p.upper() for p in palabras if len(p) > 2]
+        if len(palabras) < 2:
+            raise Exception('No se encontraron suficientes palabras clave para el crucigrama.')
+        layout = await asyncio.to_thread(generate_crossword_layout, palabras)
+        if len(layout['placed']) < 2:
+            raise Exception('No se pudieron cruzar suficientes palabras clave para el crucigrama.')
+        return layout
+
+    def _assemble_crossword(self, layout: Dict[str, Any], clue_by_word: Dict[str, str]) -> Dict[str, Any]:
+        """`clue_by_word` puede venir indexado por la palabra original o ya normalizada (como en `placed`)."""
+        clue_by_normalized = {normalize_word(w): clue for w, clue in clue_by_word.items()}
+        placed = layout['placed']
+        grid = layout['grid']
+        clues = []
+        for p in placed:
+            clues.append({
+                'number': p['number'],
+                'direction': p['direction'],
+                'clue': clue_by_normalized.get(p['word']) or f"Definición de {p['word'].capitalize()}",
+                'answer': p['word'],
+                'row': p['row'],
+                'col': p['col']
+            })
+
+        # 4. Solución (igual que grid pero sin celdas negras)
+        solution = [[cell if cell != '#' else '' for cell in row] for row in grid]
+
         return {
-            'words': words or [],
             'grid': grid,
-            'hints': hints or []
+            'clues': clues,
+            'solution': solution,
+            'unplaced': layout['unplaced']
         }
-
-    def _generate_word_search_grid(self, words, size=15):
-        import random
-        import string
-        grid = [['' for _ in range(size)] for _ in range(size)]
-        directions = [(0,1), (1,0), (1,1), (-1,1)]  # derecha, abajo, diagonal, diagonal inversa
-        for word in words:
-            placed = False
-            attempts = 0
-            word = word.upper()
-            while not placed and attempts < 100:
-                dir = random.choice(directions)
-                if dir[0] == 0:  # horizontal
-                    row = random.randint(0, size-1)
-                    col = random.randint(0, size-len(word))
-                elif dir[1] == 0:  # vertical
-                    row = random.randint(0, size-len(word))
-                    col = random.randint(0, size-1)
-                else:  # diagonal
-                    row = random.randint(0, size-len(word))
-                    col = random.randint(0, size-len(word))
-                fits = True
-                for i in range(len(word)):
-                    r = row + i*dir[0]
-                    c = col + i*dir[1]
-                    if grid[r][c] not in ('', word[i]):
-                        fits = False
-                        break
-                if fits:
-                    for i in range(len(word)):
-                        r = row + i*dir[0]
-                        c = col + i*dir[1]
-                        grid[r][c] = word[i]
-                    placed = True
-                attempts += 1
-        # Rellenar espacios vacíos
-        for r in range(size):
-            for c in range(size):
-                if grid[r][c] == '':
-                    grid[r][c] = random.choice(string.ascii_uppercase)
-        return grid
         
-    async def generate_crossword(self, pdf_content: str) -> Dict[str, Any]:
-        # 1. Extraer palabras clave del texto (mejorar prompt y parsing)
-        prompt = f"""
+    async def _llm_crossword_words(self, pdf_id: Optional[str], pdf_content: str) -> List[str]:
+        def build_prompt(prompt_content: str) -> str:
+            return f"""
         Extrae 10 palabras clave educativas del siguiente texto.
         Responde ÚNICAMENTE con un JSON de la forma:
         {{
           "words": ["palabra1", "palabra2", ...]
         }}
         Texto:
-        {pdf_content}
+        {prompt_content}
         """
-        palabras_resp = call_gemini(prompt)
+        palabras_resp = await call_gemini_with_pdf_context(build_prompt, pdf_id, pdf_content)
         # Validar y extraer JSON si viene con texto extra
         import json, re
         palabras = []
@@ -121,137 +181,69 @@ class ActivitiesService:
                 palabras = [w.strip() for w in palabras_resp.split(',') if w.strip()]
         if not isinstance(palabras, list):
             palabras = []
-        palabras = [p.upper() for p in palabras if len(p) > 2]
-        if len(palabras) < 2:
-            raise Exception('No se encontraron suficientes palabras clave para el crucigrama.')
-
-        # 2. Generador simple de crucigramas (horizontal y vertical, sin dependencias externas)
-        size = max(10, max(len(w) for w in palabras) + 2)  # tamaño mínimo 10x10
-        grid = [['#' for _ in range(size)] for _ in range(size)]
-        placed = []  # palabras colocadas con info
-        used_numbers = set()
-        number = 1
+        return palabras
 
-        # Colocar la primera palabra horizontal en el centro
-        w0 = palabras[0]
-        row = size // 2
-        col = (size - len(w0)) // 2
-        for i, c in enumerate(w0):
-            grid[row][col + i] = c
-        placed.append({'word': w0, 'row': row, 'col': col, 'direction': 'across', 'number': number})
-        used_numbers.add(number)
-        number += 1
-
-        # Intentar cruzar el resto de palabras
-        for w in palabras[1:]:
-            placed_flag = False
-            for idx, letter in enumerate(w):
-                for p in placed:
-                    for j, pc in enumerate(p['word']):
-                        if letter == pc:
-                            # Intentar colocar vertical si la palabra base es horizontal
-                            if p['direction'] == 'across':
-                                prow = p['row']
-                                pcol = p['col'] + j
-                                start_row = prow - idx
-                                if start_row < 0 or start_row + len(w) > size:
-                                    continue
-                                # Verificar que no haya conflictos
-                                conflict = False
-                                for k, c in enumerate(w):
-                                    r = start_row + k
-                                    if grid[r][pcol] not in ('#', c):
-                                        conflict = True
-                                        break
-                                if conflict:
-                                    continue
-                                # Colocar la palabra vertical
-                                for k, c in enumerate(w):
-                                    grid[start_row + k][pcol] = c
-                                placed.append({'word': w, 'row': start_row, 'col': pcol, 'direction': 'down', 'number': number})
-                                used_numbers.add(number)
-                                number += 1
-                                placed_flag = True
-                                break
-                            # Intentar colocar horizontal si la palabra base es vertical
-                            elif p['direction'] == 'down':
-                                prow = p['row'] + j
-                                pcol = p['col']
-                                start_col = pcol - idx
-                                if start_col < 0 or start_col + len(w) > size:
-                                    continue
-                                conflict = False
-                                for k, c in enumerate(w):
-                                    ccol = start_col + k
-                                    if grid[prow][ccol] not in ('#', c):
-                                        conflict = True
-                                        break
-                                if conflict:
-                                    continue
-                                for k, c in enumerate(w):
-                                    grid[prow][start_col + k] = c
-                                placed.append({'word': w, 'row': prow, 'col': start_col, 'direction': 'across', 'number': number})
-                                used_numbers.add(number)
-                                number += 1
-                                placed_flag = True
-                                break
-                    if placed_flag:
-                        break
-                if placed_flag:
-                    break
-            # Si no se pudo cruzar, intentar colocar horizontal en la siguiente fila vacía
-            if not placed_flag:
-                for r in range(size):
-                    for c in range(size - len(w) + 1):
-                        if all(grid[r][c + k] == '#' for k in range(len(w))):
-                            for k, ch in enumerate(w):
-                                grid[r][c + k] = ch
-                            placed.append({'word': w, 'row': r, 'col': c, 'direction': 'across', 'number': number})
-                            used_numbers.add(number)
-                            number += 1
-                            placed_flag = True
-                            break
-                    if placed_flag:
-                        break
-            # Si tampoco cabe, se omite
+    async def _generate_word_clues(self, words: List[str], pdf_id: Optional[str], pdf_content: str) -> Dict[str, str]:
+        """
+        Pistas para todas las palabras con una sola llamada JSON, indexadas por la palabra recibida. Solo las
+        palabras que falten en la respuesta se piden de nuevo una a una (en paralelo).
+        """
+        word_by_normalized = {normalize_word(w): w for w in words}
+        words_list = "\n".join(f"- {w}" for w in words)
+        def build_prompt(prompt_content: str) -> str:
+            return f"""
+        Eres un experto en educación. Lee el siguiente contexto extraído de un PDF educativo:
+        ---
+        {prompt_content}
+        ---
+        Genera una pista para cada una de estas palabras clave de una actividad educativa:
+        {words_list}
+        Cada pista debe ser una definición o descripción indirecta, educativa, relevante y coherente, basada SOLO en la información del texto. No repitas la palabra en su pista ni uses sinónimos directos. Ejemplo: si la palabra es 'casa', la pista podría ser 'Lugar en donde todos vivimos'.
+        Responde ÚNICAMENTE con un JSON de la forma:
+        {{
+          "clues": [{{"word": "PALABRA", "clue": "pista"}}, ...]
+        }}
+        """
+        response = await call_gemini_with_pdf_context(build_prompt, pdf_id, pdf_content, json_mode=True)
+        clue_by_word: Dict[str, str] = {}
+        entries = response.get('clues') if isinstance(response, dict) else None
+        for entry in entries if isinstance(entries, list) else []:
+            if not isinstance(entry, dict) or not isinstance(entry.get('clue'), str):
+                continue
+            word = word_by_normalized.get(normalize_word(entry.get('word', '')))
+            if word is not None and entry['clue'].strip():
+                clue_by_word[word] = entry['clue'].strip()
 
-        # 3. Generar pistas descriptivas y coherentes usando Gemini
-        clues = []
-        for p in placed:
-            # Prompt mejorado para obtener una pista descriptiva, relevante y coherente
-            clue_prompt = f"""
-            Eres un experto en educación. Lee el siguiente contexto extraído de un PDF educativo:
-            ---
-            {pdf_content}
-            ---
-            Genera una pista para la palabra clave "{p['word']}". La pista debe ser una definición o descripción indirecta, educativa, relevante y coherente, basada SOLO en la información del texto. No repitas la palabra en la pista ni uses sinónimos directos. Ejemplo: si la palabra es 'casa', la pista podría ser 'Lugar en donde todos vivimos'.
-            Responde SOLO con la pista, sin comillas ni texto adicional.
-            """
-            pista = call_gemini(clue_prompt, expect_json=False)
-            if isinstance(pista, dict):
-                pista = list(pista.values())[0] if pista else ''
-            if not isinstance(pista, str):
-                pista = ''
-            clues.append({
-                'number': p['number'],
-                'direction': p['direction'],
-                'clue': pista.strip() or f"Definición de {p['word'].capitalize()}",
-                'answer': p['word'],
-                'row': p['row'],
-                'col': p['col']
-            })
+        missing = [w for w in words if w not in clue_by_word]
+        if missing:
+            logger.warning(f"Actividades: {len(missing)} pista(s) ausentes en la respuesta agrupada, se piden por separado: {missing}")
+            single_clues = await asyncio.gather(*(self._generate_single_clue(w, pdf_id, pdf_content) for w in missing))
+            clue_by_word.update({w: clue for w, clue in zip(missing, single_clues) if clue})
+        return clue_by_word
 
-        # 4. Solución (igual que grid pero sin celdas negras)
-        solution = [[cell if cell != '#' else '' for cell in row] for row in grid]
+    async def _generate_single_clue(self, word: str, pdf_id: Optional[str], pdf_content: str) -> str:
+        def build_prompt(prompt_content: str) -> str:
+            return f"""
+        Eres un experto en educación. Lee el siguiente contexto extraído de un PDF educativo:
+        ---
+        {prompt_content}
+        ---
+        Genera una pista para la palabra clave "{word}". La pista debe ser una definición o descripción indirecta, educativa, relevante y coherente, basada SOLO en la información del texto. No repitas la palabra en la pista ni uses sinónimos directos. Ejemplo: si la palabra es 'casa', la pista podría ser 'Lugar en donde todos vivimos'.
+        Responde SOLO con la pista, sin comillas ni texto adicional.
+        """
+        pista = await call_gemini_with_pdf_context(build_prompt, pdf_id, pdf_content, expect_json=False)
+        if isinstance(pista, dict):
+            pista = '' if 'error' in pista else (list(pista.values())[0] if pista else '')
+        return pista.strip() if isinstance(pista, str) else ''
 
-        return {
-            'grid': grid,
-            'clues': clues,
-            'solution': solution
-        }
-        
-    async def generate_word_connection(self, pdf_content: str) -> Dict[str, Any]:
-        prompt = f"""
+    async def generate_word_connection(self, pdf_content: str, pdf_id: Optional[str] = None) -> Dict[str, Any]:
+        words = await self._local_keywords(pdf_id, 8)
+        if words:
+            # Palabras del extractor local: al modelo solo se le piden las descripciones, en una llamada.
+            clue_by_word = await self._generate_word_clues(words, pdf_id, pdf_content)
+            return self._assemble_word_connection(words, clue_by_word)
+        def build_prompt(prompt_content: str) -> str:
+            return f"""
         Eres un generador de ejercicios educativos. Analiza el siguiente texto y extrae 8 palabras clave relevantes y educativas. Para cada palabra, genera una definición o descripción clara, breve y coherente, como en un ejercicio de asociación de palabras. No repitas la palabra en la definición. Devuelve SOLO un JSON con la siguiente estructura:
         {{
             "pairs": [
@@ -264,10 +256,10 @@ class ActivitiesService:
             ]
         }}
         Texto:
-        {pdf_content}
+        {prompt_content}
         """
         
-        response = call_gemini(prompt)
+        response = await call_gemini_with_pdf_context(build_prompt, pdf_id, pdf_content)
         # Mapeo robusto para asegurar que siempre se devuelva 'pairs' como array
         import json
         pairs = []
@@ -294,4 +286,52 @@ class ActivitiesService:
             })
         return { 'pairs': normalized_pairs }
 
+    def _assemble_word_connection(self, words: List[str], clue_by_word: Dict[str, str]) -> Dict[str, Any]:
+        return {'pairs': [{'word': w, 'concept': w, 'description': clue_by_word.get(w, '')} for w in words]}
+
+    async def generate_activity_pack(
+        self,
+        pdf_content: str,
+        pdf_id: Optional[str] = None,
+        size: int = 15,
+        seed: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Sopa de letras, crucigrama y asociación de palabras del mismo PDF con un único análisis compartido:
+        un conjunto de palabras clave (extractor local o, en su defecto, una llamada al LLM) y una sola
+        llamada para sus definiciones. Las tres actividades se construyen después en paralelo. Si una
+        actividad falla, las demás se devuelven igualmente y el error queda en `errors`.
+        """
+        max_length = min(size, settings.CROSSWORD_MAX_SIZE)
+        words = await self._local_keywords(pdf_id, 12, max_length=max_length)
+        if not words:
+            words = [w for w in await self._llm_crossword_words(pdf_id, pdf_content)
+                     if isinstance(w, str) and 2 < len(normalize_word(w)) <= max_length]
+        if len(words) < 2:
+            raise Exception('No se encontraron suficientes palabras clave para las actividades.')
+        clue_by_word = await self._generate_word_clues(words, pdf_id, pdf_content)
+
+        async def build_crossword() -> Dict[str, Any]:
+            return self._assemble_crossword(await self._crossword_layout(words), clue_by_word)
+
+        async def build_word_connection() -> Dict[str, Any]:
+            return self._assemble_word_connection(words[:8], clue_by_word)
+
+        word_search_words = words[:10]
+        names = ('word_search', 'crossword', 'word_connection')
+        results = await asyncio.gather(
+            self._assemble_word_search(word_search_words, [clue_by_word.get(w, '') for w in word_search_words], size, seed),
+            build_crossword(),
+            build_word_connection(),
+            return_exceptions=True,
+        )
+        pack: Dict[str, Any] = {'keywords': words, 'errors': {}}
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                pack[name] = None
+                pack['errors'][name] = str(result)
+            else:
+                pack[name] = result
+        return pack
+
 activities_service = ActivitiesService() 
\ No newline at end of file
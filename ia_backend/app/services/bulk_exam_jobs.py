@@ -0,0 +1,299 @@
+# ia_backend/app/services/bulk_exam_jobs.py
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.models.schemas import (
+    BulkExamJobEntryResult,
+    BulkExamJobRequest,
+    BulkExamJobStatus,
+    ExamGenerationRequestFrontend as ExamGenerationRequest,
+    GeneratedExamResponse as GeneratedExam,
+)
+from app.services.exam_generator_service import (
+    BatchFailedError,
+    build_exam_from_generate_content_response,
+    generate_exam_questions_service,
+    poll_exam_generation_batch,
+    submit_exam_generation_batch,
+)
+
+logger = logging.getLogger(__name__)
+
+_FINAL_STATUSES = {"completed", "completed_with_errors", "cancelled", "failed"}
+# Errores que no mejoran reintentando (el contenido del PDF no alcanza).
+_NON_RETRYABLE_ERROR_MARKERS = ("demasiado corto",)
+
+
+class AsyncRateLimiter:
+    """Reparte las llamadas al modelo de forma uniforme: como máximo `requests_per_minute` por minuto."""
+
+    def __init__(self, requests_per_minute: int):
+        self.interval = 60.0 / max(1, requests_per_minute)
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, cost: int = 1) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval * max(1, cost)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def _estimated_llm_calls(entry: ExamGenerationRequest) -> int:
+    """Llamadas al modelo que hará la generación de una entrada (el modo 'parallel' hace una por shard)."""
+    if entry.generation_mode != "parallel":
+        return 1
+    counts = [count for count in entry.question_config.values() if count > 0]
+    if entry.shard_size:
+        return max(1, sum(math.ceil(count / entry.shard_size) for count in counts))
+    return max(1, len(counts))
+
+
+class BulkExamJobManager:
+    """
+    Trabajos de generación masiva de exámenes (p. ej. todos los PDFs de un curso).
+
+    Cada trabajo se guarda en `BULK_JOBS_DIR/{job_id}/`: `job.json` con la solicitud y el estado, y un
+    archivo por entrada terminada en `results/{index}.json`. Al reanudar (p. ej. tras reiniciar el servidor)
+    solo se procesan las entradas sin resultado; en modo 'batch' se siguen consultando los lotes ya enviados.
+    """
+
+    def __init__(self, base_dir: Optional[str] = None, max_workers: Optional[int] = None, requests_per_minute: Optional[int] = None):
+        self.base_dir = base_dir or settings.BULK_JOBS_DIR
+        self.max_workers = max(1, max_workers or settings.BULK_JOBS_MAX_WORKERS)
+        self.rate_limiter = AsyncRateLimiter(requests_per_minute or settings.GEMINI_REQUESTS_PER_MINUTE)
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    # --- Persistencia ---
+    def _job_dir(self, job_id: str) -> str:
+        return os.path.join(self.base_dir, job_id)
+
+    def _results_dir(self, job_id: str) -> str:
+        return os.path.join(self._job_dir(job_id), "results")
+
+    @staticmethod
+    def _write_json_atomic(path: str, data: Any) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self._job_dir(job_id), "job.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_job(self, job: Dict[str, Any]) -> None:
+        job["updated_at"] = time.time()
+        self._write_json_atomic(os.path.join(self._job_dir(job["job_id"]), "job.json"), job)
+
+    def _read_results(self, job_id: str) -> Dict[int, BulkExamJobEntryResult]:
+        results: Dict[int, BulkExamJobEntryResult] = {}
+        results_dir = self._results_dir(job_id)
+        if not os.path.isdir(results_dir):
+            return results
+        for file_name in os.listdir(results_dir):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(results_dir, file_name), "r", encoding="utf-8") as f:
+                    result = BulkExamJobEntryResult.model_validate(json.load(f))
+                results[result.index] = result
+            except (OSError, ValueError) as e:
+                logger.warning(f"BulkJobs ({job_id}): Resultado ilegible '{file_name}' ({e}). Se reprocesará la entrada.")
+        return results
+
+    def _write_result(self, job_id: str, result: BulkExamJobEntryResult) -> None:
+        self._write_json_atomic(os.path.join(self._results_dir(job_id), f"{result.index}.json"), result.model_dump(mode="json"))
+
+    def _record_exam(self, job_id: str, index: int, entry: ExamGenerationRequest, exam: GeneratedExam, attempts: int) -> None:
+        if exam.error:
+            result = BulkExamJobEntryResult(index=index, pdf_id=entry.pdf_id, status="failed", attempts=attempts, error=exam.error)
+        else:
+            result = BulkExamJobEntryResult(index=index, pdf_id=entry.pdf_id, status="completed", attempts=attempts, exam=exam)
+        self._write_result(job_id, result)
+
+    def _record_failure(self, job_id: str, index: int, entry: ExamGenerationRequest, error: str, attempts: int = 1) -> None:
+        self._write_result(job_id, BulkExamJobEntryResult(index=index, pdf_id=entry.pdf_id, status="failed", attempts=attempts, error=error))
+
+    # --- API pública ---
+    def create_job(self, request: BulkExamJobRequest) -> BulkExamJobStatus:
+        job_id = uuid.uuid4().hex
+        os.makedirs(self._results_dir(job_id), exist_ok=True)
+        now = time.time()
+        job = {
+            "job_id": job_id,
+            "mode": request.mode,
+            "status": "pending",
+            "created_at": now,
+            "error": None,
+            "batches": {},
+            "request": request.model_dump(mode="json"),
+        }
+        self._write_job(job)
+        self._start(job_id)
+        logger.info(f"BulkJobs ({job_id}): Trabajo creado con {len(request.entries)} exámenes (modo {request.mode}).")
+        return self.get_status(job_id)
+
+    def get_status(self, job_id: str, include_results: bool = False) -> Optional[BulkExamJobStatus]:
+        job = self._read_job(job_id)
+        if job is None:
+            return None
+        results = self._read_results(job_id)
+        return BulkExamJobStatus(
+            job_id=job_id,
+            mode=job["mode"],
+            status=job["status"],
+            total=len(job["request"]["entries"]),
+            completed=sum(1 for r in results.values() if r.status == "completed"),
+            failed=sum(1 for r in results.values() if r.status == "failed"),
+            created_at=job["created_at"],
+            updated_at=job["updated_at"],
+            error=job.get("error"),
+            results=[results[i] for i in sorted(results)] if include_results else None,
+        )
+
+    async def cancel_job(self, job_id: str) -> bool:
+        task = self._tasks.get(job_id)
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            return True
+        job = self._read_job(job_id)
+        if job and job["status"] not in _FINAL_STATUSES:
+            job["status"] = "cancelled"
+            self._write_job(job)
+            return True
+        return False
+
+    def resume_incomplete_jobs(self) -> int:
+        """Reanuda los trabajos que quedaron a medias (llamar al iniciar la aplicación)."""
+        if not os.path.isdir(self.base_dir):
+            return 0
+        resumed = 0
+        for job_id in os.listdir(self.base_dir):
+            try:
+                job = self._read_job(job_id)
+            except (OSError, ValueError) as e:
+                logger.warning(f"BulkJobs ({job_id}): No se pudo leer el trabajo ({e}).")
+                continue
+            if job and job["status"] not in _FINAL_STATUSES and job_id not in self._tasks:
+                self._start(job_id)
+                resumed += 1
+        if resumed:
+            logger.info(f"BulkJobs: {resumed} trabajos reanudados.")
+        return resumed
+
+    # --- Ejecución ---
+    def _start(self, job_id: str) -> None:
+        task = asyncio.create_task(self._run_job(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run_job(self, job_id: str) -> None:
+        job = self._read_job(job_id)
+        request = BulkExamJobRequest.model_validate(job["request"])
+        pending = [i for i in range(len(request.entries)) if i not in self._read_results(job_id)]
+        job["status"] = "running"
+        self._write_job(job)
+        try:
+            if pending and request.mode == "batch":
+                await self._run_batch(job, request.entries, pending)
+            elif pending:
+                await self._run_online(job_id, request.entries, pending)
+            failed = sum(1 for r in self._read_results(job_id).values() if r.status == "failed")
+            job["status"] = "completed_with_errors" if failed else "completed"
+        except asyncio.CancelledError:
+            job["status"] = "cancelled"
+            self._write_job(job)
+            logger.info(f"BulkJobs ({job_id}): Trabajo cancelado.")
+            raise
+        except Exception as e:
+            logger.error(f"BulkJobs ({job_id}): Error inesperado: {e}", exc_info=True)
+            job["status"] = "failed"
+            job["error"] = str(e)
+        self._write_job(job)
+        logger.info(f"BulkJobs ({job_id}): Trabajo terminado con estado '{job['status']}'.")
+
+    async def _run_online(self, job_id: str, entries: List[ExamGenerationRequest], pending: List[int]) -> None:
+        semaphore = asyncio.Semaphore(self.max_workers)
+        max_attempts = max(1, settings.BULK_JOBS_MAX_ATTEMPTS)
+
+        async def run_entry(index: int) -> None:
+            entry = entries[index]
+            async with semaphore:
+                exam: Optional[GeneratedExam] = None
+                attempt = 0
+                for attempt in range(1, max_attempts + 1):
+                    await self.rate_limiter.acquire(_estimated_llm_calls(entry))
+                    exam = await generate_exam_questions_service(entry)
+                    if not exam.error or any(marker in exam.error.lower() for marker in _NON_RETRYABLE_ERROR_MARKERS):
+                        break
+                    logger.warning(f"BulkJobs ({job_id}): Entrada {index} (pdf_id: {entry.pdf_id}) falló en el intento {attempt}: {exam.error}")
+                self._record_exam(job_id, index, entry, exam, attempt)
+
+        await asyncio.gather(*(run_entry(index) for index in pending))
+
+    async def _run_batch(self, job: Dict[str, Any], entries: List[ExamGenerationRequest], pending: List[int]) -> None:
+        job_id = job["job_id"]
+        batches: Dict[str, List[str]] = job.get("batches") or {}
+        submitted_keys = {key for keys in batches.values() for key in keys}
+        to_submit = [index for index in pending if str(index) not in submitted_keys]
+        if to_submit:
+            await self.rate_limiter.acquire()
+            new_batches, failures = await submit_exam_generation_batch([(str(index), entries[index]) for index in to_submit])
+            for key, error in failures.items():
+                self._record_failure(job_id, int(key), entries[int(key)], error)
+            batches.update(new_batches)
+            # Se guarda el nombre de los lotes para que una reanudación los consulte en vez de reenviarlos.
+            job["batches"] = batches
+            self._write_job(job)
+
+        pending_keys = {str(index) for index in pending}
+        remaining = {name: [key for key in keys if key in pending_keys] for name, keys in batches.items()}
+        remaining = {name: keys for name, keys in remaining.items() if keys}
+        deadline = time.monotonic() + settings.GEMINI_BATCH_TIMEOUT_SECONDS
+        while remaining:
+            for batch_name in list(remaining):
+                try:
+                    outcome = await poll_exam_generation_batch(batch_name)
+                except BatchFailedError as e:
+                    logger.error(f"BulkJobs ({job_id}): El lote '{batch_name}' falló: {e}")
+                    for key in remaining.pop(batch_name):
+                        self._record_failure(job_id, int(key), entries[int(key)], f"El lote falló: {e}")
+                    continue
+                except Exception as e:
+                    # Error de red o 5xx al consultar: el lote sigue en curso en el servidor, se vuelve a consultar.
+                    logger.warning(f"BulkJobs ({job_id}): No se pudo consultar el lote '{batch_name}' ({e}). Se reintenta.")
+                    continue
+                if outcome is None:
+                    continue
+                for key in remaining.pop(batch_name):
+                    response_json = outcome.get(key) or {"error": "El lote no devolvió respuesta para este examen."}
+                    exam = build_exam_from_generate_content_response(entries[int(key)], response_json)
+                    self._record_exam(job_id, int(key), entries[int(key)], exam, attempts=1)
+            if not remaining:
+                break
+            if time.monotonic() > deadline:
+                for batch_name, keys in remaining.items():
+                    for key in keys:
+                        self._record_failure(job_id, int(key), entries[int(key)], f"El lote '{batch_name}' no terminó a tiempo.")
+                break
+            await asyncio.sleep(settings.GEMINI_BATCH_POLL_SECONDS)
+
+
+bulk_exam_job_manager = BulkExamJobManager()
@@ -0,0 +1,194 @@
+# ia_backend/app/services/context_selector.py
+import logging
+import re
+import zlib
+from typing import List, Literal, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4  # Aproximación usada para convertir presupuestos de tokens a caracteres.
+_TOKEN_PATTERN = re.compile(r"\w{2,}", re.UNICODE)
+_CHUNK_SEPARATOR = "\n\n[...]\n\n"
+
+
+def split_text_into_chunks(text: str, chunk_size: int) -> List[str]:
+    """Divide el texto en fragmentos sin solapamiento de hasta ~chunk_size caracteres, respetando párrafos y líneas."""
+    chunks: List[str] = []
+    current: List[str] = []
+    current_len = 0
+    for line in text.splitlines(keepends=True):
+        while len(line) > chunk_size:  # líneas gigantes (PDFs sin saltos) se cortan en seco
+            if current:
+                chunks.append("".join(current))
+                current, current_len = [], 0
+            chunks.append(line[:chunk_size])
+            line = line[chunk_size:]
+        if current_len + len(line) > chunk_size and current:
+            chunks.append("".join(current))
+            current, current_len = [], 0
+        current.append(line)
+        current_len += len(line)
+    if current:
+        chunks.append("".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def hashed_tfidf_vectors(texts: Sequence[str], n_features: int = 4096) -> np.ndarray:
+    """
+    Vectores TF-IDF con hashing de términos (crc32), normalizados L2. Sirven como embeddings
+    locales baratos cuando no se dispone de los vectores del índice.
+    """
+    counts = np.zeros((len(texts), n_features), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = _TOKEN_PATTERN.findall(text.lower())
+        if not tokens:
+            continue
+        columns = np.fromiter((zlib.crc32(token.encode("utf-8")) % n_features for token in tokens), dtype=np.int64, count=len(tokens))
+        np.add.at(counts[row], columns, 1.0)
+    tf = np.log1p(counts)
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = np.log((1.0 + len(texts)) / (1.0 + document_frequency)) + 1.0
+    vectors = tf * idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _normalize_rows(embeddings: np.ndarray) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def farthest_point_selection(embeddings: np.ndarray, lengths: np.ndarray, budget_chars: int, initial: Optional[List[int]] = None) -> List[int]:
+    """
+    Selección por muestreo del punto más lejano: empieza por el fragmento más cercano al centroide
+    (o por `initial`) y añade en cada paso el fragmento peor cubierto que aún cabe en el presupuesto.
+    """
+    n = embeddings.shape[0]
+    selected: List[int] = list(initial or [])
+    used = int(lengths[selected].sum()) if selected else 0
+    available = np.ones(n, dtype=bool)
+    available[selected] = False
+
+    if not selected:
+        centroid = embeddings.mean(axis=0)
+        first = int(np.argmax(embeddings @ centroid))
+        if lengths[first] > budget_chars:
+            return []
+        selected.append(first)
+        available[first] = False
+        used += int(lengths[first])
+
+    # Distancia coseno de cada fragmento al fragmento seleccionado más cercano.
+    min_distance = 1.0 - (embeddings @ embeddings[selected].T).max(axis=1)
+    while True:
+        candidates = available & (lengths <= budget_chars - used)
+        if not candidates.any():
+            break
+        scores = np.where(candidates, min_distance, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        used += int(lengths[best])
+        min_distance = np.minimum(min_distance, 1.0 - embeddings @ embeddings[best])
+    return selected
+
+
+def kmeans_selection(embeddings: np.ndarray, lengths: np.ndarray, budget_chars: int, seed: int = 0, iterations: int = 25) -> List[int]:
+    """
+    k-means vectorizado sobre los embeddings con k estimado a partir del presupuesto; toma el
+    fragmento más cercano a cada centroide (priorizando clústeres grandes) y completa el
+    presupuesto restante con muestreo del punto más lejano.
+    """
+    n = embeddings.shape[0]
+    average_length = max(1.0, float(lengths.mean()))
+    k = int(min(n, max(1, budget_chars // average_length)))
+    rng = np.random.default_rng(seed)
+
+    # Inicialización k-means++
+    centroids = np.empty((k, embeddings.shape[1]), dtype=np.float32)
+    centroids[0] = embeddings[rng.integers(n)]
+    closest_sq = np.full(n, np.inf, dtype=np.float32)
+    for c in range(1, k):
+        closest_sq = np.minimum(closest_sq, ((embeddings - centroids[c - 1]) ** 2).sum(axis=1))
+        total = float(closest_sq.sum())
+        probabilities = closest_sq / total if total > 0 else np.full(n, 1.0 / n)
+        centroids[c] = embeddings[rng.choice(n, p=probabilities)]
+
+    assignments = np.zeros(n, dtype=np.int64)
+    for iteration in range(iterations):
+        new_assignments = np.argmax(embeddings @ centroids.T, axis=1)
+        if iteration > 0 and np.array_equal(new_assignments, assignments):
+            break
+        assignments = new_assignments
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, embeddings)
+        cluster_sizes = np.bincount(assignments, minlength=k).astype(np.float32)
+        non_empty = cluster_sizes > 0
+        centroids[non_empty] = sums[non_empty] / cluster_sizes[non_empty, None]
+        centroids = _normalize_rows(centroids)
+
+    cluster_sizes = np.bincount(assignments, minlength=k)
+    similarity_to_own_centroid = np.einsum("ij,ij->i", embeddings, centroids[assignments])
+    selected: List[int] = []
+    used = 0
+    for cluster in np.argsort(-cluster_sizes):
+        if cluster_sizes[cluster] == 0:
+            continue
+        members = np.flatnonzero(assignments == cluster)
+        representative = int(members[np.argmax(similarity_to_own_centroid[members])])
+        if used + lengths[representative] <= budget_chars:
+            selected.append(representative)
+            used += int(lengths[representative])
+    return farthest_point_selection(embeddings, lengths, budget_chars, initial=selected) if selected else farthest_point_selection(embeddings, lengths, budget_chars)
+
+
+def select_representative_chunks(
+    chunks: Sequence[str],
+    token_budget: int,
+    embeddings: Optional[np.ndarray] = None,
+    method: Literal["kmeans", "fps"] = "kmeans",
+) -> List[int]:
+    """Índices (en orden del documento) de un conjunto de fragmentos representativo que cabe en `token_budget`."""
+    if not chunks:
+        return []
+    budget_chars = token_budget * CHARS_PER_TOKEN
+    lengths = np.fromiter((len(chunk) + len(_CHUNK_SEPARATOR) for chunk in chunks), dtype=np.int64, count=len(chunks))
+    if int(lengths.sum()) <= budget_chars:
+        return list(range(len(chunks)))
+    vectors = _normalize_rows(embeddings) if embeddings is not None else hashed_tfidf_vectors(chunks)
+    if method == "fps":
+        selected = farthest_point_selection(vectors, lengths, budget_chars)
+    else:
+        selected = kmeans_selection(vectors, lengths, budget_chars)
+    return sorted(selected)
+
+
+def select_context(
+    text: str,
+    token_budget: int,
+    chunk_size: int,
+    chunks: Optional[List[str]] = None,
+    embeddings: Optional[np.ndarray] = None,
+    method: Literal["kmeans", "fps"] = "kmeans",
+) -> str:
+    """
+    Devuelve un extracto del documento que cabe en `token_budget` y cubre todo el documento en lugar
+    de solo el principio. Si se pasan `chunks` + `embeddings` (p. ej. los vectores de Pinecone) se usan
+    esos; si no, el texto se divide localmente y se vectoriza con TF-IDF con hashing.
+    """
+    if len(text) <= token_budget * CHARS_PER_TOKEN:
+        return text
+    if chunks is None or embeddings is None or len(chunks) != len(embeddings):
+        chunks = split_text_into_chunks(text, chunk_size)
+        embeddings = None
+    selected = select_representative_chunks(chunks, token_budget, embeddings, method)
+    if not selected:
+        logger.warning("ContextSelector: Ningún fragmento cabe en el presupuesto; se usa el inicio del texto.")
+        return text[:token_budget * CHARS_PER_TOKEN]
+    logger.info(f"ContextSelector: {len(selected)}/{len(chunks)} fragmentos seleccionados para un presupuesto de {token_budget} tokens ({method}).")
+    return _CHUNK_SEPARATOR.join(chunks[i].strip() for i in selected)
@@ -0,0 +1,256 @@
+# ia_backend/app/services/crossword_engine.py
+"""
+Motor de disposición de crucigramas.
+
+Cada estado parcial guarda sus celdas en un diccionario disperso (sin tamaño fijo) y un índice
+letra -> posiciones, de modo que los cruces posibles de una palabra nueva se obtienen consultando
+solo las celdas con sus mismas letras. Las disposiciones se exploran con búsqueda en haz (beam search):
+en cada paso se expanden todos los estados con todas las colocaciones válidas de la siguiente palabra
+y se conservan los mejores según palabras colocadas, número de cruces y densidad.
+
+Una colocación es válida solo si no forma palabras espurias: las celdas antes y después de la palabra
+están vacías y las celdas nuevas no tienen vecinos en la dirección perpendicular. La cuadrícula final
+se recorta al rectángulo que ocupan las palabras.
+"""
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from app.core.config import settings
+from app.services.word_search_engine import normalize_word
+
+logger = logging.getLogger(__name__)
+
+BLOCK = "#"
+_INTERSECTION_WEIGHT = 1.0
+_DENSITY_WEIGHT = 4.0
+
+Position = Tuple[int, int]
+
+
+class _Layout:
+    """Estado parcial del crucigrama. Se copia al expandir; las copias comparten lo que no cambia."""
+
+    __slots__ = ("letters", "across_cells", "down_cells", "index", "placements", "skipped",
+                 "intersections", "min_r", "max_r", "min_c", "max_c")
+
+    def __init__(self):
+        self.letters: Dict[Position, str] = {}
+        self.across_cells: Set[Position] = set()
+        self.down_cells: Set[Position] = set()
+        self.index: Dict[str, Tuple[Position, ...]] = {}
+        self.placements: List[Tuple[str, int, int, bool]] = []
+        self.skipped: List[str] = []
+        self.intersections = 0
+        self.min_r = self.min_c = 0
+        self.max_r = self.max_c = -1
+
+    def copy(self) -> "_Layout":
+        clone = _Layout.__new__(_Layout)
+        clone.letters = dict(self.letters)
+        clone.across_cells = set(self.across_cells)
+        clone.down_cells = set(self.down_cells)
+        clone.index = dict(self.index)
+        clone.placements = list(self.placements)
+        clone.skipped = list(self.skipped)
+        clone.intersections = self.intersections
+        clone.min_r, clone.max_r, clone.min_c, clone.max_c = self.min_r, self.max_r, self.min_c, self.max_c
+        return clone
+
+    @property
+    def height(self) -> int:
+        return self.max_r - self.min_r + 1
+
+    @property
+    def width(self) -> int:
+        return self.max_c - self.min_c + 1
+
+    def density(self) -> float:
+        return len(self.letters) / (self.height * self.width) if self.letters else 0.0
+
+    def rank(self) -> Tuple[int, float]:
+        return len(self.placements), _INTERSECTION_WEIGHT * self.intersections + _DENSITY_WEIGHT * self.density()
+
+    def signature(self) -> frozenset:
+        # Dos estados con las mismas palabras en las mismas posiciones relativas son equivalentes.
+        return frozenset((word, r - self.min_r, c - self.min_c, across) for word, r, c, across in self.placements)
+
+    def fits(self, word: str, row: int, col: int, across: bool, max_size: int) -> Optional[int]:
+        """Número de cruces si la palabra cabe en (row, col) sin formar palabras espurias; None si no."""
+        dr, dc = (0, 1) if across else (1, 0)
+        length = len(word)
+        end_r, end_c = row + dr * (length - 1), col + dc * (length - 1)
+        if self.letters:
+            if max(self.max_r, end_r) - min(self.min_r, row) + 1 > max_size:
+                return None
+            if max(self.max_c, end_c) - min(self.min_c, col) + 1 > max_size:
+                return None
+        if (row - dr, col - dc) in self.letters or (end_r + dr, end_c + dc) in self.letters:
+            return None
+        same_direction_cells = self.across_cells if across else self.down_cells
+        crossings = 0
+        for k, char in enumerate(word):
+            position = (row + dr * k, col + dc * k)
+            existing = self.letters.get(position)
+            if existing is not None:
+                if existing != char or position in same_direction_cells:
+                    return None
+                crossings += 1
+            elif (position[0] + dc, position[1] + dr) in self.letters or (position[0] - dc, position[1] - dr) in self.letters:
+                return None
+        return crossings
+
+    def place(self, word: str, row: int, col: int, across: bool, crossings: int) -> None:
+        dr, dc = (0, 1) if across else (1, 0)
+        direction_cells = self.across_cells if across else self.down_cells
+        for k, char in enumerate(word):
+            position = (row + dr * k, col + dc * k)
+            if position not in self.letters:
+                self.letters[position] = char
+                self.index[char] = self.index.get(char, ()) + (position,)
+            direction_cells.add(position)
+        self.placements.append((word, row, col, across))
+        self.intersections += crossings
+        end_r, end_c = row + dr * (len(word) - 1), col + dc * (len(word) - 1)
+        if len(self.placements) == 1:
+            self.min_r, self.min_c, self.max_r, self.max_c = row, col, end_r, end_c
+        else:
+            self.min_r, self.min_c = min(self.min_r, row), min(self.min_c, col)
+            self.max_r, self.max_c = max(self.max_r, end_r), max(self.max_c, end_c)
+
+    def candidate_starts(self, word: str) -> List[Tuple[int, int, bool]]:
+        """Inicios posibles que cruzan alguna letra ya colocada (en la dirección libre de esa celda)."""
+        starts = []
+        seen = set()
+        for offset, char in enumerate(word):
+            for r, c in self.index.get(char, ()):
+                in_across = (r, c) in self.across_cells
+                in_down = (r, c) in self.down_cells
+                if in_across and not in_down:
+                    candidate = (r - offset, c, False)
+                elif in_down and not in_across:
+                    candidate = (r, c - offset, True)
+                else:
+                    continue
+                if candidate not in seen:
+                    seen.add(candidate)
+                    starts.append(candidate)
+        return starts
+
+
+def _expand(layout: _Layout, word: str, max_size: int) -> List[_Layout]:
+    children = []
+    for row, col, across in layout.candidate_starts(word):
+        crossings = layout.fits(word, row, col, across, max_size)
+        if not crossings:
+            continue
+        child = layout.copy()
+        child.place(word, row, col, across, crossings)
+        children.append(child)
+    return children
+
+
+def _best_placement(layout: _Layout, word: str, max_size: int) -> Optional[_Layout]:
+    children = _expand(layout, word, max_size)
+    return max(children, key=_Layout.rank) if children else None
+
+
+def _prune(layouts: List[_Layout], beam_width: int) -> List[_Layout]:
+    layouts.sort(key=_Layout.rank, reverse=True)
+    kept, signatures = [], set()
+    for layout in layouts:
+        signature = layout.signature()
+        if signature in signatures:
+            continue
+        signatures.add(signature)
+        kept.append(layout)
+        if len(kept) == beam_width:
+            break
+    return kept
+
+
+def _number_layout(layout: _Layout) -> Dict[str, Any]:
+    rows, cols = layout.height, layout.width
+    grid = [[BLOCK for _ in range(cols)] for _ in range(rows)]
+    for (r, c), char in layout.letters.items():
+        grid[r - layout.min_r][c - layout.min_c] = char
+    starts = sorted({(r - layout.min_r, c - layout.min_c) for _, r, c, _ in layout.placements})
+    number_by_start = {start: number for number, start in enumerate(starts, start=1)}
+    placed = [
+        {
+            "word": word,
+            "row": r - layout.min_r,
+            "col": c - layout.min_c,
+            "direction": "across" if across else "down",
+            "number": number_by_start[(r - layout.min_r, c - layout.min_c)],
+        }
+        for word, r, c, across in layout.placements
+    ]
+    placed.sort(key=lambda p: (p["number"], p["direction"]))
+    return {"grid": grid, "placed": placed, "rows": rows, "cols": cols}
+
+
+def generate_crossword_layout(
+    words: Sequence[str],
+    beam_width: Optional[int] = None,
+    max_size: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Dispone las palabras en un crucigrama conexo y sin palabras espurias.
+
+    Devuelve `grid` (filas con letras y '#' en las celdas negras, recortada a las palabras), `placed`
+    (palabra, fila, columna, dirección 'across'/'down' y número), `unplaced`, `rows`, `cols`,
+    `intersections` y `density`. Con las mismas palabras el resultado es determinista.
+    """
+    beam_width = beam_width or settings.CROSSWORD_BEAM_WIDTH
+    max_size = max_size or settings.CROSSWORD_MAX_SIZE
+
+    unique_words: List[str] = []
+    unplaced: List[str] = []
+    for word in words:
+        normalized = normalize_word(word)
+        if len(normalized) < 2 or normalized in unique_words:
+            continue
+        if len(normalized) > max_size:
+            unplaced.append(normalized)
+            continue
+        unique_words.append(normalized)
+    if not unique_words:
+        return {"grid": [], "placed": [], "unplaced": unplaced, "rows": 0, "cols": 0, "intersections": 0, "density": 0.0}
+
+    # Las palabras largas primero: ofrecen más letras donde cruzar a las siguientes.
+    ordered = sorted(unique_words, key=len, reverse=True)
+    first = _Layout()
+    first.place(ordered[0], 0, 0, True, 0)
+    beam = [first]
+    for word in ordered[1:]:
+        candidates: List[_Layout] = []
+        for layout in beam:
+            children = _expand(layout, word, max_size)
+            if children:
+                candidates.extend(children)
+            else:
+                skipped = layout.copy()
+                skipped.skipped.append(word)
+                candidates.append(skipped)
+        beam = _prune(candidates, beam_width)
+
+    # Segunda pasada: una palabra omitida puede cruzar ahora con palabras colocadas después de ella.
+    finished = []
+    for layout in beam:
+        for word in list(layout.skipped):
+            improved = _best_placement(layout, word, max_size)
+            if improved is not None:
+                improved.skipped.remove(word)
+                layout = improved
+        finished.append(layout)
+    best = max(finished, key=_Layout.rank)
+
+    result = _number_layout(best)
+    result.update({
+        "unplaced": unplaced + best.skipped,
+        "intersections": best.intersections,
+        "density": round(best.density(), 4),
+    })
+    if result["unplaced"]:
+        logger.info(f"Crossword: {len(result['unplaced'])} palabra(s) sin cruce posible: {result['unplaced']}")
+    return result
@@ -1,49 +1,137 @@
 import csv
 import io
-from typing import List, Dict, Any
+import logging
+import re
+import time
+import uuid
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+
 from firebase_admin import firestore
 
+from app.core.config import settings
+from app.services.firestore_batches import WriteOperation, write_in_batches
+
+logger = logging.getLogger(__name__)
+
+# Columnas que identifican al estudiante, por orden de preferencia (la de Google Forms si se recogen correos).
+STUDENT_ID_COLUMNS = ("student_id", "Dirección de correo electrónico", "Email Address", "Correo electrónico", "Email")
+_LINE_BREAK_PATTERN = re.compile(r"\r\n|\r|\n")
+
+
+def _student_id_column(fieldnames: List[str]) -> Optional[str]:
+    return next((column for column in STUDENT_ID_COLUMNS if column in fieldnames), None)
+
+
+def _record_start_line(reader: csv.DictReader, row: Dict[Any, Any]) -> int:
+    """
+    Línea del archivo donde empieza el registro recién leído. `reader.line_num` es su última línea; las
+    respuestas abiertas de Forms pueden contener saltos de línea entre comillas, que se descuentan.
+    """
+    values = []
+    for value in row.values():
+        values.extend(value if isinstance(value, list) else [value])
+    embedded_breaks = sum(len(_LINE_BREAK_PATTERN.findall(value)) for value in values if isinstance(value, str))
+    return reader.line_num - embedded_breaks
+
+
+def import_csv_responses_stream(
+    stream: BinaryIO,
+    exam_id: str,
+    group_id: str,
+    db=None,
+    batch_size: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Importa un CSV de respuestas (exportación de Google Forms) leyéndolo fila a fila y escribiendo en
+    Firestore con WriteBatch de hasta 500 filas. Como máximo `max_concurrency` lotes se confirman a la
+    vez, así que la memoria usada no depende del tamaño del archivo.
+
+    Args:
+        stream: Archivo binario en UTF-8 (con o sin BOM), p. ej. `UploadFile.file`.
+        exam_id: ID del examen.
+        group_id: ID del grupo.
+
+    Returns:
+        Dict con las filas importadas, los errores por fila (línea del archivo donde empieza el registro, cabecera = 1) y el rendimiento.
+    """
+    db = db or firestore.client()
+    started = time.perf_counter()
+    # Identifica esta importación en los intentos y en su resumen de estadísticas (exams/{exam_id}/analytics/import_{id}).
+    import_id = uuid.uuid4().hex[:12]
+    text_stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.DictReader(text_stream)
+        if not reader.fieldnames:
+            raise ValueError("El archivo CSV está vacío o no tiene cabecera")
+        student_column = _student_id_column(reader.fieldnames)
+        row_errors: List[Dict[str, Any]] = []
+        total_rows = 0
+
+        def operations() -> Iterator[WriteOperation]:
+            nonlocal total_rows
+            for row in reader:
+                row_number = _record_start_line(reader, row)
+                total_rows += 1
+                if None in row:
+                    row_errors.append({"row": row_number, "error": "La fila tiene más columnas que la cabecera"})
+                    continue
+                student_id = (row.get(student_column) or "").strip() if student_column else ""
+                answers = {k: v for k, v in row.items() if k != student_column}
+                # Sin identificador de estudiante se usa un id automático, como en la importación original.
+                user_ref = db.collection('usuarios').document(student_id) if student_id else db.collection('usuarios').document()
+                attempt_ref = user_ref.collection('examAttempts').document(exam_id)
+                yield row_number, attempt_ref, {
+                    'exam_id': exam_id,
+                    'group_id': group_id,
+                    'answers': answers,
+                    'imported_from_csv': True,
+                    'imported_at': firestore.SERVER_TIMESTAMP,
+                    'import_id': import_id,
+                    'auto_graded': False,  # Respuestas nuevas: pendientes de (re)calificar
+                }
+
+        outcome = write_in_batches(
+            db, operations(),
+            batch_size=batch_size or settings.CSV_IMPORT_BATCH_SIZE,
+            max_concurrency=max_concurrency or settings.CSV_IMPORT_MAX_CONCURRENCY,
+        )
+    finally:
+        # Libera el archivo original sin cerrarlo (el llamador es su dueño).
+        text_stream.detach()
+
+    # Un WriteBatch es atómico: si falla, ninguna de sus filas quedó escrita.
+    row_errors.extend({"row": row_number, "error": f"Error al guardar el lote: {error}"} for row_number, error in outcome["failed"])
+    row_errors.sort(key=lambda item: item["row"])
+    imported = outcome["written"]
+    elapsed = time.perf_counter() - started
+    result = {
+        'import_id': import_id,
+        'imported': imported,
+        'errors': [f"Error en la línea {item['row']}: {item['error']}" for item in row_errors],
+        'row_errors': row_errors,
+        'total_rows': total_rows,
+        'batches': outcome["batches"],
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_per_second': round(imported / elapsed, 1) if elapsed > 0 else float(imported),
+    }
+    logger.info(
+        f"CSV import (exam {exam_id}, grupo {group_id}): {imported}/{total_rows} filas en {outcome['batches']} lote(s), "
+        f"{result['elapsed_seconds']}s ({result['rows_per_second']} filas/s), {len(row_errors)} error(es)."
+    )
+    return result
+
+
 def import_csv_responses(file_content: bytes, exam_id: str, group_id: str) -> Dict[str, Any]:
     """
     Procesa el archivo CSV y guarda las respuestas en Firestore.
-    
+
     Args:
         file_content: Contenido del archivo CSV en bytes.
         exam_id: ID del examen.
         group_id: ID del grupo.
-    
+
     Returns:
         Dict con el resultado de la importación.
     """
-    db = firestore.client()
-    
-    # Leer el CSV
-    csv_file = io.StringIO(file_content.decode('utf-8'))
-    reader = csv.DictReader(csv_file)
-    
-    imported = 0
-    errors = []
-    
-    for row in reader:
-        try:
-            # Extraer datos del CSV (ajustar según el formato de Google Forms)
-            student_id = row.get('student_id')  # Ajustar al campo correcto
-            answers = {k: v for k, v in row.items() if k != 'student_id'}
-            
-            # Guardar en Firestore
-            attempt_ref = db.collection('usuarios').document(student_id).collection('examAttempts').document(exam_id)
-            attempt_ref.set({
-                'exam_id': exam_id,
-                'group_id': group_id,
-                'answers': answers,
-                'imported_from_csv': True
-            }, merge=True)
-            
-            imported += 1
-        except Exception as e:
-            errors.append(f"Error en fila {imported + 1}: {str(e)}")
-    
-    return {
-        'imported': imported,
-        'errors': errors
-    } 
\ No newline at end of file
+    return import_csv_responses_stream(io.BytesIO(file_content), exam_id, group_id)
@@ -0,0 +1,300 @@
+# ia_backend/app/services/exam_analytics.py
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from firebase_admin import firestore
+
+from app.services.firestore_batches import write_in_batches
+
+logger = logging.getLogger(__name__)
+
+_STATS_FORMAT_VERSION = 1
+HISTOGRAM_BINS = 10  # Distribución de porcentajes en tramos de 10 puntos (0-10, ..., 90-100).
+ALL_ATTEMPTS_DOC = "all"
+
+
+def analytics_doc_ids(group_id: Optional[str], import_id: Optional[str]) -> List[str]:
+    """Documentos de resumen en los que cuenta un intento: el del examen, el de su grupo y el de su importación."""
+    doc_ids = [ALL_ATTEMPTS_DOC]
+    if group_id:
+        doc_ids.append(f"group_{group_id}")
+    if import_id:
+        doc_ids.append(f"import_{import_id}")
+    return doc_ids
+
+
+class ItemStatistics:
+    """
+    Estadísticos suficientes (sumas que se pueden sumar y restar) de un conjunto de intentos de un examen:
+    créditos por pregunta y sus productos con la puntuación total, frecuencias de cada opción elegida e
+    histograma de porcentajes. Dos resúmenes se combinan sumando sus arrays, así que un resumen se actualiza
+    con solo los intentos nuevos (y restando la contribución anterior de los que se recalifican).
+    """
+
+    def __init__(self, num_questions: int, choice_columns: int):
+        self.num_questions = num_questions
+        self.choice_columns = choice_columns  # opciones + 1 columna final para "en blanco / no reconocida"
+        self.attempts = 0
+        self.sum_score = 0.0
+        self.sum_score2 = 0.0
+        self.sum_percentage = 0.0
+        self.answered = np.zeros(num_questions)
+        self.sum_x = np.zeros(num_questions)
+        self.sum_x2 = np.zeros(num_questions)
+        self.sum_xy = np.zeros(num_questions)
+        self.sum_y = np.zeros(num_questions)
+        self.sum_y2 = np.zeros(num_questions)
+        self.choice_counts = np.zeros((num_questions, choice_columns))
+        self.histogram = np.zeros(HISTOGRAM_BINS)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        credits: np.ndarray,
+        choices: np.ndarray,
+        scores: np.ndarray,
+        percentages: np.ndarray,
+        choice_columns: int,
+    ) -> "ItemStatistics":
+        """Estadísticos de una cohorte: `credits` (intentos x preguntas, NaN = no calificada), `choices` (-1 = ninguna)."""
+        stats = cls(credits.shape[1], choice_columns)
+        if credits.shape[0] == 0:
+            return stats
+        valid = ~np.isnan(credits)
+        x = np.where(valid, credits, 0.0)
+        y = scores[:, None]
+        stats.attempts = int(credits.shape[0])
+        stats.sum_score = float(scores.sum())
+        stats.sum_score2 = float((scores ** 2).sum())
+        stats.sum_percentage = float(percentages.sum())
+        stats.answered = valid.sum(axis=0).astype(float)
+        stats.sum_x = x.sum(axis=0)
+        stats.sum_x2 = (x ** 2).sum(axis=0)
+        stats.sum_xy = (x * y).sum(axis=0)
+        stats.sum_y = (valid * y).sum(axis=0)
+        stats.sum_y2 = (valid * y ** 2).sum(axis=0)
+        # Frecuencias de opción: un único np.add.at sobre índices planos (pregunta, opción).
+        columns = np.where((choices >= 0) & (choices < choice_columns - 1), choices, choice_columns - 1)
+        flat = (np.arange(credits.shape[1])[None, :] * choice_columns + columns).ravel()
+        counts = np.zeros(credits.shape[1] * choice_columns)
+        np.add.at(counts, flat, 1.0)
+        stats.choice_counts = counts.reshape(credits.shape[1], choice_columns)
+        stats.histogram = np.histogram(np.clip(percentages, 0, 100), bins=HISTOGRAM_BINS, range=(0, 100))[0].astype(float)
+        return stats
+
+    def add(self, other: "ItemStatistics", sign: float = 1.0) -> None:
+        if (other.num_questions, other.choice_columns) != (self.num_questions, self.choice_columns):
+            raise ValueError("Los estadísticos corresponden a claves de examen distintas")
+        self.attempts += int(sign * other.attempts)
+        self.sum_score += sign * other.sum_score
+        self.sum_score2 += sign * other.sum_score2
+        self.sum_percentage += sign * other.sum_percentage
+        for name in ("answered", "sum_x", "sum_x2", "sum_xy", "sum_y", "sum_y2", "choice_counts", "histogram"):
+            setattr(self, name, getattr(self, name) + sign * getattr(other, name))
+
+    def to_document(self) -> Dict[str, Any]:
+        def as_list(array: np.ndarray) -> List:
+            return np.round(array, 6).tolist()
+        return {
+            "v": _STATS_FORMAT_VERSION,
+            "num_questions": self.num_questions,
+            "choice_columns": self.choice_columns,
+            "attempts": self.attempts,
+            "sum_score": self.sum_score,
+            "sum_score2": self.sum_score2,
+            "sum_percentage": self.sum_percentage,
+            "answered": as_list(self.answered),
+            "sum_x": as_list(self.sum_x),
+            "sum_x2": as_list(self.sum_x2),
+            "sum_xy": as_list(self.sum_xy),
+            "sum_y": as_list(self.sum_y),
+            "sum_y2": as_list(self.sum_y2),
+            # Firestore no admite arrays anidados: matriz aplanada por filas.
+            "choice_counts": as_list(self.choice_counts.ravel()),
+            "histogram": as_list(self.histogram),
+        }
+
+    @classmethod
+    def from_document(cls, data: Dict[str, Any]) -> Optional["ItemStatistics"]:
+        if not data or data.get("v") != _STATS_FORMAT_VERSION:
+            return None
+        stats = cls(int(data["num_questions"]), int(data["choice_columns"]))
+        stats.attempts = int(data["attempts"])
+        stats.sum_score = float(data["sum_score"])
+        stats.sum_score2 = float(data["sum_score2"])
+        stats.sum_percentage = float(data["sum_percentage"])
+        for name in ("answered", "sum_x", "sum_x2", "sum_xy", "sum_y", "sum_y2", "histogram"):
+            setattr(stats, name, np.asarray(data[name], dtype=float))
+        stats.choice_counts = np.asarray(data["choice_counts"], dtype=float).reshape(stats.num_questions, stats.choice_columns)
+        return stats
+
+    def summary(self, question_meta: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Indicadores derivados: dificultad (proporción de crédito obtenido), discriminación (correlación
+        ítem-resto: crédito de la pregunta frente a la puntuación sin ella), frecuencias de cada opción y
+        distribución de porcentajes. `question_meta`: [{"id", "type", "options"}] en el orden de la clave.
+        """
+        n = self.answered
+        with np.errstate(divide="ignore", invalid="ignore"):
+            difficulty = np.where(n > 0, self.sum_x / n, np.nan)
+            # Puntuación "resto" r = y - x, para que la pregunta no se correlacione consigo misma.
+            sum_r = self.sum_y - self.sum_x
+            sum_r2 = self.sum_y2 - 2 * self.sum_xy + self.sum_x2
+            sum_xr = self.sum_xy - self.sum_x2
+            covariance = n * sum_xr - self.sum_x * sum_r
+            variance_x = n * self.sum_x2 - self.sum_x ** 2
+            variance_r = n * sum_r2 - sum_r ** 2
+            denominator = np.sqrt(np.clip(variance_x, 0, None) * np.clip(variance_r, 0, None))
+            discrimination = np.where(denominator > 1e-9, covariance / denominator, np.nan)
+
+        questions = []
+        for j, meta in enumerate(question_meta):
+            item: Dict[str, Any] = {
+                "question": j + 1,
+                "id": meta.get("id"),
+                "type": meta.get("type"),
+                "answered": int(n[j]),
+                "difficulty": None if np.isnan(difficulty[j]) else round(float(difficulty[j]), 4),
+                "discrimination": None if np.isnan(discrimination[j]) else round(float(discrimination[j]), 4),
+            }
+            options = meta.get("options") or []
+            if options:
+                counts = self.choice_counts[j]
+                item["distractors"] = [{"option": option, "count": int(counts[k])} for k, option in enumerate(options)]
+                item["blank_or_other"] = int(counts[-1])
+            questions.append(item)
+
+        attempts = max(self.attempts, 0)
+        mean_score = self.sum_score / attempts if attempts else 0.0
+        variance = self.sum_score2 / attempts - mean_score ** 2 if attempts else 0.0
+        cumulative = np.cumsum(self.histogram)
+        median_bin = int(np.searchsorted(cumulative, attempts / 2)) if attempts else 0
+        return {
+            "attempts": attempts,
+            "mean_score": round(mean_score, 4),
+            "std_score": round(float(np.sqrt(max(variance, 0.0))), 4),
+            "mean_percentage": round(self.sum_percentage / attempts, 2) if attempts else 0.0,
+            "score_distribution": {
+                "bin_width": 100 // HISTOGRAM_BINS,
+                "counts": [int(c) for c in self.histogram],
+                "median_bin": median_bin,
+            },
+            "questions": questions,
+        }
+
+
+def _question_meta(key) -> List[Dict[str, Any]]:
+    return [
+        {"id": q.id, "type": q.type, "options": ["Verdadero", "Falso"] if q.type == "V_F" else q.options if q.type == "MC" else []}
+        for q in key.questions
+    ]
+
+
+def choice_columns_for(key) -> int:
+    return max([2] + [len(q.options) for q in key.questions if q.type == "MC"]) + 1
+
+
+def _analytics_collection(db, exam_id: str):
+    return db.collection('exams').document(exam_id).collection('analytics')
+
+
+def _stats_by_doc(credits, choices, scores, percentages, doc_ids_per_row: Sequence[Sequence[str]], choice_columns: int) -> Dict[str, ItemStatistics]:
+    """Un ItemStatistics por documento de resumen, con las filas (intentos) que cuentan en él."""
+    rows_by_doc: Dict[str, List[int]] = {}
+    for row, doc_ids in enumerate(doc_ids_per_row):
+        for doc_id in doc_ids:
+            rows_by_doc.setdefault(doc_id, []).append(row)
+    return {
+        doc_id: ItemStatistics.from_arrays(credits[rows], choices[rows], scores[rows], percentages[rows], choice_columns)
+        for doc_id, rows in rows_by_doc.items()
+    }
+
+
+def previous_contributions(key, attempts_data: Sequence[Dict[str, Any]], choice_columns: int) -> Dict[str, ItemStatistics]:
+    """Contribución con la que cada intento ya recalificado cuenta en los resúmenes (guardada en el propio intento)."""
+    num_questions = len(key.questions)
+    rows, doc_ids_per_row = [], []
+    for data in attempts_data:
+        credits = data.get("graded_credits")
+        if not data.get("analytics_docs") or not isinstance(credits, list) or len(credits) != num_questions:
+            continue
+        rows.append(data)
+        doc_ids_per_row.append(data["analytics_docs"])
+    if not rows:
+        return {}
+    credits = np.array([[np.nan if c is None else c for c in data["graded_credits"]] for data in rows], dtype=float)
+    choices = np.array([data.get("graded_choices") or [-1] * num_questions for data in rows], dtype=np.int16)
+    scores = np.array([float(data.get("score") or 0.0) for data in rows])
+    percentages = np.array([float(data.get("percentage") or 0.0) for data in rows])
+    return _stats_by_doc(credits, choices, scores, percentages, doc_ids_per_row, choice_columns)
+
+
+def update_exam_analytics(
+    db,
+    grades,
+    attempts_data: Sequence[Dict[str, Any]],
+    doc_ids_per_row: Sequence[Sequence[str]],
+    rebuild: bool = False,
+) -> Dict[str, int]:
+    """
+    Actualiza los resúmenes `exams/{exam_id}/analytics/{all|group_x|import_y}` con una cohorte recién
+    calificada: suma su contribución y resta la que tenían antes los intentos recalificados, dentro de una
+    transacción por documento. Con `rebuild`, `grades` debe cubrir todos los intentos del examen y los
+    resúmenes se reescriben desde cero.
+
+    Returns:
+        {doc_id: intentos del resumen tras la actualización}.
+    """
+    key = grades.key
+    choice_columns = choice_columns_for(key)
+    meta = _question_meta(key)
+    collection = _analytics_collection(db, key.exam_id)
+    new_stats = _stats_by_doc(grades.credits, grades.choices, grades.scores, grades.percentages, doc_ids_per_row, choice_columns)
+
+    if rebuild:
+        def documents():
+            for doc_id, stats in new_stats.items():
+                yield doc_id, collection.document(doc_id), {
+                    "stats": stats.to_document(), "summary": stats.summary(meta), "updated_at": firestore.SERVER_TIMESTAMP,
+                }
+        stale = [snapshot.reference for snapshot in collection.stream() if snapshot.id not in new_stats]
+        for doc_ref in stale:
+            doc_ref.delete()
+        write_in_batches(db, documents(), merge=False)
+        return {doc_id: stats.attempts for doc_id, stats in new_stats.items()}
+
+    old_stats = previous_contributions(key, attempts_data, choice_columns)
+    result: Dict[str, int] = {}
+    for doc_id in sorted(set(new_stats) | set(old_stats)):
+        doc_ref = collection.document(doc_id)
+
+        @firestore.transactional
+        def apply_delta(transaction, doc_ref=doc_ref, doc_id=doc_id) -> int:
+            snapshot = doc_ref.get(transaction=transaction)
+            stored = ItemStatistics.from_document((snapshot.to_dict() or {}).get("stats")) if snapshot.exists else None
+            if stored is None or (stored.num_questions, stored.choice_columns) != (len(key.questions), choice_columns):
+                if stored is not None:
+                    logger.warning(f"Analytics ({key.exam_id}/{doc_id}): la clave del examen cambió; el resumen se reinicia.")
+                stored = ItemStatistics(len(key.questions), choice_columns)
+            elif doc_id in old_stats:
+                stored.add(old_stats[doc_id], sign=-1.0)
+            if doc_id in new_stats:
+                stored.add(new_stats[doc_id])
+            transaction.set(doc_ref, {
+                "stats": stored.to_document(), "summary": stored.summary(meta), "updated_at": firestore.SERVER_TIMESTAMP,
+            })
+            return stored.attempts
+
+        result[doc_id] = apply_delta(db.transaction())
+    logger.info(f"Analytics ({key.exam_id}): resúmenes actualizados {result}.")
+    return result
+
+
+def get_exam_analytics(db, exam_id: str, group_id: Optional[str] = None, import_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Resumen precalculado (una sola lectura) del examen, de un grupo o de una importación."""
+    doc_id = f"import_{import_id}" if import_id else f"group_{group_id}" if group_id else ALL_ATTEMPTS_DOC
+    snapshot = _analytics_collection(db, exam_id).document(doc_id).get()
+    if not snapshot.exists:
+        return None
+    return (snapshot.to_dict() or {}).get("summary")
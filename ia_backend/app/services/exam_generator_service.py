@@ -1,12 +1,16 @@
 # ia_backend/app/services/exam_generator_service.py
+import asyncio
 import logging
 import uuid
 import json
 import httpx 
 import os
-from typing import List, Dict, Optional, Union, Literal, Any
+from typing import List, Dict, Optional, Union, Literal, Any, AsyncIterator, Sequence, Tuple
 import re
+import random
+from collections import OrderedDict
 
+import numpy as np
 from pydantic import ValidationError, BaseModel
 
 # Importaciones actualizadas desde tus schemas
@@ -19,6 +23,11 @@ from app.models.schemas import (
     LLMGeneratedOpenQuestion,
     LLMGeneratedFillInTheBlank, # <--- AÑADIDO
     RegenerateQuestionRequest,
+    BatchRegenerateQuestionsRequest,
+    BatchRegenerateQuestionsResponse,
+    RegeneratedQuestionResult,
+    ExamVariantsRequest,
+    GeneratedExamVariantsResponse,
     QuestionConfigForExam,
     QuestionOutput,
     TrueFalseQuestionOutput,
@@ -29,7 +38,26 @@ from app.models.schemas import (
     QuestionType # Importar el Enum QuestionType
 )
 from app.core.config import settings
-from app.services.rag_chain import get_vector_store_for_pdf_retrieval 
+from app.services.rag_chain import get_vector_store_for_pdf_retrieval, fetch_chunk_embeddings
+from app.services.json_stream_parser import IncrementalQuestionParser
+from app.services.gemini_context_cache import context_cache_manager, compute_text_hash, is_stale_cache_response
+from app.services.pdf_content_cache import pdf_content_cache, register_pdf_invalidation_listener
+from app.services.context_selector import select_context, split_text_into_chunks, CHARS_PER_TOKEN
+from app.services.question_bank import question_bank
+from app.services.exam_prompt_registry import (
+    SINGLE_QUESTION_MODELS,
+    get_full_exam_response_schema,
+    get_single_question_template,
+    parse_generate_content_bytes,
+    render_full_exam_prompt
+)
+from app.services.exam_variants import build_exam_variants
+from app.services.question_similarity import (
+    QuestionSimilarityIndex,
+    filter_near_duplicates,
+    normalize_question_text as _normalize_question_text,
+    select_similar_negatives
+)
 
 logger = logging.getLogger(__name__)
 
@@ -37,7 +65,7 @@ class PdfIdRequest(BaseModel):
     pdfId: str
 
 # --- Función existente para obtener contenido del PDF ---
-async def get_pdf_content_for_exam_generation(pdf_id: str, user_id: str, sample_text_from_pdf: Optional[str] = None) -> str:
+async def get_pdf_content_for_exam_generation(pdf_id: str, user_id: str, sample_text_from_pdf: Optional[str] = None, truncate: bool = True) -> str:
     if sample_text_from_pdf:
         logger.info(f"ExamGen (pdf_id: {pdf_id}, user: {user_id}): Using provided sample_text_from_pdf.")
         return sample_text_from_pdf
@@ -48,12 +76,12 @@ async def get_pdf_content_for_exam_generation(pdf_id: str, user_id: str, sample_
     if os.path.exists(txt_file_path):
         logger.info(f"ExamGen (pdf_id: {pdf_id}, user: {user_id}): Found full text file at {txt_file_path}.")
         try:
-            with open(txt_file_path, "r", encoding="utf-8") as f:
-                full_text = f.read()
+            # La caché solo relee el archivo si cambió su mtime o tamaño.
+            full_text = pdf_content_cache.get_file_text(pdf_id, txt_file_path) or ""
             if full_text.strip():
                 logger.info(f"ExamGen (pdf_id: {pdf_id}, user: {user_id}): Loaded full text from file, length: {len(full_text)}.")
                 max_text_for_llm_from_file = settings.EXAM_GEN_MAX_TEXT_FROM_FILE
-                if len(full_text) > max_text_for_llm_from_file:
+                if truncate and len(full_text) > max_text_for_llm_from_file:
                     logger.warning(f"ExamGen (pdf_id: {pdf_id}, user: {user_id}): Full text from file is too long ({len(full_text)} chars), truncating to {max_text_for_llm_from_file} chars.")
                     return full_text[:max_text_for_llm_from_file]
                 return full_text
@@ -62,6 +90,11 @@ async def get_pdf_content_for_exam_generation(pdf_id: str, user_id: str, sample_
         except Exception as e:
             logger.error(f"ExamGen (pdf_id: {pdf_id}, user: {user_id}): Error reading full text file {txt_file_path}: {e}", exc_info=True)
 
+    cached_fallback_text = pdf_content_cache.get_fallback_text(pdf_id)
+    if cached_fallback_text:
+        logger.info(f"ExamGen (pdf_id: {pdf_id}, user: {user_id}): Using cached Pinecone content, length: {len(cached_fallback_text)}.")
+        return cached_fallback_text
+
     logger.info(f"ExamGen (pdf_id: {pdf_id}, user: {user_id}): Full text file not found or empty. Attempting to retrieve from Pinecone.")
     vector_store = get_vector_store_for_pdf_retrieval(pdf_id) 
     if not vector_store:
@@ -83,7 +116,8 @@ async def get_pdf_content_for_exam_generation(pdf_id: str, user_id: str, sample_
             max_text_for_llm_from_pinecone = settings.EXAM_GEN_MAX_TEXT_FROM_PINECONE
             if len(concatenated_text) > max_text_for_llm_from_pinecone:
                 logger.warning(f"ExamGen (pdf_id: {pdf_id}, user: {user_id}): Concatenated text from Pinecone is too long ({len(concatenated_text)} chars), truncating to {max_text_for_llm_from_pinecone} chars.")
-                return concatenated_text[:max_text_for_llm_from_pinecone]
+                concatenated_text = concatenated_text[:max_text_for_llm_from_pinecone]
+            pdf_content_cache.put_fallback_text(pdf_id, concatenated_text)
             return concatenated_text
         else:
             logger.warning(f"ExamGen (pdf_id: {pdf_id}, user: {user_id}): No sample chunks retrieved from Pinecone.")
@@ -92,6 +126,136 @@ async def get_pdf_content_for_exam_generation(pdf_id: str, user_id: str, sample_
         logger.error(f"ExamGen (pdf_id: {pdf_id}, user: {user_id}): Error retrieving content from Pinecone: {e}", exc_info=True)
         return "Ocurrió un error al acceder al contenido del PDF para la generación del examen."
 
+# --- Selección de contexto por cobertura del documento ---
+# (pdf_id, hash del texto, presupuesto) -> extracto seleccionado. Se invalida junto con el texto del PDF.
+_selected_context_cache: "OrderedDict[Tuple[str, str, int], str]" = OrderedDict()
+_SELECTED_CONTEXT_CACHE_MAX_ENTRIES = 256
+
+def _drop_selected_contexts(pdf_id: str) -> None:
+    for key in [key for key in _selected_context_cache if key[0] == pdf_id]:
+        _selected_context_cache.pop(key, None)
+
+register_pdf_invalidation_listener(_drop_selected_contexts)
+
+async def get_pdf_context_for_generation(
+    pdf_id: str,
+    user_id: str,
+    token_budget: Optional[int] = None,
+    sample_text_from_pdf: Optional[str] = None
+) -> str:
+    """
+    Devuelve el contexto del PDF para los generadores (exámenes, actividades, herramientas).
+    En lugar de truncar por el inicio, agrupa los fragmentos del documento (con los vectores del
+    índice si están disponibles) y elige un conjunto representativo que cabe en `token_budget`.
+    """
+    budget = token_budget or settings.EXAM_GEN_CONTEXT_TOKEN_BUDGET
+    if not settings.CONTEXT_SELECTOR_ENABLED:
+        return await get_pdf_content_for_exam_generation(pdf_id, user_id, sample_text_from_pdf)
+
+    full_text = await get_pdf_content_for_exam_generation(pdf_id, user_id, sample_text_from_pdf, truncate=False)
+    if not full_text or len(full_text) <= budget * CHARS_PER_TOKEN:
+        return full_text
+
+    cache_key = (pdf_id, compute_text_hash(full_text), budget)
+    cached_context = _selected_context_cache.get(cache_key)
+    if cached_context is not None:
+        _selected_context_cache.move_to_end(cache_key)
+        return cached_context
+
+    chunks, embeddings = None, None
+    if settings.CONTEXT_SELECTOR_USE_INDEX_EMBEDDINGS and not sample_text_from_pdf:
+        fetched = await asyncio.to_thread(fetch_chunk_embeddings, pdf_id)
+        if fetched:
+            chunks, vectors = fetched
+            embeddings = np.asarray(vectors, dtype=np.float32)
+
+    selected_context = await asyncio.to_thread(
+        select_context, full_text, budget, settings.CHUNK_SIZE, chunks, embeddings, settings.CONTEXT_SELECTOR_METHOD
+    )
+    logger.info(f"ExamGen (pdf_id: {pdf_id}, user: {user_id}): Contexto seleccionado por cobertura: {len(selected_context)} de {len(full_text)} chars (presupuesto: {budget} tokens).")
+
+    _selected_context_cache[cache_key] = selected_context
+    while len(_selected_context_cache) > _SELECTED_CONTEXT_CACHE_MAX_ENTRIES:
+        _selected_context_cache.popitem(last=False)
+    return selected_context
+
+# --- Construcción del schema y prompt para el examen completo ---
+def _build_full_exam_response_schema(num_vf: int, num_mc: int, num_open: int, num_fitb: int) -> Dict[str, Any]:
+    # Schema cacheado por combinación de cantidades (compartido: no modificar).
+    return get_full_exam_response_schema(num_vf, num_mc, num_open, num_fitb)
+
+def _build_full_exam_prompt(
+    text_content: Optional[str],
+    num_vf: int,
+    num_mc: int,
+    num_open: int,
+    num_fitb: int,
+    difficulty: Literal["facil", "medio", "dificil"],
+    language: str,
+    extra_instructions: Optional[List[str]] = None
+) -> str:
+    # text_content=None indica que el texto del PDF viaja como contenido cacheado (cachedContent).
+    return render_full_exam_prompt(text_content, num_vf, num_mc, num_open, num_fitb, difficulty, language, extra_instructions)
+
+def _build_generate_content_payload(prompt: str, response_schema: Dict[str, Any], cache_name: Optional[str] = None) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+        "generationConfig": {
+            "responseMimeType": "application/json",
+            "responseSchema": response_schema,
+            "temperature": settings.EXAM_GEN_LLM_TEMPERATURE,
+        }
+    }
+    if cache_name:
+        payload["cachedContent"] = cache_name
+    return payload
+
+def _empty_llm_generated_questions() -> LLMGeneratedQuestions:
+    return LLMGeneratedQuestions(
+        true_false_questions=[], 
+        multiple_choice_questions=[], 
+        open_questions=[],
+        fill_in_the_blank_questions=[] # <--- AÑADIDO
+    )
+
+# Modelo Pydantic que valida cada objeto según el arreglo del JSON en el que aparece.
+LLM_QUESTION_MODELS_BY_FIELD: Dict[str, type] = {
+    "true_false_questions": LLMGeneratedTrueFalse,
+    "multiple_choice_questions": LLMGeneratedMultipleChoice,
+    "open_questions": LLMGeneratedOpenQuestion,
+    "fill_in_the_blank_questions": LLMGeneratedFillInTheBlank,
+}
+
+def _log_generated_counts(llm_questions: LLMGeneratedQuestions) -> None:
+    if llm_questions.true_false_questions: logger.info(f"LLM Gen: {len(llm_questions.true_false_questions)} V/F")
+    if llm_questions.multiple_choice_questions: logger.info(f"LLM Gen: {len(llm_questions.multiple_choice_questions)} MC")
+    if llm_questions.open_questions: logger.info(f"LLM Gen: {len(llm_questions.open_questions)} Open")
+    if llm_questions.fill_in_the_blank_questions: logger.info(f"LLM Gen: {len(llm_questions.fill_in_the_blank_questions)} FITB")
+
+def _parse_full_exam_response_json(response_json: Dict[str, Any]) -> Optional[LLMGeneratedQuestions]:
+    """Extrae y valida las preguntas de una respuesta generateContent. None si la respuesta no trae texto (p. ej. bloqueada)."""
+    if (response_json.get("candidates") and response_json["candidates"][0].get("content") and
+        response_json["candidates"][0]["content"].get("parts") and response_json["candidates"][0]["content"]["parts"][0].get("text")):
+        json_text = response_json["candidates"][0]["content"]["parts"][0]["text"]
+        logger.debug(f"ExamGen LLM (Full Exam): Raw JSON text from Gemini (primeros 1000 chars): {json_text[:1000]}...")
+
+        # Intentar arreglar JSON incompleto
+        last_brace = max(json_text.rfind('}'), json_text.rfind(']'))
+        if last_brace != -1 and last_brace < len(json_text) - 1:
+            logger.warning(f"El JSON recibido parece estar cortado. Intentando recortar hasta el último cierre válido.")
+            json_text = json_text[:last_brace+1]
+
+        try:
+            llm_questions = LLMGeneratedQuestions.model_validate_json(json_text)
+        except Exception as e:
+            logger.error(f"Error al parsear el JSON del LLM. JSON recibido (recortado): {json_text[:1000]}...")
+            raise Exception("El modelo de IA devolvió una respuesta incompleta o inválida. Intenta con menos preguntas o vuelve a intentarlo.") from e
+
+        _log_generated_counts(llm_questions)
+        return llm_questions
+    logger.error(f"ExamGen LLM (Full Exam): Solicitud bloqueada o estructura de respuesta inesperada. Respuesta: {response_json}")
+    return None
+
 # --- Función para llamar a Gemini API (para generación de examen completo) ---
 async def generate_questions_via_gemini_api(
     text_content: str,
@@ -101,139 +265,41 @@ async def generate_questions_via_gemini_api(
     num_fitb: int, # <--- NUEVO PARÁMETRO
     difficulty: Literal["facil", "medio", "dificil"],
     language: str,
-    model_id_exam_gen: str
+    model_id_exam_gen: str,
+    pdf_id: Optional[str] = None,
+    extra_instructions: Optional[List[str]] = None
 ) -> Optional[LLMGeneratedQuestions]:
     if not settings.GEMINI_API_KEY_BACKEND:
         logger.error("ExamGen LLM (Full Exam): GEMINI_API_KEY_BACKEND is not set in settings.")
         raise ValueError("La clave API de Gemini para el backend no está configurada.")
 
-    simplified_response_schema: Dict[str, Any] = {"type": "OBJECT", "properties": {}}
-    
-    # Schema para Verdadero/Falso
-    if num_vf > 0:
-        simplified_response_schema["properties"]["true_false_questions"] = {
-            "type": "ARRAY", "description": f"Lista de {num_vf} preguntas Verdadero/Falso.",
-            "items": {
-                "type": "OBJECT",
-                "properties": { "question_text": {"type": "STRING"}, "answer": {"type": "BOOLEAN"}, "explanation": {"type": "STRING"} },
-                "required": ["question_text", "answer"]
-            }
-        }
-    # Schema para Opción Múltiple
-    if num_mc > 0:
-        simplified_response_schema["properties"]["multiple_choice_questions"] = {
-            "type": "ARRAY", "description": f"Lista de {num_mc} preguntas Opción Múltiple.",
-            "items": {
-                "type": "OBJECT",
-                "properties": {
-                    "question_text": {"type": "STRING"}, 
-                    "options": {"type": "ARRAY", "items": {"type": "STRING"}}, 
-                    "correct_option_text": {"type": "STRING"}, 
-                    "explanation": {"type": "STRING"}
-                }, "required": ["question_text", "options", "correct_option_text"]
-            }
-        }
-    # Schema para Preguntas Abiertas
-    if num_open > 0: 
-        simplified_response_schema["properties"]["open_questions"] = {
-            "type": "ARRAY", "description": f"Lista de {num_open} preguntas abiertas.",
-            "items": {
-                "type": "OBJECT",
-                "properties": { "question_text": {"type": "STRING"}, "explanation_or_answer_guide": {"type": "STRING"} },
-                "required": ["question_text"]
-            }
-        }
-    # Schema para Preguntas para Completar (Fill-in-the-Blank) <--- NUEVO
-    if num_fitb > 0:
-        simplified_response_schema["properties"]["fill_in_the_blank_questions"] = {
-            "type": "ARRAY", "description": f"Lista de {num_fitb} preguntas para completar espacios.",
-            "items": {
-                "type": "OBJECT",
-                "properties": {
-                    "question_text_with_placeholders": {"type": "STRING", "description": "Texto con placeholders como __BLANK__."},
-                    "correct_answers": {"type": "ARRAY", "items": {"type": "STRING"}, "description": "Lista de respuestas en orden."},
-                    "explanation": {"type": "STRING", "description": "Explicación (opcional)."}
-                },
-                "required": ["question_text_with_placeholders", "correct_answers"]
-            }
-        }
+    simplified_response_schema = _build_full_exam_response_schema(num_vf, num_mc, num_open, num_fitb)
 
     if not simplified_response_schema["properties"]: 
         logger.info("ExamGen LLM (Full Exam): No questions requested. Skipping LLM call.")
-        return LLMGeneratedQuestions(
-            true_false_questions=[], 
-            multiple_choice_questions=[], 
-            open_questions=[],
-            fill_in_the_blank_questions=[] # <--- AÑADIDO
-        )
+        return _empty_llm_generated_questions()
 
-    prompt_parts = [
-        f"Eres un asistente experto en crear preguntas de examen en idioma '{language}' con un nivel de dificultad '{difficulty}'. Basándote ESTRICTAMENTE en el siguiente texto, genera preguntas de examen.",
-        "Instrucciones Importantes para la Generación de Preguntas:",
-        "1. Diversidad de Contenido: Asegúrate de que cada pregunta evalúe un aspecto o concepto DIFERENTE del texto. Evita redundancias.",
-        "2. Cantidad Exacta: Debes generar exactamente:"
-    ]
-    if num_vf > 0: prompt_parts.append(f"   - {num_vf} preguntas de Verdadero/Falso.")
-    if num_mc > 0: prompt_parts.append(f"   - {num_mc} preguntas de Opción Múltiple (cada una con 3 a 4 opciones).")
-    if num_open > 0: prompt_parts.append(f"   - {num_open} preguntas Abiertas.")
-    if num_fitb > 0: prompt_parts.append(f"   - {num_fitb} preguntas para Completar Espacios (usa '__BLANK__' para los espacios).") # <--- AÑADIDO
-    
-    prompt_parts.extend([
-        "3. Coherencia y Claridad: Preguntas claras y apropiadas para la dificultad.",
-        "4. Formato Opción Múltiple: 'correct_option_text' DEBE ser una de las cadenas en 'options'.",
-        "5. Formato Completar Espacios: 'question_text_with_placeholders' debe usar '__BLANK__' para cada espacio a completar. 'correct_answers' debe ser una lista con las respuestas en el orden de los '__BLANK__'.", # <--- AÑADIDO
-        "\nTexto de referencia para basar las preguntas:\n------\n", text_content, "\n------\n",
-        "Responde ÚNICAMENTE con un objeto JSON que se adhiera al esquema proporcionado."
-    ])
-    prompt = "\n".join(prompt_parts)
-
-    payload = {
-        "contents": [{"role": "user", "parts": [{"text": prompt}]}],
-        "generationConfig": {
-            "responseMimeType": "application/json",
-            "responseSchema": simplified_response_schema, 
-            "temperature": settings.EXAM_GEN_LLM_TEMPERATURE,
-        }
-    }
+    def build_payload(cache_name: Optional[str]) -> Dict[str, Any]:
+        prompt = _build_full_exam_prompt(None if cache_name else text_content, num_vf, num_mc, num_open, num_fitb, difficulty, language, extra_instructions)
+        return _build_generate_content_payload(prompt, simplified_response_schema, cache_name)
     
     effective_model_id = model_id_exam_gen or settings.DEFAULT_GEMINI_MODEL_EXAM_GEN
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{effective_model_id}:generateContent?key={settings.GEMINI_API_KEY_BACKEND}"
+    api_url = f"{settings.GEMINI_API_BASE_URL}/models/{effective_model_id}:generateContent?key={settings.GEMINI_API_KEY_BACKEND}"
 
-    logger.debug(f"ExamGen LLM (Full Exam): Enviando payload a Gemini ({effective_model_id}). Prompt (primeros 300 chars): {prompt[:300]}...")
+    logger.debug(f"ExamGen LLM (Full Exam): Enviando payload a Gemini ({effective_model_id}). Texto de referencia: {len(text_content)} chars.")
     
     async with httpx.AsyncClient(timeout=settings.EXAM_GEN_LLM_TIMEOUT_SECONDS) as client:
         try:
-            response = await client.post(api_url, json=payload)
+            response = await context_cache_manager.post_generate_content(client, api_url, build_payload, pdf_id, text_content, effective_model_id)
             response.raise_for_status() 
-            response_json = response.json()
-
-            if (response_json.get("candidates") and response_json["candidates"][0].get("content") and
-                response_json["candidates"][0]["content"].get("parts") and response_json["candidates"][0]["content"]["parts"][0].get("text")):
-                json_text = response_json["candidates"][0]["content"]["parts"][0]["text"]
-                logger.debug(f"ExamGen LLM (Full Exam): Raw JSON text from Gemini (primeros 1000 chars): {json_text[:1000]}...")
-
-                # Intentar arreglar JSON incompleto
-                last_brace = max(json_text.rfind('}'), json_text.rfind(']'))
-                if last_brace != -1 and last_brace < len(json_text) - 1:
-                    logger.warning(f"El JSON recibido parece estar cortado. Intentando recortar hasta el último cierre válido.")
-                    json_text = json_text[:last_brace+1]
-
-                try:
-                    llm_questions = LLMGeneratedQuestions.model_validate_json(json_text)
-                except Exception as e:
-                    logger.error(f"Error al parsear el JSON del LLM. JSON recibido (recortado): {json_text[:1000]}...")
-                    raise Exception("El modelo de IA devolvió una respuesta incompleta o inválida. Intenta con menos preguntas o vuelve a intentarlo.") from e
-
-                # Loguear conteos
-                if llm_questions.true_false_questions: logger.info(f"LLM Gen: {len(llm_questions.true_false_questions)} V/F")
-                if llm_questions.multiple_choice_questions: logger.info(f"LLM Gen: {len(llm_questions.multiple_choice_questions)} MC")
-                if llm_questions.open_questions: logger.info(f"LLM Gen: {len(llm_questions.open_questions)} Open")
-                if llm_questions.fill_in_the_blank_questions: logger.info(f"LLM Gen: {len(llm_questions.fill_in_the_blank_questions)} FITB")
-
+            try:
+                # Camino rápido: sobre + JSON de las preguntas validados de una pasada desde los bytes.
+                llm_questions = parse_generate_content_bytes(response.content, LLMGeneratedQuestions)
+                _log_generated_counts(llm_questions)
                 return llm_questions
-            else: 
-                logger.error(f"ExamGen LLM (Full Exam): Solicitud bloqueada o estructura de respuesta inesperada. Respuesta: {response_json}")
-                return None 
+            except ValidationError as ve:
+                logger.debug(f"ExamGen LLM (Full Exam): Validación directa falló ({ve.error_count()} errores). Se usa el parseo tolerante.")
+            return _parse_full_exam_response_json(response.json())
         except httpx.HTTPStatusError as e:
             logger.error(f"ExamGen LLM (Full Exam): HTTP error: {e.response.status_code} - {e.response.text}", exc_info=True)
             raise Exception(f"Error de la API de Gemini ({e.response.status_code}): {e.response.text}") from e
@@ -246,21 +312,486 @@ async def generate_questions_via_gemini_api(
             logger.error(f"ExamGen LLM (Full Exam): Error inesperado: {e}", exc_info=True)
             raise Exception(f"Error inesperado contactando el servicio de IA: {str(e)}") from e
 
+# --- Generación en streaming (streamGenerateContent + parser incremental) ---
+async def prepare_exam_stream_request(
+    text_content: str,
+    num_vf: int,
+    num_mc: int,
+    num_open: int,
+    num_fitb: int,
+    difficulty: Literal["facil", "medio", "dificil"],
+    language: str,
+    model_id_exam_gen: str,
+    pdf_id: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Construye el prompt y el payload de streamGenerateContent (usando el contenido cacheado del PDF si existe).
+    Devuelve {"model_id", "api_url", "payload", "build_payload", "cache_name", "prompt_chars"} o None si no se pidió
+    ninguna pregunta. `build_payload(cache_name)` reconstruye el payload con otro contenido cacheado o con el texto en línea.
+    """
+    if not settings.GEMINI_API_KEY_BACKEND:
+        logger.error("ExamGen LLM (Stream): GEMINI_API_KEY_BACKEND is not set in settings.")
+        raise ValueError("La clave API de Gemini para el backend no está configurada.")
+
+    simplified_response_schema = _build_full_exam_response_schema(num_vf, num_mc, num_open, num_fitb)
+    if not simplified_response_schema["properties"]:
+        logger.info("ExamGen LLM (Stream): No questions requested. Skipping LLM call.")
+        return None
+
+    effective_model_id = model_id_exam_gen or settings.DEFAULT_GEMINI_MODEL_EXAM_GEN
+
+    def build_payload(cache_name: Optional[str]) -> Dict[str, Any]:
+        prompt = _build_full_exam_prompt(None if cache_name else text_content, num_vf, num_mc, num_open, num_fitb, difficulty, language)
+        return _build_generate_content_payload(prompt, simplified_response_schema, cache_name)
+
+    cache_name = await context_cache_manager.get_or_create(pdf_id, text_content, effective_model_id) if pdf_id else None
+    payload = build_payload(cache_name)
+    return {
+        "model_id": effective_model_id,
+        "api_url": f"{settings.GEMINI_API_BASE_URL}/models/{effective_model_id}:streamGenerateContent?alt=sse&key={settings.GEMINI_API_KEY_BACKEND}",
+        "payload": payload,
+        "build_payload": build_payload,
+        "cache_name": cache_name,
+        "prompt_chars": len(payload["contents"][0]["parts"][0]["text"]),
+    }
+
+async def stream_questions_via_gemini_api(
+    text_content: str,
+    num_vf: int,
+    num_mc: int,
+    num_open: int,
+    num_fitb: int,
+    difficulty: Literal["facil", "medio", "dificil"],
+    language: str,
+    model_id_exam_gen: str,
+    parser: Optional[IncrementalQuestionParser] = None,
+    pdf_id: Optional[str] = None,
+    prepared_request: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[Tuple[str, BaseModel]]:
+    """
+    Genera el examen con streamGenerateContent y produce cada pregunta
+    (campo del JSON, modelo LLMGenerated*) en cuanto el LLM cierra su objeto.
+    Si se pasa `parser`, el llamador puede consultar `parser.complete` al terminar
+    para saber si la respuesta llegó completa o fue truncada. `prepared_request` es
+    el resultado de prepare_exam_stream_request si el llamador ya construyó el prompt.
+    """
+    if prepared_request is None:
+        prepared_request = await prepare_exam_stream_request(
+            text_content, num_vf, num_mc, num_open, num_fitb, difficulty, language, model_id_exam_gen, pdf_id
+        )
+    if prepared_request is None:
+        if parser is not None: parser.complete = True
+        return
+
+    effective_model_id = prepared_request["model_id"]
+    cache_name = prepared_request["cache_name"]
+    payload = prepared_request["payload"]
+    build_payload = prepared_request["build_payload"]
+    api_url = prepared_request["api_url"]
+    parser = parser if parser is not None else IncrementalQuestionParser()
+    finish_reason: Optional[str] = None
+
+    logger.debug(f"ExamGen LLM (Stream): Enviando payload a Gemini ({effective_model_id}). Contenido cacheado: {cache_name or 'no'}.")
+
+    async with httpx.AsyncClient(timeout=settings.EXAM_GEN_LLM_TIMEOUT_SECONDS) as client:
+        cache_recreated = False
+        while True:
+            try:
+                async with client.stream("POST", api_url, json=payload) as response:
+                    if response.is_error:
+                        await response.aread()
+                        if cache_name and is_stale_cache_response(response):
+                            # Aún no se emitió ninguna pregunta: se recrea el contenido cacheado una vez y, si
+                            # vuelve a fallar, se reintenta con el texto en línea (como post_generate_content).
+                            logger.warning(f"ExamGen LLM (Stream): streamGenerateContent respondió {response.status_code} con '{cache_name}'. Se reintenta.")
+                            context_cache_manager.discard(cache_name)
+                            cache_name = await context_cache_manager.get_or_create(pdf_id, text_content, effective_model_id) if pdf_id and not cache_recreated else None
+                            cache_recreated = True
+                            payload = build_payload(cache_name)
+                            continue
+                        response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        event_data = line[len("data:"):].strip()
+                        if not event_data:
+                            continue
+                        try:
+                            event_json = json.loads(event_data)
+                        except json.JSONDecodeError:
+                            logger.warning(f"ExamGen LLM (Stream): Evento SSE no es JSON válido, se ignora: {event_data[:200]}")
+                            continue
+                        candidates = event_json.get("candidates") or []
+                        if not candidates:
+                            continue
+                        finish_reason = candidates[0].get("finishReason") or finish_reason
+                        parts = (candidates[0].get("content") or {}).get("parts") or []
+                        for part in parts:
+                            text_fragment = part.get("text")
+                            if not text_fragment:
+                                continue
+                            for field_name, raw_question in parser.feed(text_fragment):
+                                llm_model = LLM_QUESTION_MODELS_BY_FIELD.get(field_name)
+                                if llm_model is None:
+                                    logger.warning(f"ExamGen LLM (Stream): Campo desconocido '{field_name}' en la respuesta. Se omite.")
+                                    continue
+                                try:
+                                    yield field_name, llm_model(**raw_question)
+                                except ValidationError as ve:
+                                    logger.warning(f"ExamGen LLM (Stream): Pregunta '{field_name}' inválida: {ve}. Datos: {raw_question}")
+            except httpx.HTTPStatusError as e:
+                logger.error(f"ExamGen LLM (Stream): HTTP error: {e.response.status_code} - {e.response.text}", exc_info=True)
+                raise Exception(f"Error de la API de Gemini ({e.response.status_code}): {e.response.text}") from e
+            except httpx.TransportError as e:
+                # Conexión cortada a mitad del stream: las preguntas ya emitidas se conservan.
+                logger.warning(f"ExamGen LLM (Stream): Stream interrumpido ({e}). Preguntas completas recibidas: {parser.emitted_count}.")
+            break
+
+    if not parser.complete:
+        logger.warning(f"ExamGen LLM (Stream): Respuesta truncada (finishReason: {finish_reason}). Se conservan {parser.emitted_count} preguntas completas.")
+
+async def generate_questions_via_gemini_api_streaming(
+    text_content: str,
+    num_vf: int,
+    num_mc: int,
+    num_open: int,
+    num_fitb: int,
+    difficulty: Literal["facil", "medio", "dificil"],
+    language: str,
+    model_id_exam_gen: str,
+    pdf_id: Optional[str] = None
+) -> Tuple[LLMGeneratedQuestions, bool]:
+    """
+    Variante de `generate_questions_via_gemini_api` basada en streaming.
+    Devuelve las preguntas completas recibidas y un flag que indica si la
+    respuesta fue parcial (truncada) en lugar de fallar el examen entero.
+    """
+    parser = IncrementalQuestionParser()
+    collected = _empty_llm_generated_questions()
+    async for field_name, llm_question in stream_questions_via_gemini_api(
+        text_content, num_vf, num_mc, num_open, num_fitb, difficulty, language, model_id_exam_gen, parser=parser, pdf_id=pdf_id
+    ):
+        getattr(collected, field_name).append(llm_question)
+
+    is_partial = not parser.complete
+    logger.info(
+        f"LLM Gen (Stream): {len(collected.true_false_questions)} V/F, {len(collected.multiple_choice_questions)} MC, "
+        f"{len(collected.open_questions)} Open, {len(collected.fill_in_the_blank_questions)} FITB. Parcial: {is_partial}"
+    )
+    return collected, is_partial
+
+# --- Generación en paralelo por sub-generaciones (shards) ---
+_SHARD_FIELDS = [
+    ("num_vf", "true_false_questions"),
+    ("num_mc", "multiple_choice_questions"),
+    ("num_open", "open_questions"),
+    ("num_fitb", "fill_in_the_blank_questions"),
+]
+_QUESTION_TYPE_BY_COUNT_KEY = {
+    "num_vf": QuestionType.TRUE_FALSE,
+    "num_mc": QuestionType.MULTIPLE_CHOICE,
+    "num_open": QuestionType.OPEN,
+    "num_fitb": QuestionType.FILL_IN_THE_BLANK,
+}
+_COUNT_KEY_BY_QUESTION_TYPE = {question_type: count_key for count_key, question_type in _QUESTION_TYPE_BY_COUNT_KEY.items()}
+
+def _plan_exam_shards(num_vf: int, num_mc: int, num_open: int, num_fitb: int, shard_size: Optional[int] = None) -> List[Dict[str, int]]:
+    """Divide la solicitud por tipo de pregunta y, si se indica shard_size, en grupos de como máximo N preguntas."""
+    requested = {"num_vf": num_vf, "num_mc": num_mc, "num_open": num_open, "num_fitb": num_fitb}
+    shards: List[Dict[str, int]] = []
+    for count_key, _ in _SHARD_FIELDS:
+        remaining = requested[count_key]
+        group_size = shard_size or remaining
+        while remaining > 0:
+            take = min(group_size, remaining)
+            shard = {key: 0 for key, _ in _SHARD_FIELDS}
+            shard[count_key] = take
+            shards.append(shard)
+            remaining -= take
+    return shards
+
+def _llm_question_text(q_data: BaseModel) -> str:
+    return getattr(q_data, "question_text", None) or getattr(q_data, "question_text_with_placeholders", "")
+
+async def generate_questions_via_parallel_shards(
+    text_content: str,
+    num_vf: int,
+    num_mc: int,
+    num_open: int,
+    num_fitb: int,
+    difficulty: Literal["facil", "medio", "dificil"],
+    language: str,
+    model_id_exam_gen: str,
+    pdf_id: Optional[str] = None,
+    shard_size: Optional[int] = None
+) -> Tuple[LLMGeneratedQuestions, bool]:
+    """
+    Ejecuta una sub-generación por shard de forma concurrente (acotada por EXAM_GEN_MAX_CONCURRENT_SHARDS),
+    reintenta solo los shards que fallaron y fusiona los resultados eliminando preguntas duplicadas.
+    Devuelve las preguntas fusionadas y un flag que indica si algún shard falló definitivamente.
+    """
+    shards = _plan_exam_shards(num_vf, num_mc, num_open, num_fitb, shard_size)
+    if not shards:
+        return _empty_llm_generated_questions(), False
+
+    semaphore = asyncio.Semaphore(max(1, settings.EXAM_GEN_MAX_CONCURRENT_SHARDS))
+    shards_per_type: Dict[str, int] = {}
+    for shard in shards:
+        count_key = next(key for key, value in shard.items() if value > 0)
+        shards_per_type[count_key] = shards_per_type.get(count_key, 0) + 1
+
+    def shard_instructions(index: int) -> Optional[List[str]]:
+        # Varios shards del mismo tipo: se reparte el documento para reducir repeticiones entre ellos.
+        count_key = next(key for key, value in shards[index].items() if value > 0)
+        total_of_type = shards_per_type[count_key]
+        if total_of_type <= 1:
+            return None
+        position = sum(1 for s in shards[:index] if s[count_key] > 0) + 1
+        return [f"6. Enfoque: esta es la parte {position} de {total_of_type} de la generación; prioriza conceptos de la sección {position} de {total_of_type} del texto."]
+
+    async def run_shard(index: int) -> Optional[LLMGeneratedQuestions]:
+        async with semaphore:
+            return await generate_questions_via_gemini_api(
+                text_content=text_content,
+                difficulty=difficulty,
+                language=language,
+                model_id_exam_gen=model_id_exam_gen,
+                pdf_id=pdf_id,
+                extra_instructions=shard_instructions(index),
+                **shards[index]
+            )
+
+    results: Dict[int, LLMGeneratedQuestions] = {}
+    pending = list(range(len(shards)))
+    for attempt in range(1 + max(0, settings.EXAM_GEN_SHARD_MAX_RETRIES)):
+        if not pending:
+            break
+        if attempt > 0:
+            logger.warning(f"ExamGen LLM (Parallel): Reintento {attempt} para {len(pending)} shard(s) fallidos: {pending}")
+        outcomes = await asyncio.gather(*(run_shard(i) for i in pending), return_exceptions=True)
+        still_failing = []
+        for index, outcome in zip(pending, outcomes):
+            if isinstance(outcome, BaseException) or outcome is None:
+                logger.warning(f"ExamGen LLM (Parallel): Shard {index} ({shards[index]}) falló: {outcome}")
+                still_failing.append(index)
+            else:
+                results[index] = outcome
+        pending = still_failing
+
+    if not results:
+        raise Exception("El modelo de IA no pudo generar ninguna de las sub-generaciones del examen.")
+
+    merged = _empty_llm_generated_questions()
+    seen_texts = set()
+    duplicates = 0
+    for index in sorted(results):
+        for _, field_name in _SHARD_FIELDS:
+            for q_data in getattr(results[index], field_name) or []:
+                normalized = _normalize_question_text(_llm_question_text(q_data))
+                if not normalized or normalized in seen_texts:
+                    duplicates += 1
+                    continue
+                seen_texts.add(normalized)
+                getattr(merged, field_name).append(q_data)
+
+    logger.info(f"ExamGen LLM (Parallel): {len(results)}/{len(shards)} shards completados, {duplicates} duplicados descartados.")
+    return merged, bool(pending)
+
+def _similarity_corpus(text_content: str) -> List[str]:
+    """Fragmentos del contexto del PDF: dan el IDF con el que se comparan las preguntas de ese documento."""
+    return split_text_into_chunks(text_content, settings.CHUNK_SIZE)
+
+def _drop_near_duplicate_questions(
+    llm_generated_data: LLMGeneratedQuestions,
+    existing_texts: Sequence[str] = (),
+    corpus_texts: Sequence[str] = ()
+) -> int:
+    """
+    Elimina (in situ) las preguntas casi duplicadas de cualquier tipo, entre sí o respecto a `existing_texts`.
+    Devuelve cuántas se descartaron.
+    """
+    entries = [
+        (field_name, q_data)
+        for field_name in LLM_QUESTION_MODELS_BY_FIELD
+        for q_data in getattr(llm_generated_data, field_name) or []
+    ]
+    kept_positions = set(filter_near_duplicates([_llm_question_text(q_data) for _, q_data in entries], existing_texts, corpus_texts))
+    for field_name in LLM_QUESTION_MODELS_BY_FIELD:
+        setattr(llm_generated_data, field_name, [])
+    for position, (field_name, q_data) in enumerate(entries):
+        if position in kept_positions:
+            getattr(llm_generated_data, field_name).append(q_data)
+    return len(entries) - len(kept_positions)
+
+async def _top_up_dropped_questions(
+    llm_generated_data: LLMGeneratedQuestions,
+    requested_counts: Dict[str, int],
+    text_content: str,
+    existing_texts: Sequence[str],
+    corpus_texts: Sequence[str],
+    difficulty: Literal["facil", "medio", "dificil"],
+    language: str,
+    model_id_exam_gen: str,
+    pdf_id: Optional[str] = None
+) -> int:
+    """
+    Repone (in situ) las preguntas descartadas por casi duplicadas con una única llamada adicional al LLM
+    que pide solo las que faltan de cada tipo. Devuelve cuántas se añadieron.
+    """
+    missing = {
+        count_key: max(0, requested_counts.get(count_key, 0) - len(getattr(llm_generated_data, field_name) or []))
+        for count_key, field_name in _SHARD_FIELDS
+    }
+    if not any(missing.values()):
+        return 0
+    kept_texts = list(existing_texts) + [
+        _llm_question_text(q_data)
+        for field_name in LLM_QUESTION_MODELS_BY_FIELD
+        for q_data in getattr(llm_generated_data, field_name) or []
+    ]
+    kept_str = "\n".join(f"- '{text}'" for text in kept_texts) if kept_texts else "Ninguna."
+    try:
+        extra_data = await generate_questions_via_gemini_api(
+            text_content=text_content,
+            difficulty=difficulty,
+            language=language,
+            model_id_exam_gen=model_id_exam_gen,
+            pdf_id=pdf_id,
+            extra_instructions=[
+                "RESTRICCIONES DE COMPLETADO:",
+                f"6. Las nuevas preguntas DEBEN SER SIGNIFICATIVAMENTE DIFERENTES a estas, que ya forman parte del examen:\n{kept_str}",
+            ],
+            **missing
+        )
+    except Exception as e:
+        logger.warning(f"ExamGen Service (Full Exam): No se pudieron reponer las preguntas casi duplicadas ({missing}): {e}")
+        return 0
+    if not extra_data:
+        return 0
+
+    similarity_index = QuestionSimilarityIndex(corpus_texts=corpus_texts)
+    similarity_index.extend(kept_texts)
+    added = 0
+    for count_key, field_name in _SHARD_FIELDS:
+        questions = list(getattr(llm_generated_data, field_name) or [])
+        for q_data in getattr(extra_data, field_name) or []:
+            if missing[count_key] <= 0:
+                break
+            text = _llm_question_text(q_data)
+            if similarity_index.find_near_duplicate(text) is not None:
+                continue
+            similarity_index.add(text)
+            questions.append(q_data)
+            missing[count_key] -= 1
+            added += 1
+        setattr(llm_generated_data, field_name, questions)
+    return added
+
+def _shortfall_message(requested_counts: Dict[str, int], questions: Sequence[QuestionOutput]) -> Optional[str]:
+    """Mensaje para el usuario si el examen tiene menos preguntas de las pedidas; None si está completo."""
+    requested_total = sum(requested_counts.values())
+    if len(questions) >= requested_total:
+        return None
+    return f"Solo se pudieron generar {len(questions)} de las {requested_total} preguntas solicitadas."
+
+# --- Conversión de preguntas del LLM al formato de salida ---
+def _llm_question_to_output(field_name: str, q_data: BaseModel) -> Optional[QuestionOutput]:
+    try:
+        if field_name == "true_false_questions":
+            return TrueFalseQuestionOutput(id=str(uuid.uuid4()), text=q_data.question_text, correct_answer=q_data.answer, explanation=q_data.explanation)
+        if field_name == "multiple_choice_questions":
+            if not q_data.options or len(q_data.options) < 2: return None
+            try:
+                norm_opts = [opt.strip().lower() for opt in q_data.options]
+                norm_correct_text = q_data.correct_option_text.strip().lower()
+                correct_idx = norm_opts.index(norm_correct_text)
+            except ValueError: 
+                logger.warning(f"ExamGen Service (Full Exam): Respuesta OM '{q_data.correct_option_text}' no en opciones {q_data.options} para: '{q_data.question_text}'. Se omite.")
+                return None
+            return MultipleChoiceQuestionOutput(id=str(uuid.uuid4()), text=q_data.question_text, options=q_data.options, correct_answer_index=correct_idx, explanation=q_data.explanation)
+        if field_name == "open_questions":
+            return OpenQuestionOutput(id=str(uuid.uuid4()), text=q_data.question_text, explanation=q_data.explanation_or_answer_guide)
+        if field_name == "fill_in_the_blank_questions":
+            if not q_data.correct_answers: # Debe tener al menos una respuesta
+                logger.warning(f"ExamGen Service (Full Exam): Pregunta FITB sin respuestas: '{q_data.question_text_with_placeholders}'. Se omite.")
+                return None
+            return FillInTheBlankQuestionOutput(
+                id=str(uuid.uuid4()), 
+                text=q_data.question_text_with_placeholders, 
+                answers=q_data.correct_answers, 
+                explanation=q_data.explanation
+            )
+        logger.warning(f"ExamGen Service (Full Exam): Campo de preguntas desconocido '{field_name}'. Se omite.")
+        return None
+    except ValidationError as ve:
+        logger.warning(f"ExamGen Service (Full Exam): Error validando '{field_name}': {ve}. Datos: {q_data.model_dump_json(exclude_none=True)}")
+        return None
+
+def _convert_llm_questions_to_output(llm_generated_data: LLMGeneratedQuestions) -> List[QuestionOutput]:
+    all_questions_output: List[QuestionOutput] = []
+    for field_name in LLM_QUESTION_MODELS_BY_FIELD:
+        for q_data in getattr(llm_generated_data, field_name) or []:
+            question_output = _llm_question_to_output(field_name, q_data)
+            if question_output is not None:
+                all_questions_output.append(question_output)
+    return all_questions_output
+
 # --- Función para orquestar la generación del examen completo ---
+def _requested_counts(request: ExamGenerationRequest) -> Dict[str, int]:
+    return {
+        "num_vf": request.question_config.get("vf_questions", 0),
+        "num_mc": request.question_config.get("mc_questions", 0),
+        "num_open": request.question_config.get("open_questions", 0),
+        "num_fitb": request.question_config.get("fitb_questions", 0),
+    }
+
+def _question_config_used(request: ExamGenerationRequest) -> QuestionConfigForExam:
+    counts = _requested_counts(request)
+    return QuestionConfigForExam(
+        num_true_false=counts["num_vf"], num_multiple_choice=counts["num_mc"],
+        num_open_questions=counts["num_open"], num_fill_in_the_blank=counts["num_fitb"],
+        difficulty=request.difficulty, language=request.language,
+        model_id=request.model_id or settings.DEFAULT_GEMINI_MODEL_EXAM_GEN, user_id=request.user_id
+    )
+
 async def generate_exam_questions_service(request: ExamGenerationRequest) -> GeneratedExam:
     logger.info(f"ExamGen Service (Full Exam): Iniciando para PDF ID: {request.pdf_id}, Título: '{request.title}'")
     error_message_for_user = None
     try:
         # Obtener número de preguntas de cada tipo desde la configuración de la solicitud
-        num_vf = request.question_config.get("vf_questions", 0)
-        num_mc = request.question_config.get("mc_questions", 0)
-        num_open = request.question_config.get("open_questions", 0)
-        num_fitb = request.question_config.get("fitb_questions", 0) # <--- NUEVO
+        requested_counts = _requested_counts(request)
+        num_vf, num_mc, num_open, num_fitb = (requested_counts[key] for key in ("num_vf", "num_mc", "num_open", "num_fitb"))
+        config_that_was_used = _question_config_used(request)
 
-        pdf_text_content = await get_pdf_content_for_exam_generation(
+        sample_text_from_pdf = getattr(request, 'sample_text_from_pdf', None)
+        use_bank = settings.QUESTION_BANK_ENABLED and getattr(request, 'use_question_bank', False) and not sample_text_from_pdf
+        bank_questions: List[QuestionOutput] = []
+        if use_bank:
+            # Primero se toman preguntas del banco; al LLM solo se le piden las que falten.
+            missing_counts = {"num_vf": num_vf, "num_mc": num_mc, "num_open": num_open, "num_fitb": num_fitb}
+            bank_questions = await asyncio.to_thread(
+                question_bank.draw,
+                request.pdf_id,
+                {_QUESTION_TYPE_BY_COUNT_KEY[count_key].value: count for count_key, count in missing_counts.items()},
+                request.difficulty,
+                request.language
+            )
+            for question in bank_questions:
+                missing_counts[_COUNT_KEY_BY_QUESTION_TYPE[QuestionType(question.type)]] -= 1
+            if bank_questions and not any(missing_counts.values()):
+                logger.info(f"ExamGen Service (Full Exam): Examen '{request.title}' armado completamente desde el banco ({len(bank_questions)} preguntas).")
+                return GeneratedExam(
+                    pdf_id=request.pdf_id, title=request.title, difficulty=request.difficulty,
+                    questions=bank_questions, config_used=config_that_was_used, bank_question_count=len(bank_questions)
+                )
+            if bank_questions:
+                logger.info(f"ExamGen Service (Full Exam): {len(bank_questions)} preguntas tomadas del banco; se piden al LLM las faltantes: {missing_counts}")
+            num_vf, num_mc, num_open, num_fitb = (missing_counts[key] for key in ("num_vf", "num_mc", "num_open", "num_fitb"))
+
+        pdf_text_content = await get_pdf_context_for_generation(
             request.pdf_id,
             request.user_id, 
-            getattr(request, 'sample_text_from_pdf', None) 
+            sample_text_from_pdf=sample_text_from_pdf
         )
         
         min_text_length = settings.EXAM_GEN_MIN_TEXT_LENGTH
@@ -269,89 +800,354 @@ async def generate_exam_questions_service(request: ExamGenerationRequest) -> Gen
             error_message_for_user = f"El contenido del documento es demasiado corto (longitud: {len(pdf_text_content or '')}) para generar un examen. Se requieren al menos {min_text_length} caracteres."
             return GeneratedExam(pdf_id=request.pdf_id, title=request.title, difficulty=request.difficulty, questions=[], error=error_message_for_user)
 
-        llm_generated_data = await generate_questions_via_gemini_api(
-            text_content=pdf_text_content,
-            num_vf=num_vf,
-            num_mc=num_mc,
-            num_open=num_open,
-            num_fitb=num_fitb, # <--- PASAR NUEVO PARÁMETRO
-            difficulty=request.difficulty,
-            language=request.language,
-            model_id_exam_gen=request.model_id 
-        )
+        is_partial = False
+        if request.generation_mode == "parallel":
+            llm_generated_data, is_partial = await generate_questions_via_parallel_shards(
+                text_content=pdf_text_content,
+                num_vf=num_vf,
+                num_mc=num_mc,
+                num_open=num_open,
+                num_fitb=num_fitb,
+                difficulty=request.difficulty,
+                language=request.language,
+                model_id_exam_gen=request.model_id,
+                pdf_id=request.pdf_id,
+                shard_size=request.shard_size
+            )
+        elif request.generation_mode == "stream":
+            llm_generated_data, is_partial = await generate_questions_via_gemini_api_streaming(
+                text_content=pdf_text_content,
+                num_vf=num_vf,
+                num_mc=num_mc,
+                num_open=num_open,
+                num_fitb=num_fitb,
+                difficulty=request.difficulty,
+                language=request.language,
+                model_id_exam_gen=request.model_id,
+                pdf_id=request.pdf_id
+            )
+        else:
+            llm_generated_data = await generate_questions_via_gemini_api(
+                text_content=pdf_text_content,
+                num_vf=num_vf,
+                num_mc=num_mc,
+                num_open=num_open,
+                num_fitb=num_fitb, # <--- PASAR NUEVO PARÁMETRO
+                difficulty=request.difficulty,
+                language=request.language,
+                model_id_exam_gen=request.model_id,
+                pdf_id=request.pdf_id
+            )
 
         if not llm_generated_data:
             logger.error(f"ExamGen Service (Full Exam): No se recibieron datos del LLM para '{request.title}'.")
             error_message_for_user = "El modelo de IA no pudo generar las preguntas. Inténtalo de nuevo."
             return GeneratedExam(pdf_id=request.pdf_id, title=request.title, difficulty=request.difficulty, questions=[], error=error_message_for_user)
 
-        all_questions_output: List[QuestionOutput] = [] 
-        
-        # Procesar preguntas V/F
-        if llm_generated_data.true_false_questions:
-            for q_data in llm_generated_data.true_false_questions:
-                try:
-                    all_questions_output.append(TrueFalseQuestionOutput(id=str(uuid.uuid4()), text=q_data.question_text, correct_answer=q_data.answer, explanation=q_data.explanation))
-                except ValidationError as ve: logger.warning(f"ExamGen Service (Full Exam): Error validando V/F: {ve}. Datos: {q_data.model_dump_json(exclude_none=True)}")
-        
-        # Procesar preguntas Opción Múltiple
-        if llm_generated_data.multiple_choice_questions:
-            for q_data in llm_generated_data.multiple_choice_questions:
-                try:
-                    if not q_data.options or len(q_data.options) < 2: continue
-                    correct_idx = -1
-                    try:
-                        norm_opts = [opt.strip().lower() for opt in q_data.options]
-                        norm_correct_text = q_data.correct_option_text.strip().lower()
-                        correct_idx = norm_opts.index(norm_correct_text)
-                    except ValueError: 
-                        logger.warning(f"ExamGen Service (Full Exam): Respuesta OM '{q_data.correct_option_text}' no en opciones {q_data.options} para: '{q_data.question_text}'. Se omite.")
-                        continue
-                    all_questions_output.append(MultipleChoiceQuestionOutput(id=str(uuid.uuid4()), text=q_data.question_text, options=q_data.options, correct_answer_index=correct_idx, explanation=q_data.explanation))
-                except ValidationError as ve: logger.warning(f"ExamGen Service (Full Exam): Error validando OM: {ve}. Datos: {q_data.model_dump_json(exclude_none=True)}")
-        
-        # Procesar preguntas Abiertas
-        if llm_generated_data.open_questions:
-            for q_data in llm_generated_data.open_questions:
-                try:
-                    all_questions_output.append(OpenQuestionOutput(id=str(uuid.uuid4()), text=q_data.question_text, explanation=q_data.explanation_or_answer_guide))
-                except ValidationError as ve: logger.warning(f"ExamGen Service (Full Exam): Error validando Abierta: {ve}. Datos: {q_data.model_dump_json(exclude_none=True)}")
+        if settings.QUESTION_DEDUP_ENABLED:
+            bank_texts = [q.text for q in bank_questions]
+            corpus_texts = _similarity_corpus(pdf_text_content)
+            removed_duplicates = _drop_near_duplicate_questions(llm_generated_data, bank_texts, corpus_texts)
+            if removed_duplicates:
+                replaced = await _top_up_dropped_questions(
+                    llm_generated_data,
+                    {"num_vf": num_vf, "num_mc": num_mc, "num_open": num_open, "num_fitb": num_fitb},
+                    pdf_text_content, bank_texts, corpus_texts,
+                    difficulty=request.difficulty, language=request.language,
+                    model_id_exam_gen=request.model_id, pdf_id=request.pdf_id
+                )
+                logger.info(f"ExamGen Service (Full Exam): {removed_duplicates} preguntas casi duplicadas descartadas para '{request.title}', {replaced} repuestas.")
 
-        # Procesar preguntas para Completar Espacios <--- NUEVO
-        if llm_generated_data.fill_in_the_blank_questions:
-            for q_data in llm_generated_data.fill_in_the_blank_questions:
-                try:
-                    if not q_data.correct_answers: # Debe tener al menos una respuesta
-                        logger.warning(f"ExamGen Service (Full Exam): Pregunta FITB sin respuestas: '{q_data.question_text_with_placeholders}'. Se omite.")
-                        continue
-                    all_questions_output.append(FillInTheBlankQuestionOutput(
-                        id=str(uuid.uuid4()), 
-                        text=q_data.question_text_with_placeholders, 
-                        answers=q_data.correct_answers, 
-                        explanation=q_data.explanation
-                    ))
-                except ValidationError as ve: 
-                    logger.warning(f"ExamGen Service (Full Exam): Error validando FITB: {ve}. Datos: {q_data.model_dump_json(exclude_none=True)}")
-        
-        config_that_was_used = QuestionConfigForExam(
-            num_true_false=num_vf, 
-            num_multiple_choice=num_mc,
-            num_open_questions=num_open,
-            num_fill_in_the_blank=num_fitb, # <--- AÑADIDO
-            difficulty=request.difficulty,
-            language=request.language,
-            model_id=request.model_id or settings.DEFAULT_GEMINI_MODEL_EXAM_GEN,
-            user_id=request.user_id
-        )
+        all_questions_output = _convert_llm_questions_to_output(llm_generated_data)
+        if is_partial:
+            logger.warning(f"ExamGen Service (Full Exam): Respuesta parcial del LLM para '{request.title}'. Se devuelven {len(all_questions_output)} preguntas completas.")
+        shortfall = _shortfall_message(requested_counts, bank_questions + all_questions_output)
+        if shortfall:
+            logger.warning(f"ExamGen Service (Full Exam): {shortfall} ('{request.title}')")
+            is_partial = True
+        if use_bank and all_questions_output:
+            # Las preguntas nuevas también alimentan el banco para los siguientes exámenes.
+            await asyncio.to_thread(question_bank.add_questions, request.pdf_id, all_questions_output, request.difficulty, request.language)
 
         return GeneratedExam(
             pdf_id=request.pdf_id, title=request.title, difficulty=request.difficulty,
-            questions=all_questions_output, config_used=config_that_was_used, error=error_message_for_user
+            questions=bank_questions + all_questions_output, config_used=config_that_was_used, error=error_message_for_user,
+            is_partial=is_partial, warning=shortfall, bank_question_count=len(bank_questions)
         )
     except Exception as e: 
         logger.error(f"ExamGen Service (Full Exam): Error inesperado generando examen '{request.title}': {e}", exc_info=True)
         return GeneratedExam(pdf_id=request.pdf_id, title=request.title, difficulty=request.difficulty, questions=[], error=f"Error interno: {str(e)}")
 
+# --- Generación de examen con eventos de progreso (para SSE) ---
+async def stream_exam_generation_events(request: ExamGenerationRequest) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Genera el examen produciendo eventos (nombre, datos) a medida que avanza:
+    "stage" (bank_drawn, content_loaded, prompt_built), "question" por cada QuestionOutput validado
+    (incluidas las del banco), "type_completed" al cerrarse cada tipo de pregunta, y al final "done"
+    con el GeneratedExamResponse completo o "error". Usa streamGenerateContent, así que las preguntas
+    se emiten en cuanto el LLM las termina.
+    """
+    config_that_was_used = _question_config_used(request)
+
+    def error_event(message: str) -> Tuple[str, Dict[str, Any]]:
+        return "error", {"detail": message}
+
+    try:
+        missing_counts = _requested_counts(request)
+        bank_questions: List[QuestionOutput] = []
+        use_bank = settings.QUESTION_BANK_ENABLED and request.use_question_bank
+        if use_bank:
+            bank_questions = await asyncio.to_thread(
+                question_bank.draw,
+                request.pdf_id,
+                {_QUESTION_TYPE_BY_COUNT_KEY[count_key].value: count for count_key, count in missing_counts.items()},
+                request.difficulty,
+                request.language
+            )
+            for question in bank_questions:
+                missing_counts[_COUNT_KEY_BY_QUESTION_TYPE[QuestionType(question.type)]] -= 1
+            yield "stage", {"stage": "bank_drawn", "bank_questions": len(bank_questions), "missing": missing_counts}
+            for question in bank_questions:
+                yield "question", {"source": "bank", "question": question.model_dump(mode="json")}
+
+        new_questions: List[QuestionOutput] = []
+        is_partial = False
+        if any(missing_counts.values()):
+            pdf_text_content = await get_pdf_context_for_generation(request.pdf_id, request.user_id)
+            min_text_length = settings.EXAM_GEN_MIN_TEXT_LENGTH
+            if not pdf_text_content or len(pdf_text_content) < min_text_length:
+                yield error_event(f"El contenido del documento es demasiado corto (longitud: {len(pdf_text_content or '')}) para generar un examen. Se requieren al menos {min_text_length} caracteres.")
+                return
+            yield "stage", {"stage": "content_loaded", "chars": len(pdf_text_content)}
+
+            prepared_request = await prepare_exam_stream_request(
+                pdf_text_content, difficulty=request.difficulty, language=request.language,
+                model_id_exam_gen=request.model_id, pdf_id=request.pdf_id, **missing_counts
+            )
+            yield "stage", {
+                "stage": "prompt_built", "model_id": config_that_was_used.model_id, "requested": missing_counts,
+                "prompt_chars": prepared_request["prompt_chars"] if prepared_request else 0,
+                "cached_context": bool(prepared_request and prepared_request["cache_name"]),
+            }
+
+            similarity_index = QuestionSimilarityIndex(corpus_texts=_similarity_corpus(pdf_text_content))
+            similarity_index.extend([q.text for q in bank_questions])
+            parser = IncrementalQuestionParser()
+            count_by_field: Dict[str, int] = {}
+            current_field: Optional[str] = None
+            async for field_name, llm_question in stream_questions_via_gemini_api(
+                pdf_text_content, difficulty=request.difficulty, language=request.language,
+                model_id_exam_gen=request.model_id, parser=parser, pdf_id=request.pdf_id,
+                prepared_request=prepared_request, **missing_counts
+            ):
+                if current_field and field_name != current_field:
+                    yield "type_completed", {"field": current_field, "count": count_by_field.get(current_field, 0)}
+                current_field = field_name
+                question_output = _llm_question_to_output(field_name, llm_question)
+                if question_output is None:
+                    continue
+                if settings.QUESTION_DEDUP_ENABLED and similarity_index.find_near_duplicate(question_output.text) is not None:
+                    logger.info(f"ExamGen Service (SSE): Pregunta casi duplicada descartada: '{question_output.text[:80]}'")
+                    continue
+                similarity_index.add(question_output.text)
+                new_questions.append(question_output)
+                count_by_field[field_name] = count_by_field.get(field_name, 0) + 1
+                yield "question", {"source": "llm", "question": question_output.model_dump(mode="json")}
+            if current_field:
+                yield "type_completed", {"field": current_field, "count": count_by_field.get(current_field, 0)}
+            is_partial = not parser.complete
+
+            if not new_questions and not bank_questions:
+                yield error_event("El modelo de IA no pudo generar las preguntas. Inténtalo de nuevo.")
+                return
+            if use_bank and new_questions:
+                await asyncio.to_thread(question_bank.add_questions, request.pdf_id, new_questions, request.difficulty, request.language)
+
+        shortfall = _shortfall_message(_requested_counts(request), bank_questions + new_questions)
+        exam = GeneratedExam(
+            pdf_id=request.pdf_id, title=request.title, difficulty=request.difficulty,
+            questions=bank_questions + new_questions, config_used=config_that_was_used, warning=shortfall,
+            is_partial=is_partial or bool(shortfall), bank_question_count=len(bank_questions)
+        )
+        yield "done", exam.model_dump(mode="json")
+    except Exception as e:
+        logger.error(f"ExamGen Service (SSE): Error generando examen '{request.title}': {e}", exc_info=True)
+        yield error_event(f"Error interno: {str(e)}")
+
+# --- Generación por lotes (Gemini Batch Mode: batchGenerateContent) ---
+_BATCH_TERMINAL_STATES = {"BATCH_STATE_SUCCEEDED", "BATCH_STATE_FAILED", "BATCH_STATE_CANCELLED", "BATCH_STATE_EXPIRED"}
+
+class BatchFailedError(Exception):
+    """El lote terminó en BATCH_STATE_FAILED/CANCELLED/EXPIRED sin resultados: reintentar la consulta no sirve."""
+
+async def submit_exam_generation_batch(keyed_requests: List[Tuple[str, ExamGenerationRequest]]) -> Tuple[Dict[str, List[str]], Dict[str, str]]:
+    """
+    Prepara el payload generateContent de cada examen y los envía, agrupados por modelo, a batchGenerateContent.
+    Devuelve ({nombre del lote: [claves]}, {clave: error}) con los exámenes que no se pudieron preparar.
+    """
+    if not settings.GEMINI_API_KEY_BACKEND:
+        raise ValueError("La clave API de Gemini para el backend no está configurada.")
+    requests_by_model: Dict[str, List[Dict[str, Any]]] = {}
+    failures: Dict[str, str] = {}
+    for key, request in keyed_requests:
+        try:
+            pdf_text_content = await get_pdf_context_for_generation(request.pdf_id, request.user_id)
+        except Exception as e:
+            failures[key] = f"No se pudo obtener el contenido del PDF: {e}"
+            continue
+        if not pdf_text_content or len(pdf_text_content) < settings.EXAM_GEN_MIN_TEXT_LENGTH:
+            failures[key] = f"El contenido del documento es demasiado corto (longitud: {len(pdf_text_content or '')}) para generar un examen."
+            continue
+        counts = _requested_counts(request)
+        response_schema = _build_full_exam_response_schema(**counts)
+        if not response_schema["properties"]:
+            failures[key] = "No se solicitó ninguna pregunta."
+            continue
+        prompt = _build_full_exam_prompt(pdf_text_content, difficulty=request.difficulty, language=request.language, **counts)
+        model_id = request.model_id or settings.DEFAULT_GEMINI_MODEL_EXAM_GEN
+        requests_by_model.setdefault(model_id, []).append({
+            "request": _build_generate_content_payload(prompt, response_schema),
+            "metadata": {"key": key},
+        })
+
+    batches: Dict[str, List[str]] = {}
+    async with httpx.AsyncClient(timeout=settings.EXAM_GEN_LLM_TIMEOUT_SECONDS) as client:
+        for model_id, inlined_requests in requests_by_model.items():
+            body = {"batch": {
+                "displayName": f"edupdf-exams-{uuid.uuid4().hex[:8]}",
+                "inputConfig": {"requests": {"requests": inlined_requests}},
+            }}
+            api_url = f"{settings.GEMINI_API_BASE_URL}/models/{model_id}:batchGenerateContent?key={settings.GEMINI_API_KEY_BACKEND}"
+            response = await client.post(api_url, json=body)
+            response.raise_for_status()
+            batch_name = response.json()["name"]
+            batches[batch_name] = [item["metadata"]["key"] for item in inlined_requests]
+            logger.info(f"ExamGen Batch: Lote '{batch_name}' enviado con {len(inlined_requests)} exámenes ({model_id}).")
+    return batches, failures
+
+async def poll_exam_generation_batch(batch_name: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    None mientras el lote sigue en curso; al terminar, {clave: respuesta generateContent o {"error": ...}}.
+    Lanza BatchFailedError si el lote terminó sin resultados; los errores de red o HTTP se propagan tal cual.
+    """
+    api_url = f"{settings.GEMINI_API_BASE_URL}/{batch_name}?key={settings.GEMINI_API_KEY_BACKEND}"
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        response = await client.get(api_url)
+        response.raise_for_status()
+        operation = response.json()
+    metadata = operation.get("metadata") or {}
+    state = metadata.get("state", "")
+    if not operation.get("done") and state not in _BATCH_TERMINAL_STATES:
+        return None
+    output = operation.get("response") or metadata.get("output") or {}
+    if state and state != "BATCH_STATE_SUCCEEDED" and not output:
+        raise BatchFailedError(f"El lote '{batch_name}' terminó con estado {state}: {operation.get('error')}")
+    results: Dict[str, Dict[str, Any]] = {}
+    for item in (output.get("inlinedResponses") or {}).get("inlinedResponses") or []:
+        key = (item.get("metadata") or {}).get("key")
+        if key is not None:
+            results[key] = item.get("response") or {"error": item.get("error") or "El lote no devolvió respuesta para este examen."}
+    return results
+
+def build_exam_from_generate_content_response(request: ExamGenerationRequest, response_json: Dict[str, Any]) -> GeneratedExam:
+    """Convierte la respuesta generateContent de un examen (p. ej. de un lote) en un GeneratedExamResponse."""
+    def failed(message: str) -> GeneratedExam:
+        return GeneratedExam(pdf_id=request.pdf_id, title=request.title, difficulty=request.difficulty, questions=[], error=message)
+
+    if "error" in response_json:
+        return failed(f"Error de la API de Gemini en el lote: {response_json['error']}")
+    try:
+        llm_generated_data = _parse_full_exam_response_json(response_json)
+    except Exception as e:
+        return failed(str(e))
+    if not llm_generated_data:
+        return failed("El modelo de IA no pudo generar las preguntas. Inténtalo de nuevo.")
+    if settings.QUESTION_DEDUP_ENABLED:
+        _drop_near_duplicate_questions(llm_generated_data)
+    questions = _convert_llm_questions_to_output(llm_generated_data)
+    shortfall = _shortfall_message(_requested_counts(request), questions)
+    return GeneratedExam(
+        pdf_id=request.pdf_id, title=request.title, difficulty=request.difficulty,
+        questions=questions, config_used=_question_config_used(request), is_partial=bool(shortfall), warning=shortfall
+    )
+
+# --- Versiones del examen a partir de un único conjunto de preguntas ---
+async def generate_exam_variants_service(request: ExamVariantsRequest) -> GeneratedExamVariantsResponse:
+    """
+    Genera el conjunto de preguntas una sola vez (misma ruta que un examen normal: banco + LLM) y
+    construye localmente las N versiones con orden de preguntas y opciones barajados por semilla.
+    """
+    base_seed = request.seed if request.seed is not None else random.SystemRandom().randrange(2**31)
+    pool_exam = await generate_exam_questions_service(request)
+    response_fields = dict(
+        pdf_id=request.pdf_id, title=request.title, difficulty=request.difficulty, seed=base_seed,
+        config_used=pool_exam.config_used, is_partial=pool_exam.is_partial
+    )
+    if pool_exam.error or not pool_exam.questions:
+        return GeneratedExamVariantsResponse(
+            **response_fields, question_pool=[], variants=[],
+            error=pool_exam.error or "El modelo de IA no pudo generar las preguntas. Inténtalo de nuevo."
+        )
+
+    variants = build_exam_variants(
+        pool_exam.questions,
+        num_variants=request.num_variants,
+        base_seed=base_seed,
+        questions_per_variant=request.questions_per_variant,
+        shuffle_options=request.shuffle_options
+    )
+    return GeneratedExamVariantsResponse(**response_fields, question_pool=pool_exam.questions, variants=variants)
+
+# --- Llenado del banco de preguntas (en segundo plano tras la ingesta) ---
+async def fill_question_bank_for_pdf(
+    pdf_id: str,
+    user_id: str,
+    difficulties: Optional[List[str]] = None,
+    language: Optional[str] = None
+) -> int:
+    """
+    Completa el banco de preguntas del PDF hasta QUESTION_BANK_TARGET_PER_TYPE preguntas por tipo
+    para cada dificultad. Solo se generan las que faltan. Devuelve cuántas preguntas se añadieron.
+    """
+    language = language or settings.QUESTION_BANK_LANGUAGE
+    target = settings.QUESTION_BANK_TARGET_PER_TYPE
+    try:
+        pdf_text_content = await get_pdf_context_for_generation(pdf_id, user_id)
+    except Exception as e:
+        logger.error(f"QuestionBank Fill (pdf_id: {pdf_id}): No se pudo obtener el texto del PDF: {e}", exc_info=True)
+        return 0
+    if not pdf_text_content or len(pdf_text_content) < settings.EXAM_GEN_MIN_TEXT_LENGTH:
+        logger.warning(f"QuestionBank Fill (pdf_id: {pdf_id}): Texto insuficiente para llenar el banco.")
+        return 0
+
+    total_added = 0
+    for difficulty in difficulties or settings.QUESTION_BANK_DIFFICULTIES:
+        available = await asyncio.to_thread(question_bank.count_available, pdf_id, difficulty, language)
+        missing_counts = {
+            count_key: max(0, target - available.get(question_type.value, 0))
+            for count_key, question_type in _QUESTION_TYPE_BY_COUNT_KEY.items()
+        }
+        if not any(missing_counts.values()):
+            continue
+        try:
+            llm_generated_data, _ = await generate_questions_via_parallel_shards(
+                text_content=pdf_text_content,
+                difficulty=difficulty,
+                language=language,
+                model_id_exam_gen=settings.DEFAULT_GEMINI_MODEL_EXAM_GEN,
+                pdf_id=pdf_id,
+                shard_size=settings.QUESTION_BANK_SHARD_SIZE,
+                **missing_counts
+            )
+        except Exception as e:
+            logger.warning(f"QuestionBank Fill (pdf_id: {pdf_id}): Falló la generación para dificultad '{difficulty}': {e}")
+            continue
+        questions = _convert_llm_questions_to_output(llm_generated_data)
+        total_added += await asyncio.to_thread(question_bank.add_questions, pdf_id, questions, difficulty, language)
+
+    logger.info(f"QuestionBank Fill (pdf_id: {pdf_id}): {total_added} preguntas añadidas al banco.")
+    return total_added
+
 # --- Funciones para Regeneración de Preguntas (Adaptadas) ---
 
 def _parse_dict_to_question_output(question_data: Dict[str, Any]) -> QuestionOutput:
@@ -405,54 +1201,23 @@ async def _call_gemini_for_single_question_regeneration(
     existing_question_texts: List[str],
     difficulty: Literal["facil", "medio", "dificil"], # Usar Literal o tu Enum DifficultyLevel
     language: str, # Usar tu Enum Language
-    model_id: str  # Usar tu Enum ModelChoice
-) -> Optional[Dict[str, Any]]:
+    model_id: str,  # Usar tu Enum ModelChoice
+    pdf_id: Optional[str] = None
+) -> Optional[BaseModel]:
+    """Devuelve la nueva pregunta ya validada con el modelo LLMGenerated* del tipo pedido, o None si el LLM no respondió."""
     if not settings.GEMINI_API_KEY_BACKEND:
         logger.error("ExamGen LLM (Regen): GEMINI_API_KEY_BACKEND no está configurado.")
         raise ValueError("Clave API de Gemini no configurada para el backend.")
 
-    single_question_response_schema: Dict[str, Any] = {"type": "OBJECT", "properties": {}}
-    llm_type_description = ""
-
-    if question_type_to_regenerate == QuestionType.TRUE_FALSE:
-        llm_type_description = "Verdadero/Falso"
-        single_question_response_schema["properties"] = {
-            "question_text": {"type": "STRING"}, "answer": {"type": "BOOLEAN"}, "explanation": {"type": "STRING"}
-        }
-        single_question_response_schema["required"] = ["question_text", "answer"]
-    elif question_type_to_regenerate == QuestionType.MULTIPLE_CHOICE:
-        llm_type_description = "Opción Múltiple"
-        single_question_response_schema["properties"] = {
-            "question_text": {"type": "STRING"}, 
-            "options": {"type": "ARRAY", "items": {"type": "STRING"}},
-            "correct_option_text": {"type": "STRING"},
-            "explanation": {"type": "STRING"}
-        }
-        single_question_response_schema["required"] = ["question_text", "options", "correct_option_text"]
-    elif question_type_to_regenerate == QuestionType.OPEN:
-        llm_type_description = "Abierta"
-        single_question_response_schema["properties"] = {
-            "question_text": {"type": "STRING"}, "explanation_or_answer_guide": {"type": "STRING"}
-        }
-        single_question_response_schema["required"] = ["question_text"]
-    elif question_type_to_regenerate == QuestionType.FILL_IN_THE_BLANK: # <--- AÑADIDO
-        llm_type_description = "Completar Espacios"
-        single_question_response_schema["properties"] = {
-            "question_text_with_placeholders": {"type": "STRING", "description": "Texto con placeholders como __BLANK__."},
-            "correct_answers": {"type": "ARRAY", "items": {"type": "STRING"}, "description": "Lista de respuestas en orden."},
-            "explanation": {"type": "STRING", "description": "Explicación (opcional)."}
-        }
-        single_question_response_schema["required"] = ["question_text_with_placeholders", "correct_answers"]
-    else:
+    single_question_template = get_single_question_template(question_type_to_regenerate)
+    if single_question_template is None:
         logger.error(f"ExamGen LLM (Regen): Tipo de pregunta no soportado: {question_type_to_regenerate.value}")
         return None
+    single_question_response_schema, llm_type_description = single_question_template
 
     existing_questions_str = "\n".join([f"- '{q_text}'" for q_text in existing_question_texts]) if existing_question_texts else "Ninguna."
 
-    prompt_parts = [
-        f"Eres un asistente experto en crear preguntas de examen en idioma '{language}' con dificultad '{difficulty}'.",
-        f"Tarea: Genera UNA NUEVA pregunta de tipo '{llm_type_description}'.",
-        "Contexto del PDF para basar la pregunta:\n------\n", text_content, "\n------\n",
+    regeneration_constraints = [
         "RESTRICCIONES IMPORTANTES:",
         f"1. La NUEVA pregunta DEBE SER SIGNIFICATIVAMENTE DIFERENTE a esta PREGUNTA ORIGINAL: '{original_question_text}'.",
         f"2. La NUEVA pregunta también debe ser diferente y NO REDUNDANTE con estas OTRAS PREGUNTAS YA EXISTENTES:\n{existing_questions_str}",
@@ -461,52 +1226,67 @@ async def _call_gemini_for_single_question_regeneration(
         "5. Para Completar Espacios: usa '__BLANK__' para cada espacio. 'correct_answers' debe ser una lista con las respuestas en el orden de los '__BLANK__'.", # <--- AÑADIDO
         f"Responde ÚNICAMENTE con un objeto JSON que se adhiera al schema definido para una pregunta de tipo '{llm_type_description}'. No incluyas texto adicional fuera del JSON."
     ]
-    prompt = "\n".join(prompt_parts)
 
-    payload = {
-        "contents": [{"role": "user", "parts": [{"text": prompt}]}],
-        "generationConfig": {
-            "responseMimeType": "application/json",
-            "responseSchema": single_question_response_schema,
-            "temperature": settings.EXAM_GEN_LLM_TEMPERATURE, 
-        }
-    }
+    def build_prompt(include_text: bool) -> str:
+        prompt_parts = [
+            f"Eres un asistente experto en crear preguntas de examen en idioma '{language}' con dificultad '{difficulty}'.",
+            f"Tarea: Genera UNA NUEVA pregunta de tipo '{llm_type_description}'.",
+        ]
+        if include_text:
+            prompt_parts.extend(["Contexto del PDF para basar la pregunta:\n------\n", text_content, "\n------\n"])
+        else:
+            prompt_parts.append("Basa la pregunta en el texto de referencia del documento proporcionado en el contexto.")
+        prompt_parts.extend(regeneration_constraints)
+        return "\n".join(prompt_parts)
+
+    def build_payload(cache_name: Optional[str]) -> Dict[str, Any]:
+        return _build_generate_content_payload(build_prompt(include_text=not cache_name), single_question_response_schema, cache_name)
     
     # model_id ya es del tipo ModelChoice (enum) si viene de QuestionConfigForExam
     # o un string si viene de la request original. El schema de Gemini espera string.
     effective_model_id = model_id.value if hasattr(model_id, 'value') else model_id
     effective_model_id = effective_model_id or settings.DEFAULT_GEMINI_MODEL_EXAM_GEN
 
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{effective_model_id}:generateContent?key={settings.GEMINI_API_KEY_BACKEND}"
+    api_url = f"{settings.GEMINI_API_BASE_URL}/models/{effective_model_id}:generateContent?key={settings.GEMINI_API_KEY_BACKEND}"
 
-    logger.debug(f"ExamGen LLM (Regen): Enviando payload a Gemini ({effective_model_id}) para regenerar tipo '{question_type_to_regenerate.value}'. Prompt (primeros 300 chars): {prompt[:300]}...")
+    logger.debug(f"ExamGen LLM (Regen): Enviando payload a Gemini ({effective_model_id}) para regenerar tipo '{question_type_to_regenerate.value}'. Texto de referencia: {len(text_content)} chars.")
 
     async with httpx.AsyncClient(timeout=settings.EXAM_GEN_LLM_TIMEOUT_SECONDS) as client:
         try:
-            response = await client.post(api_url, json=payload)
+            response = await context_cache_manager.post_generate_content(client, api_url, build_payload, pdf_id, text_content, effective_model_id)
             response.raise_for_status()
-            response_json = response.json()
-
-            if (response_json.get("candidates") and response_json["candidates"][0].get("content") and
-                response_json["candidates"][0]["content"].get("parts") and response_json["candidates"][0]["content"]["parts"][0].get("text")):
-                json_text = response_json["candidates"][0]["content"]["parts"][0]["text"]
-                logger.debug(f"ExamGen LLM (Regen): Raw JSON text from Gemini: {json_text}")
-                return json.loads(json_text)
-            else:
-                logger.error(f"ExamGen LLM (Regen): Solicitud bloqueada o estructura de respuesta inesperada. Respuesta: {response_json}")
-                return None
+            llm_model = SINGLE_QUESTION_MODELS[question_type_to_regenerate]
+            try:
+                return parse_generate_content_bytes(response.content, llm_model)
+            except ValidationError as ve:
+                response_json = response.json()
+                if not (response_json.get("candidates") and response_json["candidates"][0].get("content") and
+                        response_json["candidates"][0]["content"].get("parts") and response_json["candidates"][0]["content"]["parts"][0].get("text")):
+                    logger.error(f"ExamGen LLM (Regen): Solicitud bloqueada o estructura de respuesta inesperada. Respuesta: {response_json}")
+                    return None
+                logger.error(f"ExamGen LLM (Regen): Respuesta con formato inesperado para tipo '{question_type_to_regenerate.value}': {ve}. Texto: {response.text[:1000]}")
+                raise ValueError(f"Respuesta LLM para tipo '{question_type_to_regenerate.value}' no tiene formato esperado: {str(ve)}") from ve
         except httpx.HTTPStatusError as e:
             logger.error(f"ExamGen LLM (Regen): HTTP error: {e.response.status_code} - {e.response.text}", exc_info=True)
             raise Exception(f"Error de API Gemini al regenerar ({e.response.status_code}): {e.response.text}") from e
-        except (json.JSONDecodeError, ValidationError) as e: 
+        except json.JSONDecodeError as e: # Antes que ValueError, de la que es subclase
             raw_text_response = "No disponible"
             if 'response' in locals() and hasattr(response, 'text'): raw_text_response = response.text
             logger.error(f"ExamGen LLM (Regen): Fallo al parsear JSON de LLM. Error: {e}. Texto: {raw_text_response}", exc_info=True)
             raise Exception("Error procesando respuesta del modelo IA para regeneración.") from e
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"ExamGen LLM (Regen): Error inesperado: {e}", exc_info=True)
             raise Exception(f"Error inesperado contactando servicio IA para regeneración: {str(e)}") from e
 
+async def _regeneration_context(pdf_id: str, user_id: str, pdf_text_content: str) -> str:
+    # Si el contexto del examen se puede cachear en Gemini se reutiliza el mismo contenido cacheado
+    # que la generación del examen; si no, se envía un extracto más pequeño que cubra todo el documento.
+    if context_cache_manager.should_cache(pdf_text_content):
+        return pdf_text_content
+    return await get_pdf_context_for_generation(pdf_id, user_id, token_budget=settings.EXAM_GEN_REGEN_CONTEXT_TOKEN_BUDGET)
+
 async def regenerate_one_question_service(request: RegenerateQuestionRequest) -> Optional[QuestionOutput]:
     logger.info(f"ExamGen Service (Regen): Iniciando regeneración para PDF ID: {request.pdf_id}, Pregunta Original ID: {request.question_to_regenerate.get('id', 'N/A')}")
 
@@ -522,15 +1302,16 @@ async def regenerate_one_question_service(request: RegenerateQuestionRequest) ->
                     except ValueError as ve_parse:
                         logger.warning(f"ExamGen Service (Regen): Omitiendo pregunta existente (ID: {q_data.get('id')}) por error de parseo: {ve_parse}")
         
-        existing_question_texts = [q.text for q in existing_questions_parsed]
+        # Solo las preguntas más parecidas a la original se envían como ejemplos a evitar.
+        existing_question_texts = select_similar_negatives([original_question_parsed.text], [q.text for q in existing_questions_parsed])
 
-        pdf_text_content = await get_pdf_content_for_exam_generation(request.pdf_id, request.exam_config.user_id)
+        pdf_text_content = await get_pdf_context_for_generation(request.pdf_id, request.exam_config.user_id)
         min_text_length = settings.EXAM_GEN_MIN_TEXT_LENGTH 
         if not pdf_text_content or len(pdf_text_content) < min_text_length:
             logger.error(f"ExamGen Service (Regen): Contenido del PDF para {request.pdf_id} es muy corto (longitud: {len(pdf_text_content or '')}) o no disponible.")
             raise ValueError(f"Contenido del PDF es insuficiente para regenerar la pregunta (requerido: {min_text_length} chars).")
 
-        context_for_llm = pdf_text_content[:10000] # Ajusta según necesidad y límites del modelo
+        context_for_llm = await _regeneration_context(request.pdf_id, request.exam_config.user_id, pdf_text_content)
 
         llm_generated_single_q_data = await _call_gemini_for_single_question_regeneration(
             text_content=context_for_llm,
@@ -539,7 +1320,8 @@ async def regenerate_one_question_service(request: RegenerateQuestionRequest) ->
             existing_question_texts=existing_question_texts,
             difficulty=request.exam_config.difficulty, # Ya es Enum
             language=request.exam_config.language,     # Ya es Enum
-            model_id=request.exam_config.model_id      # Ya es Enum o None
+            model_id=request.exam_config.model_id,     # Ya es Enum o None
+            pdf_id=request.pdf_id
         )
 
         if not llm_generated_single_q_data:
@@ -552,14 +1334,14 @@ async def regenerate_one_question_service(request: RegenerateQuestionRequest) ->
         
         try:
             if q_type_to_parse_llm == QuestionType.TRUE_FALSE:
-                llm_q = LLMGeneratedTrueFalse(**llm_generated_single_q_data)
+                llm_q = llm_generated_single_q_data
                 regenerated_question_output = TrueFalseQuestionOutput(
                     id=new_question_id, text=llm_q.question_text, 
                     correct_answer=llm_q.answer, explanation=llm_q.explanation,
                     type=QuestionType.TRUE_FALSE 
                 )
             elif q_type_to_parse_llm == QuestionType.MULTIPLE_CHOICE:
-                llm_q = LLMGeneratedMultipleChoice(**llm_generated_single_q_data)
+                llm_q = llm_generated_single_q_data
                 correct_idx = -1
                 try:
                     norm_opts_llm = [opt.strip().lower() for opt in llm_q.options]
@@ -575,14 +1357,14 @@ async def regenerate_one_question_service(request: RegenerateQuestionRequest) ->
                     type=QuestionType.MULTIPLE_CHOICE
                 )
             elif q_type_to_parse_llm == QuestionType.OPEN:
-                llm_q = LLMGeneratedOpenQuestion(**llm_generated_single_q_data)
+                llm_q = llm_generated_single_q_data
                 regenerated_question_output = OpenQuestionOutput(
                     id=new_question_id, text=llm_q.question_text, 
                     explanation=llm_q.explanation_or_answer_guide,
                     type=QuestionType.OPEN
                 )
             elif q_type_to_parse_llm == QuestionType.FILL_IN_THE_BLANK: # <--- AÑADIDO
-                llm_q = LLMGeneratedFillInTheBlank(**llm_generated_single_q_data)
+                llm_q = llm_generated_single_q_data
                 regenerated_question_output = FillInTheBlankQuestionOutput(
                     id=new_question_id,
                     text=llm_q.question_text_with_placeholders,
@@ -615,3 +1397,123 @@ async def regenerate_one_question_service(request: RegenerateQuestionRequest) ->
         logger.error(f"ExamGen Service (Regen): Error inesperado (PDF: {request.pdf_id}): {e}", exc_info=True)
         raise RuntimeError(f"Error interno inesperado al regenerar la pregunta: {str(e)}")
 
+# --- Regeneración en lote de varias preguntas ---
+_FIELD_BY_QUESTION_TYPE = {
+    QuestionType.TRUE_FALSE: "true_false_questions",
+    QuestionType.MULTIPLE_CHOICE: "multiple_choice_questions",
+    QuestionType.OPEN: "open_questions",
+    QuestionType.FILL_IN_THE_BLANK: "fill_in_the_blank_questions",
+}
+_COUNT_KEY_BY_FIELD = {field_name: count_key for count_key, field_name in _SHARD_FIELDS}
+
+def _batch_regeneration_instructions(original_texts: List[str], existing_texts: List[str]) -> List[str]:
+    originals_str = "\n".join(f"- '{text}'" for text in original_texts)
+    existing_str = "\n".join(f"- '{text}'" for text in existing_texts) if existing_texts else "Ninguna."
+    return [
+        "RESTRICCIONES DE REGENERACIÓN:",
+        f"6. Las nuevas preguntas REEMPLAZAN a las siguientes y DEBEN SER SIGNIFICATIVAMENTE DIFERENTES a ellas:\n{originals_str}",
+        f"7. Tampoco deben ser redundantes con estas OTRAS PREGUNTAS YA EXISTENTES:\n{existing_str}",
+        "8. Cada nueva pregunta debe explorar un aspecto del texto no cubierto por las preguntas anteriores ni por las demás preguntas nuevas.",
+    ]
+
+async def regenerate_questions_batch_service(request: BatchRegenerateQuestionsRequest) -> BatchRegenerateQuestionsResponse:
+    """
+    Regenera varias preguntas en una sola llamada estructurada al LLM. El texto del PDF y las
+    preguntas existentes se cargan y parsean una única vez; si el LLM devuelve menos preguntas
+    de algún tipo, se hace una llamada adicional solo por el faltante.
+    """
+    logger.info(f"ExamGen Service (Batch Regen): Iniciando regeneración de {len(request.questions_to_regenerate)} preguntas para PDF ID: {request.pdf_id}")
+
+    try:
+        originals: List[QuestionOutput] = [_parse_dict_to_question_output(q_data) for q_data in request.questions_to_regenerate]
+        original_ids = {q.id for q in originals}
+
+        existing_texts: List[str] = []
+        for q_data in request.existing_questions or []:
+            if q_data.get("id") in original_ids:
+                continue
+            try:
+                existing_texts.append(_parse_dict_to_question_output(q_data).text)
+            except ValueError as ve_parse:
+                logger.warning(f"ExamGen Service (Batch Regen): Omitiendo pregunta existente (ID: {q_data.get('id')}) por error de parseo: {ve_parse}")
+
+        pdf_text_content = await get_pdf_context_for_generation(request.pdf_id, request.exam_config.user_id)
+        min_text_length = settings.EXAM_GEN_MIN_TEXT_LENGTH
+        if not pdf_text_content or len(pdf_text_content) < min_text_length:
+            logger.error(f"ExamGen Service (Batch Regen): Contenido del PDF para {request.pdf_id} es muy corto (longitud: {len(pdf_text_content or '')}) o no disponible.")
+            raise ValueError(f"Contenido del PDF es insuficiente para regenerar las preguntas (requerido: {min_text_length} chars).")
+        context_for_llm = await _regeneration_context(request.pdf_id, request.exam_config.user_id, pdf_text_content)
+
+        pending_by_field: Dict[str, List[QuestionOutput]] = {}
+        for original in originals:
+            pending_by_field.setdefault(_FIELD_BY_QUESTION_TYPE[QuestionType(original.type)], []).append(original)
+
+        replacements: Dict[str, QuestionOutput] = {}
+        avoid_texts = select_similar_negatives([q.text for q in originals], existing_texts)
+        similarity_index = QuestionSimilarityIndex(corpus_texts=_similarity_corpus(pdf_text_content))
+        similarity_index.extend(existing_texts + [q.text for q in originals])
+        # Primera llamada para todo el lote; la segunda (si hace falta) solo para los faltantes.
+        for attempt in range(2):
+            if not pending_by_field:
+                break
+            counts = {count_key: 0 for count_key, _ in _SHARD_FIELDS}
+            for field_name, pending in pending_by_field.items():
+                counts[_COUNT_KEY_BY_FIELD[field_name]] = len(pending)
+            pending_originals = [q for pending in pending_by_field.values() for q in pending]
+
+            try:
+                llm_generated_data = await generate_questions_via_gemini_api(
+                    text_content=context_for_llm,
+                    difficulty=request.exam_config.difficulty,
+                    language=request.exam_config.language,
+                    model_id_exam_gen=request.exam_config.model_id,
+                    pdf_id=request.pdf_id,
+                    extra_instructions=_batch_regeneration_instructions([q.text for q in pending_originals], avoid_texts),
+                    **counts
+                )
+            except Exception as e:
+                logger.warning(f"ExamGen Service (Batch Regen): Intento {attempt + 1} falló: {e}")
+                continue
+            if not llm_generated_data:
+                continue
+
+            for field_name in list(pending_by_field):
+                pending = pending_by_field[field_name]
+                for q_data in getattr(llm_generated_data, field_name) or []:
+                    if not pending:
+                        break
+                    new_question = _llm_question_to_output(field_name, q_data)
+                    if new_question is None:
+                        continue
+                    if settings.QUESTION_DEDUP_ENABLED and similarity_index.find_near_duplicate(new_question.text) is not None:
+                        logger.info(f"ExamGen Service (Batch Regen): Pregunta casi duplicada descartada: '{new_question.text[:80]}'")
+                        continue
+                    replacements[pending.pop(0).id] = new_question
+                    similarity_index.add(new_question.text)
+                    avoid_texts.append(new_question.text)
+                if not pending:
+                    del pending_by_field[field_name]
+
+        results = []
+        for original in originals:
+            new_question = replacements.get(original.id)
+            if new_question is None:
+                results.append(RegeneratedQuestionResult(original_id=original.id, error="El modelo de IA no devolvió una pregunta válida para reemplazar esta pregunta."))
+            else:
+                results.append(RegeneratedQuestionResult(original_id=original.id, question=new_question))
+
+        if not replacements:
+            raise RuntimeError("El modelo de IA no pudo regenerar ninguna de las preguntas solicitadas.")
+
+        logger.info(f"ExamGen Service (Batch Regen): {len(replacements)}/{len(originals)} preguntas regeneradas para PDF: {request.pdf_id}")
+        return BatchRegenerateQuestionsResponse(pdf_id=request.pdf_id, results=results)
+
+    except ValueError as ve:
+        logger.warning(f"ExamGen Service (Batch Regen): ValueError (PDF: {request.pdf_id}): {str(ve)}", exc_info=True)
+        raise ve
+    except RuntimeError as rte:
+        logger.error(f"ExamGen Service (Batch Regen): RuntimeError (PDF: {request.pdf_id}): {str(rte)}", exc_info=True)
+        raise rte
+    except Exception as e:
+        logger.error(f"ExamGen Service (Batch Regen): Error inesperado (PDF: {request.pdf_id}): {e}", exc_info=True)
+        raise RuntimeError(f"Error interno inesperado al regenerar las preguntas: {str(e)}")
@@ -0,0 +1,190 @@
+# ia_backend/app/services/exam_prompt_registry.py
+"""
+Registro precompilado de schemas de respuesta, plantillas de prompt y validadores para la
+generación de exámenes. Todo se calcula una vez por combinación de tipos/cantidades de preguntas
+(o por tipo, en la regeneración) y se reutiliza en llamadas posteriores.
+
+Los schemas devueltos son compartidos: no deben modificarse.
+"""
+from functools import lru_cache
+from typing import Any, Dict, Generic, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, Field, Json, TypeAdapter
+
+from app.models.schemas import (
+    LLMGeneratedFillInTheBlank,
+    LLMGeneratedMultipleChoice,
+    LLMGeneratedOpenQuestion,
+    LLMGeneratedTrueFalse,
+    QuestionType,
+)
+
+T = TypeVar("T")
+
+_QUESTION_ITEM_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "true_false_questions": {
+        "type": "OBJECT",
+        "properties": {"question_text": {"type": "STRING"}, "answer": {"type": "BOOLEAN"}, "explanation": {"type": "STRING"}},
+        "required": ["question_text", "answer"],
+    },
+    "multiple_choice_questions": {
+        "type": "OBJECT",
+        "properties": {
+            "question_text": {"type": "STRING"},
+            "options": {"type": "ARRAY", "items": {"type": "STRING"}},
+            "correct_option_text": {"type": "STRING"},
+            "explanation": {"type": "STRING"},
+        },
+        "required": ["question_text", "options", "correct_option_text"],
+    },
+    "open_questions": {
+        "type": "OBJECT",
+        "properties": {"question_text": {"type": "STRING"}, "explanation_or_answer_guide": {"type": "STRING"}},
+        "required": ["question_text"],
+    },
+    "fill_in_the_blank_questions": {
+        "type": "OBJECT",
+        "properties": {
+            "question_text_with_placeholders": {"type": "STRING", "description": "Texto con placeholders como __BLANK__."},
+            "correct_answers": {"type": "ARRAY", "items": {"type": "STRING"}, "description": "Lista de respuestas en orden."},
+            "explanation": {"type": "STRING", "description": "Explicación (opcional)."},
+        },
+        "required": ["question_text_with_placeholders", "correct_answers"],
+    },
+}
+
+_ARRAY_DESCRIPTIONS = {
+    "true_false_questions": "Lista de {n} preguntas Verdadero/Falso.",
+    "multiple_choice_questions": "Lista de {n} preguntas Opción Múltiple.",
+    "open_questions": "Lista de {n} preguntas abiertas.",
+    "fill_in_the_blank_questions": "Lista de {n} preguntas para completar espacios.",
+}
+
+_PROMPT_COUNT_LINES = {
+    "true_false_questions": "   - {n} preguntas de Verdadero/Falso.",
+    "multiple_choice_questions": "   - {n} preguntas de Opción Múltiple (cada una con 3 a 4 opciones).",
+    "open_questions": "   - {n} preguntas Abiertas.",
+    "fill_in_the_blank_questions": "   - {n} preguntas para Completar Espacios (usa '__BLANK__' para los espacios).",
+}
+
+_FULL_EXAM_TEXT_PREFIX = "\n\nTexto de referencia para basar las preguntas:\n------\n\n"
+_FULL_EXAM_TEXT_SUFFIX = "\n\n------\n"
+_FULL_EXAM_CLOSING = "\nResponde ÚNICAMENTE con un objeto JSON que se adhiera al esquema proporcionado."
+
+
+@lru_cache(maxsize=256)
+def get_full_exam_response_schema(num_vf: int, num_mc: int, num_open: int, num_fitb: int) -> Dict[str, Any]:
+    counts = {
+        "true_false_questions": num_vf,
+        "multiple_choice_questions": num_mc,
+        "open_questions": num_open,
+        "fill_in_the_blank_questions": num_fitb,
+    }
+    properties = {
+        field_name: {"type": "ARRAY", "description": _ARRAY_DESCRIPTIONS[field_name].format(n=count), "items": _QUESTION_ITEM_SCHEMAS[field_name]}
+        for field_name, count in counts.items() if count > 0
+    }
+    return {"type": "OBJECT", "properties": properties}
+
+
+@lru_cache(maxsize=512)
+def _full_exam_prompt_head(num_vf: int, num_mc: int, num_open: int, num_fitb: int, difficulty: str, language: str, text_inline: bool) -> str:
+    source_reference = "el siguiente texto" if text_inline else "el texto de referencia del documento proporcionado en el contexto"
+    prompt_parts = [
+        f"Eres un asistente experto en crear preguntas de examen en idioma '{language}' con un nivel de dificultad '{difficulty}'. Basándote ESTRICTAMENTE en {source_reference}, genera preguntas de examen.",
+        "Instrucciones Importantes para la Generación de Preguntas:",
+        "1. Diversidad de Contenido: Asegúrate de que cada pregunta evalúe un aspecto o concepto DIFERENTE del texto. Evita redundancias.",
+        "2. Cantidad Exacta: Debes generar exactamente:",
+    ]
+    for field_name, count in zip(_PROMPT_COUNT_LINES, (num_vf, num_mc, num_open, num_fitb)):
+        if count > 0:
+            prompt_parts.append(_PROMPT_COUNT_LINES[field_name].format(n=count))
+    prompt_parts.extend([
+        "3. Coherencia y Claridad: Preguntas claras y apropiadas para la dificultad.",
+        "4. Formato Opción Múltiple: 'correct_option_text' DEBE ser una de las cadenas en 'options'.",
+        "5. Formato Completar Espacios: 'question_text_with_placeholders' debe usar '__BLANK__' para cada espacio a completar. 'correct_answers' debe ser una lista con las respuestas en el orden de los '__BLANK__'.",
+    ])
+    return "\n".join(prompt_parts)
+
+
+def render_full_exam_prompt(
+    text_content: Optional[str],
+    num_vf: int,
+    num_mc: int,
+    num_open: int,
+    num_fitb: int,
+    difficulty: str,
+    language: str,
+    extra_instructions: Optional[List[str]] = None,
+) -> str:
+    """Completa la plantilla cacheada con las instrucciones extra y el texto (None = texto en contenido cacheado)."""
+    pieces = [_full_exam_prompt_head(num_vf, num_mc, num_open, num_fitb, difficulty, language, text_content is not None)]
+    if extra_instructions:
+        pieces.append("\n")
+        pieces.append("\n".join(extra_instructions))
+    if text_content is not None:
+        pieces.extend((_FULL_EXAM_TEXT_PREFIX, text_content, _FULL_EXAM_TEXT_SUFFIX))
+    pieces.append(_FULL_EXAM_CLOSING)
+    return "".join(pieces)
+
+
+# --- Regeneración de una pregunta ---
+_SINGLE_QUESTION_FIELD_BY_TYPE = {
+    QuestionType.TRUE_FALSE: "true_false_questions",
+    QuestionType.MULTIPLE_CHOICE: "multiple_choice_questions",
+    QuestionType.OPEN: "open_questions",
+    QuestionType.FILL_IN_THE_BLANK: "fill_in_the_blank_questions",
+}
+_SINGLE_QUESTION_DESCRIPTIONS = {
+    QuestionType.TRUE_FALSE: "Verdadero/Falso",
+    QuestionType.MULTIPLE_CHOICE: "Opción Múltiple",
+    QuestionType.OPEN: "Abierta",
+    QuestionType.FILL_IN_THE_BLANK: "Completar Espacios",
+}
+SINGLE_QUESTION_MODELS: Dict[QuestionType, Type[BaseModel]] = {
+    QuestionType.TRUE_FALSE: LLMGeneratedTrueFalse,
+    QuestionType.MULTIPLE_CHOICE: LLMGeneratedMultipleChoice,
+    QuestionType.OPEN: LLMGeneratedOpenQuestion,
+    QuestionType.FILL_IN_THE_BLANK: LLMGeneratedFillInTheBlank,
+}
+
+
+def get_single_question_template(question_type: QuestionType) -> Optional[Tuple[Dict[str, Any], str]]:
+    """(schema de respuesta, descripción del tipo para el prompt) de una pregunta suelta. None si el tipo no se soporta."""
+    field_name = _SINGLE_QUESTION_FIELD_BY_TYPE.get(question_type)
+    if field_name is None:
+        return None
+    return _QUESTION_ITEM_SCHEMAS[field_name], _SINGLE_QUESTION_DESCRIPTIONS[question_type]
+
+
+# --- Validación directa de la respuesta de Gemini (un solo parseo desde los bytes) ---
+class GeminiTextPart(BaseModel, Generic[T]):
+    text: Json[T]
+
+
+class GeminiContent(BaseModel, Generic[T]):
+    parts: List[GeminiTextPart[T]] = Field(min_length=1)
+
+
+class GeminiCandidate(BaseModel, Generic[T]):
+    content: GeminiContent[T]
+    finishReason: Optional[str] = None
+
+
+class GeminiGenerateContentResponse(BaseModel, Generic[T]):
+    candidates: List[GeminiCandidate[T]] = Field(min_length=1)
+
+
+@lru_cache(maxsize=None)
+def get_response_adapter(model_type: Type[T]) -> TypeAdapter:
+    """TypeAdapter cacheado que valida el sobre generateContent y el JSON anidado en `text` de una pasada."""
+    return TypeAdapter(GeminiGenerateContentResponse[model_type])
+
+
+def parse_generate_content_bytes(raw_response: bytes, model_type: Type[T]) -> T:
+    """
+    Devuelve el primer `text` de la respuesta ya validado como `model_type`, sin pasar por dicts intermedios.
+    Lanza pydantic.ValidationError si el sobre o el JSON del modelo no son válidos.
+    """
+    envelope = get_response_adapter(model_type).validate_json(raw_response)
+    return envelope.candidates[0].content.parts[0].text
@@ -0,0 +1,95 @@
+# ia_backend/app/services/exam_variants.py
+import logging
+import random
+import re
+import string
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.models.schemas import (
+    ExamVariant,
+    MultipleChoiceQuestionOutput,
+    QuestionOutput,
+    QuestionType,
+)
+
+logger = logging.getLogger(__name__)
+
+# Opciones que dependen de su posición ("todas las anteriores") se mantienen al final al barajar.
+_POSITIONAL_OPTION_PATTERN = re.compile(
+    r"\b(todas las anteriores|ninguna de las anteriores|ambas|all of the above|none of the above|both)\b",
+    re.IGNORECASE,
+)
+
+
+def variant_label(index: int) -> str:
+    """0 -> 'A', 1 -> 'B', ... 25 -> 'Z'."""
+    return string.ascii_uppercase[index] if index < len(string.ascii_uppercase) else str(index + 1)
+
+
+def variant_seed(base_seed: int, index: int) -> int:
+    return (base_seed * 1_000_003 + index) & 0x7FFFFFFF
+
+
+def shuffle_multiple_choice(question: MultipleChoiceQuestionOutput, rng: random.Random) -> Tuple[MultipleChoiceQuestionOutput, List[int]]:
+    """
+    Devuelve una copia de la pregunta con las opciones barajadas y `correct_answer_index` reasignado,
+    junto con el orden aplicado (índices de las opciones originales en el orden mostrado).
+    """
+    movable = [i for i, option in enumerate(question.options) if not _POSITIONAL_OPTION_PATTERN.search(option)]
+    pinned = [i for i in range(len(question.options)) if i not in movable]
+    rng.shuffle(movable)
+    order = movable + pinned
+    shuffled = question.model_copy(update={
+        "options": [question.options[i] for i in order],
+        "correct_answer_index": order.index(question.correct_answer_index),
+    })
+    return shuffled, order
+
+
+def _stratified_subset(questions: Sequence[QuestionOutput], size: int, rng: random.Random) -> List[QuestionOutput]:
+    """Subconjunto de `size` preguntas que conserva la proporción de cada tipo (método del mayor resto)."""
+    by_type: Dict[QuestionType, List[QuestionOutput]] = {}
+    for question in questions:
+        by_type.setdefault(QuestionType(question.type), []).append(question)
+    total = len(questions)
+    quotas = {question_type: len(group) * size / total for question_type, group in by_type.items()}
+    allocation = {question_type: int(quota) for question_type, quota in quotas.items()}
+    remaining = size - sum(allocation.values())
+    for question_type in sorted(quotas, key=lambda t: quotas[t] - allocation[t], reverse=True)[:remaining]:
+        allocation[question_type] += 1
+    subset: List[QuestionOutput] = []
+    for question_type, group in by_type.items():
+        subset.extend(rng.sample(group, min(allocation[question_type], len(group))))
+    return subset
+
+
+def build_exam_variants(
+    question_pool: Sequence[QuestionOutput],
+    num_variants: int,
+    base_seed: int,
+    questions_per_variant: Optional[int] = None,
+    shuffle_options: bool = True,
+) -> List[ExamVariant]:
+    """
+    Construye `num_variants` versiones del examen a partir del mismo conjunto de preguntas, sin llamar al LLM.
+    Cada versión tiene su propia semilla (derivada de `base_seed`), un orden de preguntas distinto, opciones
+    de opción múltiple barajadas y, opcionalmente, un subconjunto proporcional por tipo. Las preguntas conservan
+    su id del conjunto original para poder corregir todas las versiones con la misma clave.
+    """
+    variants: List[ExamVariant] = []
+    subset_size = min(questions_per_variant, len(question_pool)) if questions_per_variant else len(question_pool)
+    for index in range(num_variants):
+        seed = variant_seed(base_seed, index)
+        rng = random.Random(seed)
+        questions = _stratified_subset(question_pool, subset_size, rng) if subset_size < len(question_pool) else list(question_pool)
+        rng.shuffle(questions)
+
+        option_orders: Dict[str, List[int]] = {}
+        if shuffle_options:
+            for position, question in enumerate(questions):
+                if isinstance(question, MultipleChoiceQuestionOutput):
+                    questions[position], option_orders[question.id] = shuffle_multiple_choice(question, rng)
+
+        variants.append(ExamVariant(label=variant_label(index), seed=seed, questions=questions, option_orders=option_orders))
+    logger.info(f"ExamVariants: {num_variants} versiones construidas con {subset_size} de {len(question_pool)} preguntas (semilla base {base_seed}).")
+    return variants
@@ -0,0 +1,77 @@
+# ia_backend/app/services/firestore_batches.py
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Límite de operaciones por WriteBatch de Firestore.
+FIRESTORE_MAX_BATCH_WRITES = 500
+
+# (etiqueta del llamador, p. ej. número de fila; referencia del documento; datos)
+WriteOperation = Tuple[Any, Any, Dict[str, Any]]
+
+
+def _commit_batch(db, operations: List[WriteOperation], merge: bool) -> None:
+    batch = db.batch()
+    for _, doc_ref, data in operations:
+        batch.set(doc_ref, data, merge=merge)
+    batch.commit()
+
+
+def write_in_batches(
+    db,
+    operations: Iterable[WriteOperation],
+    batch_size: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+    merge: bool = True,
+) -> Dict[str, Any]:
+    """
+    Escribe las operaciones con WriteBatch de hasta 500 documentos, con como máximo `max_concurrency`
+    lotes confirmándose a la vez. `operations` se consume de forma perezosa (puede ser un generador),
+    así que nunca hay más de `batch_size * (max_concurrency + 1)` operaciones en memoria.
+
+    Returns:
+        {"written": int, "batches": int, "failed": [(etiqueta, excepción), ...]}. Un lote fallido es
+        atómico: todas sus operaciones aparecen en `failed`.
+    """
+    batch_size = max(1, min(batch_size or settings.FIRESTORE_BATCH_SIZE, FIRESTORE_MAX_BATCH_WRITES))
+    max_concurrency = max(1, max_concurrency or settings.FIRESTORE_BATCH_MAX_CONCURRENCY)
+    written = 0
+    num_batches = 0
+    failed: List[Tuple[Any, Exception]] = []
+    pending: Dict[Future, List[WriteOperation]] = {}
+
+    def collect(done: Set[Future]) -> None:
+        nonlocal written
+        for future in done:
+            batch_operations = pending.pop(future)
+            error = future.exception()
+            if error is None:
+                written += len(batch_operations)
+            else:
+                logger.warning(f"Firestore: lote de {len(batch_operations)} escrituras fallido: {error}")
+                failed.extend((tag, error) for tag, _, _ in batch_operations)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        def submit(batch_operations: List[WriteOperation]) -> None:
+            nonlocal num_batches
+            if len(pending) >= max_concurrency:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[executor.submit(_commit_batch, db, batch_operations, merge)] = batch_operations
+            num_batches += 1
+
+        current: List[WriteOperation] = []
+        for operation in operations:
+            current.append(operation)
+            if len(current) >= batch_size:
+                submit(current)
+                current = []
+        if current:
+            submit(current)
+        collect(set(pending))
+
+    return {"written": written, "batches": num_batches, "failed": failed}
@@ -0,0 +1,166 @@
+# ia_backend/app/services/forms_sync_service.py
+import logging
+import re
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from firebase_admin import firestore
+
+from app.core.config import settings
+from app.services.firestore_batches import WriteOperation, write_in_batches
+from app.services.google_forms_service import get_forms_responses_service
+
+logger = logging.getLogger(__name__)
+
+_FORM_ID_PATTERN = re.compile(r"/forms/d/(?:e/)?([\w-]+)")
+_FRACTION_PATTERN = re.compile(r"\.(\d+)")
+
+
+def parse_rfc3339(value: str) -> datetime:
+    """Marca de tiempo de la API ("2024-05-28T16:49:03.123456789Z"); los nanosegundos se recortan a microsegundos."""
+    value = _FRACTION_PATTERN.sub(lambda m: "." + m.group(1)[:6].ljust(6, "0"), value.strip(), count=1)
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def form_id_for_exam(db, exam_id: str) -> str:
+    """form_id guardado en el examen al crear el formulario (o extraído de su enlace en exámenes anteriores)."""
+    exam_doc = db.collection('exams').document(exam_id).get()
+    if not exam_doc.exists:
+        raise ValueError(f"Examen {exam_id} no encontrado")
+    exam_data = exam_doc.to_dict() or {}
+    if exam_data.get('google_form_id'):
+        return exam_data['google_form_id']
+    match = _FORM_ID_PATTERN.search(exam_data.get('google_form_link') or "")
+    if not match:
+        raise ValueError(f"El examen {exam_id} no tiene un formulario de Google asociado")
+    return match.group(1)
+
+
+def _question_titles(form: Dict[str, Any]) -> Dict[str, str]:
+    """questionId -> título del item, que es la clave de las respuestas (la misma columna que exporta el CSV)."""
+    titles = {}
+    for item in form.get('items', []):
+        question = item.get('questionItem', {}).get('question', {})
+        if question.get('questionId'):
+            titles[question['questionId']] = item.get('title', question['questionId'])
+    return titles
+
+
+def _answer_text(answer: Dict[str, Any]) -> str:
+    values = [a.get('value', '') for a in answer.get('textAnswers', {}).get('answers', [])]
+    return ", ".join(values)
+
+
+def sync_form_responses(
+    exam_id: str,
+    group_id: str,
+    form_id: Optional[str] = None,
+    db=None,
+    forms_service=None,
+    page_size: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Trae de la API de Forms solo las respuestas nuevas o editadas desde la última sincronización y las
+    escribe por lotes en `usuarios/{id}/examAttempts/{exam_id}` (mismo formato que la importación CSV).
+
+    El estado por formulario (`exams/{exam_id}/formsSync/{form_id}`) guarda la marca de agua: el mayor
+    lastSubmittedTime ya sincronizado y los responseId con esa marca exacta. Cada sincronización pide
+    `timestamp >= marca` página a página y descarta esos ids. La marca solo avanza si todas las escrituras
+    se confirmaron, así que un fallo se reintenta entero en la siguiente sincronización (las escrituras son idempotentes).
+    """
+    db = db or firestore.client()
+    started = time.perf_counter()
+    form_id = form_id or form_id_for_exam(db, exam_id)
+    forms_service = forms_service or get_forms_responses_service()
+    page_size = page_size or settings.GOOGLE_FORMS_SYNC_PAGE_SIZE
+
+    state_ref = db.collection('exams').document(exam_id).collection('formsSync').document(form_id)
+    state_doc = state_ref.get()
+    state = (state_doc.to_dict() or {}) if state_doc.exists else {}
+    watermark: Optional[str] = state.get('watermark')
+    watermark_time = parse_rfc3339(watermark) if watermark else None
+    ids_at_watermark = set(state.get('response_ids_at_watermark') or [])
+
+    titles = _question_titles(forms_service.forms().get(formId=form_id).execute())
+    import_id = f"forms_{uuid.uuid4().hex[:12]}"
+    counters = {'fetched': 0, 'skipped': 0, 'pages': 0}
+    new_watermark = {'time': watermark_time, 'value': watermark, 'ids': set(ids_at_watermark)}
+
+    def pages() -> Iterator[List[Dict[str, Any]]]:
+        page_token = None
+        while True:
+            request_args = {'formId': form_id, 'pageSize': page_size}
+            if watermark:
+                request_args['filter'] = f"timestamp >= {watermark}"
+            if page_token:
+                request_args['pageToken'] = page_token
+            body = forms_service.forms().responses().list(**request_args).execute()
+            counters['pages'] += 1
+            yield body.get('responses', [])
+            page_token = body.get('nextPageToken')
+            if not page_token:
+                return
+
+    def operations() -> Iterator[WriteOperation]:
+        for page in pages():
+            counters['fetched'] += len(page)
+            for response in page:
+                response_id = response['responseId']
+                submitted = response.get('lastSubmittedTime') or response.get('createTime')
+                submitted_time = parse_rfc3339(submitted)
+                if watermark_time is not None and submitted_time == watermark_time and response_id in ids_at_watermark:
+                    counters['skipped'] += 1
+                    continue
+                if new_watermark['time'] is None or submitted_time > new_watermark['time']:
+                    new_watermark.update(time=submitted_time, value=submitted, ids={response_id})
+                elif submitted_time == new_watermark['time']:
+                    new_watermark['ids'].add(response_id)
+
+                answers = {titles.get(question_id, question_id): _answer_text(answer) for question_id, answer in response.get('answers', {}).items()}
+                # Sin correo recogido, el id de la respuesta mantiene el mismo intento si el alumno la edita.
+                student_id = response.get('respondentEmail') or f"forms_{response_id}"
+                attempt_ref = db.collection('usuarios').document(student_id).collection('examAttempts').document(exam_id)
+                yield response_id, attempt_ref, {
+                    'exam_id': exam_id,
+                    'group_id': group_id,
+                    'answers': answers,
+                    'imported_from_forms': True,
+                    'form_id': form_id,
+                    'form_response_id': response_id,
+                    'submitted_at': submitted,
+                    'imported_at': firestore.SERVER_TIMESTAMP,
+                    'import_id': import_id,
+                    'auto_graded': False,
+                }
+
+    outcome = write_in_batches(db, operations())
+    errors = [f"Respuesta {response_id}: {error}" for response_id, error in outcome['failed']]
+    if not errors and outcome['written']:
+        state_ref.set({
+            'form_id': form_id,
+            'group_id': group_id,
+            'watermark': new_watermark['value'],
+            'response_ids_at_watermark': sorted(new_watermark['ids']),
+            'synced_total': int(state.get('synced_total', 0)) + outcome['written'],
+            'last_import_id': import_id,
+            'updated_at': firestore.SERVER_TIMESTAMP,
+        })
+
+    result = {
+        'form_id': form_id,
+        'import_id': import_id,
+        'imported': outcome['written'],
+        'fetched': counters['fetched'],
+        'skipped': counters['skipped'],
+        'pages': counters['pages'],
+        'watermark': new_watermark['value'] if not errors else watermark,
+        'errors': errors,
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+    }
+    logger.info(
+        f"Forms sync (exam {exam_id}, form {form_id}): {result['imported']} respuestas nuevas de {result['fetched']} "
+        f"recibidas en {result['pages']} página(s), marca {result['watermark']}, {len(errors)} error(es)."
+    )
+    return result
@@ -0,0 +1,206 @@
+# ia_backend/app/services/gemini_context_cache.py
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+from pydantic import BaseModel
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# generateContent responde 404 cuando el contenido cacheado ya no existe; 400/403 solo cuentan si el error
+# menciona el contenido cacheado (expirado o sin permiso). Cualquier otro 400 es un error de la petición.
+_STALE_CACHE_MESSAGE_PATTERN = re.compile(r"cached[_\s]?content", re.IGNORECASE)
+
+
+def is_stale_cache_response(response: httpx.Response) -> bool:
+    """True si la respuesta indica que el contenido cacheado referenciado ya no se puede usar."""
+    if response.status_code == 404:
+        return True
+    if response.status_code in (400, 403):
+        try:
+            body = response.text
+        except Exception:  # respuesta en streaming aún no leída
+            return False
+        return bool(_STALE_CACHE_MESSAGE_PATTERN.search(body))
+    return False
+
+
+class CachedContextEntry(BaseModel):
+    name: str  # "cachedContents/{id}" devuelto por la API
+    pdf_id: str
+    text_hash: str
+    model: str
+    expire_at: float  # epoch en segundos
+
+
+def compute_text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _normalize_model_name(model_id: str) -> str:
+    return model_id if model_id.startswith("models/") else f"models/{model_id}"
+
+
+def _parse_expire_time(expire_time: Optional[str], fallback_ttl_seconds: int) -> float:
+    if not expire_time:
+        return time.time() + fallback_ttl_seconds
+    try:
+        # La API devuelve RFC3339 con hasta 9 decimales; fromisoformat admite como máximo 6.
+        value = re.sub(r"\.(\d{6})\d+", r".\1", expire_time.replace("Z", "+00:00"))
+        return datetime.fromisoformat(value).timestamp()
+    except Exception:
+        logger.warning(f"ContextCache: expireTime '{expire_time}' no reconocido. Se usa el TTL configurado.")
+        return time.time() + fallback_ttl_seconds
+
+
+class GeminiContextCacheManager:
+    """
+    Gestiona contenidos cacheados de Gemini (endpoint cachedContents) para el texto de los PDFs.
+
+    Cada entrada se identifica por (pdf_id, hash del texto, modelo): si el texto del PDF cambia
+    (re-ingesta) el hash cambia y se crea un contenido nuevo. Las entradas se recrean
+    automáticamente cuando están por expirar o cuando la API indica que ya no existen.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        ttl_seconds: Optional[int] = None,
+        refresh_margin_seconds: Optional[int] = None,
+        min_chars: Optional[int] = None,
+        enabled: Optional[bool] = None,
+    ):
+        self.base_url = (base_url or settings.GEMINI_API_BASE_URL).rstrip("/")
+        self.api_key = api_key if api_key is not None else settings.GEMINI_API_KEY_BACKEND
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.GEMINI_CONTEXT_CACHE_TTL_SECONDS
+        self.refresh_margin_seconds = refresh_margin_seconds if refresh_margin_seconds is not None else settings.GEMINI_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS
+        self.min_chars = min_chars if min_chars is not None else settings.GEMINI_CONTEXT_CACHE_MIN_CHARS
+        self.enabled = enabled if enabled is not None else settings.GEMINI_CONTEXT_CACHE_ENABLED
+        self._entries: Dict[Tuple[str, str, str], CachedContextEntry] = {}
+        self._locks: Dict[Tuple[str, str, str], asyncio.Lock] = {}
+
+    def _url(self, path: str) -> str:
+        return f"{self.base_url}/{path}?key={self.api_key}"
+
+    def _is_fresh(self, entry: CachedContextEntry) -> bool:
+        return entry.expire_at - self.refresh_margin_seconds > time.time()
+
+    def should_cache(self, text: str) -> bool:
+        return bool(self.enabled and self.api_key and text and len(text) >= self.min_chars)
+
+    async def get_or_create(self, pdf_id: str, text: str, model_id: str) -> Optional[str]:
+        """Devuelve el nombre del contenido cacheado para el texto, creándolo si hace falta. None si no se usa caché."""
+        if not pdf_id or not self.should_cache(text):
+            return None
+        model_name = _normalize_model_name(model_id)
+        key = (pdf_id, compute_text_hash(text), model_name)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+            if entry and self._is_fresh(entry):
+                return entry.name
+            if entry:
+                logger.info(f"ContextCache (pdf_id: {pdf_id}): Contenido '{entry.name}' expirado o por expirar. Se recrea.")
+                self._entries.pop(key, None)
+                await self._delete_remote(entry.name)
+            try:
+                entry = await self._create(pdf_id, key[1], model_name, text)
+            except Exception as e:
+                logger.warning(f"ContextCache (pdf_id: {pdf_id}): No se pudo crear el contenido cacheado ({e}). Se enviará el texto en línea.")
+                self._locks.pop(key, None)
+                return None
+            self._entries[key] = entry
+            return entry.name
+
+    async def _create(self, pdf_id: str, text_hash: str, model_name: str, text: str) -> CachedContextEntry:
+        body = {
+            "model": model_name,
+            "displayName": f"edupdf-{pdf_id}-{text_hash[:12]}",
+            "contents": [{
+                "role": "user",
+                "parts": [{"text": f"Texto de referencia del documento:\n------\n{text}\n------"}]
+            }],
+            "ttl": f"{self.ttl_seconds}s",
+        }
+        async with httpx.AsyncClient(timeout=settings.EXAM_GEN_LLM_TIMEOUT_SECONDS) as client:
+            response = await client.post(self._url("cachedContents"), json=body)
+            response.raise_for_status()
+            data = response.json()
+        entry = CachedContextEntry(
+            name=data["name"],
+            pdf_id=pdf_id,
+            text_hash=text_hash,
+            model=model_name,
+            expire_at=_parse_expire_time(data.get("expireTime"), self.ttl_seconds),
+        )
+        logger.info(f"ContextCache (pdf_id: {pdf_id}): Contenido cacheado creado '{entry.name}' para {model_name} ({len(text)} chars).")
+        return entry
+
+    async def _delete_remote(self, name: str) -> None:
+        try:
+            async with httpx.AsyncClient(timeout=30.0) as client:
+                response = await client.delete(self._url(name))
+                if response.status_code not in (200, 404):
+                    logger.warning(f"ContextCache: DELETE {name} respondió {response.status_code}: {response.text[:200]}")
+        except Exception as e:
+            logger.warning(f"ContextCache: No se pudo eliminar el contenido cacheado '{name}': {e}")
+
+    def discard(self, name: str) -> None:
+        """Olvida localmente (entrada y lock) un contenido cacheado que la API reportó como inexistente o expirado."""
+        for key, entry in list(self._entries.items()):
+            if entry.name == name:
+                self._entries.pop(key, None)
+                self._locks.pop(key, None)
+
+    async def invalidate_pdf(self, pdf_id: str) -> int:
+        """Elimina (local y remotamente) todos los contenidos cacheados de un PDF. Devuelve cuántos se eliminaron."""
+        removed = [entry for key, entry in self._entries.items() if key[0] == pdf_id]
+        for entry in removed:
+            self.discard(entry.name)
+            await self._delete_remote(entry.name)
+        if removed:
+            logger.info(f"ContextCache (pdf_id: {pdf_id}): {len(removed)} contenidos cacheados invalidados.")
+        return len(removed)
+
+    async def post_generate_content(
+        self,
+        client: httpx.AsyncClient,
+        api_url: str,
+        build_payload: Callable[[Optional[str]], Dict[str, Any]],
+        pdf_id: Optional[str],
+        text: str,
+        model_id: str,
+    ) -> httpx.Response:
+        """
+        Envía una petición generateContent usando el contenido cacheado del PDF cuando está disponible.
+
+        `build_payload(cache_name)` debe construir el payload completo: con `cache_name` el texto del PDF
+        no se incluye en el prompt y se referencia mediante "cachedContent"; con None se envía en línea.
+        Si la API indica que el contenido cacheado ya no existe, se recrea una vez y, si vuelve a fallar,
+        se reintenta con el texto en línea. La respuesta se devuelve sin llamar a raise_for_status().
+        """
+        cache_name = await self.get_or_create(pdf_id, text, model_id) if pdf_id else None
+        response = await client.post(api_url, json=build_payload(cache_name))
+        if cache_name and is_stale_cache_response(response):
+            logger.warning(f"ContextCache (pdf_id: {pdf_id}): generateContent respondió {response.status_code} con '{cache_name}'. Se recrea el contenido cacheado.")
+            self.discard(cache_name)
+            cache_name = await self.get_or_create(pdf_id, text, model_id)
+            response = await client.post(api_url, json=build_payload(cache_name))
+            if cache_name and is_stale_cache_response(response):
+                self.discard(cache_name)
+                response = await client.post(api_url, json=build_payload(None))
+        return response
+
+
+context_cache_manager = GeminiContextCacheManager()
+
+CACHED_CONTEXT_PROMPT_PLACEHOLDER = "(El texto del documento se proporciona como texto de referencia en el contexto.)"
+
@@ -20,6 +20,25 @@ def get_forms_service():
         logger.error(f"Error inicializando el servicio de Google Forms: {e}")
         raise HTTPException(status_code=500, detail="Error al inicializar el servicio de Google Forms")
 
+def get_forms_responses_service():
+    """
+    Cliente de la API de Forms para leer respuestas. Con GOOGLE_FORMS_API_BASE_URL apunta a otro endpoint
+    (p. ej. el stand-in local app/standins/forms_api.py) y usa credenciales anónimas.
+    """
+    if settings.GOOGLE_FORMS_API_BASE_URL:
+        from google.auth.credentials import AnonymousCredentials
+        return build(
+            'forms', 'v1',
+            credentials=AnonymousCredentials(),
+            client_options={'api_endpoint': settings.GOOGLE_FORMS_API_BASE_URL},
+            cache_discovery=False,
+        )
+    credentials = service_account.Credentials.from_service_account_file(
+        settings.FIREBASE_SERVICE_ACCOUNT_KEY,
+        scopes=settings.GOOGLE_FORMS_SCOPES,
+    )
+    return build('forms', 'v1', credentials=credentials, cache_discovery=False)
+
 async def create_google_form(exam_data: Dict[str, Any], share_with_email: str) -> Dict[str, str]:
     """
     Crea un formulario de Google a partir de los datos del examen.
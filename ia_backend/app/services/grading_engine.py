@@ -0,0 +1,302 @@
+# ia_backend/app/services/grading_engine.py
+import logging
+import re
+import time
+import unicodedata
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from firebase_admin import firestore
+
+from app.services.exam_analytics import analytics_doc_ids, update_exam_analytics
+from app.services.firestore_batches import WriteOperation, write_in_batches
+
+logger = logging.getLogger(__name__)
+
+# Respuestas aceptadas para Verdadero/Falso (ya normalizadas). El formulario de Google usa 'Verdadero'/'Falso'.
+TRUE_ANSWERS = frozenset({"verdadero", "v", "true", "t", "si", "cierto", "1"})
+FALSE_ANSWERS = frozenset({"falso", "f", "false", "no", "0"})
+# Separadores de una respuesta con varios blancos escrita en un único campo ("Eisenhower, URSS").
+_BLANK_SEPARATOR_PATTERN = re.compile(r"\s*(?:[,;/|]|\s+y\s+|\s+and\s+)\s*")
+_PUNCTUATION_PATTERN = re.compile(r"[^\w\s]", re.UNICODE)
+_QUESTION_NUMBER_PATTERN = re.compile(r"^\s*(\d+)\s*[.)-]")
+# Tipo del backend -> `tipo` que usa el frontend en el feedback de los intentos.
+_FEEDBACK_TYPES = {"V_F": "vf", "MC": "opcion_multiple", "FITB": "completar", "OPEN": "abierta"}
+
+
+def normalize_answer(value: Any) -> str:
+    """Minúsculas, sin tildes ni puntuación y con espacios colapsados: ' La  U.R.S.S. ' -> 'la urss'."""
+    if value is None:
+        return ""
+    text = unicodedata.normalize("NFD", str(value).lower())
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+    return " ".join(_PUNCTUATION_PATTERN.sub("", text).split())
+
+
+class CompiledQuestion:
+    """Pregunta de la clave con su comparador ya normalizado. `credit` devuelve la puntuación (0..1) de una respuesta."""
+
+    def __init__(self, index: int, question: Dict[str, Any]):
+        self.index = index
+        self.id = str(question.get("id", index))
+        self.type = question.get("type")
+        self.text = str(question.get("text", ""))
+        # Título con el que Forms exporta la columna (mismo formato que create_google_form).
+        self.title = f"{index + 1}. {self.text}"
+        self.options = [str(option) for option in question.get("options", [])]
+        self.option_index = {normalize_answer(option): position for position, option in enumerate(self.options)}
+        self.correct_answer = question.get("correct_answer")
+        self.correct_index = question.get("correct_answer_index")
+        self.answers = [str(answer) for answer in question.get("answers", [])]
+        self.blank_answers = [normalize_answer(answer) for answer in self.answers]
+        self.gradable = (
+            (self.type == "V_F" and isinstance(self.correct_answer, bool))
+            or (self.type == "MC" and isinstance(self.correct_index, int))
+            or (self.type == "FITB" and bool(self.blank_answers))
+        )
+
+    @property
+    def correct_display(self) -> Any:
+        if self.type == "V_F":
+            return "Verdadero" if self.correct_answer else "Falso"
+        if self.type == "MC" and self.gradable and self.correct_index < len(self.options):
+            return self.options[self.correct_index]
+        if self.type == "FITB":
+            return ", ".join(self.answers)
+        return None
+
+    def choice(self, value: str) -> int:
+        """Opción elegida (V/F: 0 = Verdadero, 1 = Falso; MC: índice de la opción) o -1 si no se reconoce."""
+        normalized = normalize_answer(value)
+        if self.type == "V_F":
+            return 0 if normalized in TRUE_ANSWERS else 1 if normalized in FALSE_ANSWERS else -1
+        if self.type == "MC":
+            if normalized in self.option_index:
+                return self.option_index[normalized]
+            # Respuesta con la letra de la opción ('b').
+            if len(normalized) == 1 and "a" <= normalized <= "z" and ord(normalized) - ord("a") < len(self.options):
+                return ord(normalized) - ord("a")
+        return -1
+
+    def credit(self, value: str) -> float:
+        if not self.gradable:
+            return float("nan")
+        normalized = normalize_answer(value)
+        if not normalized:
+            return 0.0
+        if self.type == "V_F":
+            return float(self.choice(value) == (0 if self.correct_answer else 1))
+        if self.type == "MC":
+            return float(self.choice(value) == self.correct_index)
+        # FITB: un blanco -> igualdad; varios -> fracción de blancos correctos, en orden.
+        if normalized == " ".join(self.blank_answers):
+            return 1.0
+        if len(self.blank_answers) == 1:
+            return 0.0
+        parts = [normalize_answer(part) for part in _BLANK_SEPARATOR_PATTERN.split(value)]
+        if len(parts) == 1 and len(normalized.split()) == len(self.blank_answers):
+            parts = normalized.split()  # "Eisenhower URSS" para dos blancos de una palabra
+        hits = sum(1 for expected, given in zip(self.blank_answers, parts) if expected == given)
+        return hits / len(self.blank_answers)
+
+
+class ExamGradingKey:
+    """Clave de corrección de un examen (`exams/{exam_id}.questions`), compilada una sola vez."""
+
+    def __init__(self, exam_id: str, questions: Sequence[Dict[str, Any]]):
+        self.exam_id = exam_id
+        self.questions = [CompiledQuestion(index, question) for index, question in enumerate(questions)]
+        self.gradable_mask = np.array([q.gradable for q in self.questions], dtype=bool)
+
+    @classmethod
+    def from_firestore(cls, db, exam_id: str) -> "ExamGradingKey":
+        exam_doc = db.collection('exams').document(exam_id).get()
+        if not exam_doc.exists:
+            raise ValueError(f"Examen {exam_id} no encontrado")
+        questions = (exam_doc.to_dict() or {}).get("questions") or []
+        if not questions:
+            raise ValueError(f"El examen {exam_id} no tiene preguntas")
+        return cls(exam_id, questions)
+
+    def resolve_columns(self, answer_keys: Sequence[str]) -> List[Optional[str]]:
+        """
+        Columna de respuestas de cada pregunta: el título exportado por Forms, el id de la pregunta o,
+        si el título se editó, la columna que empieza con el mismo número ("3. ...").
+        """
+        keys = set(answer_keys)
+        by_number: Dict[int, str] = {}
+        for key in answer_keys:
+            match = _QUESTION_NUMBER_PATTERN.match(str(key))
+            if match:
+                by_number.setdefault(int(match.group(1)), key)
+        columns: List[Optional[str]] = []
+        for question in self.questions:
+            if question.title in keys:
+                columns.append(question.title)
+            elif question.id in keys:
+                columns.append(question.id)
+            else:
+                columns.append(by_number.get(question.index + 1))
+        return columns
+
+    def score_cohort(self, answer_dicts: Sequence[Dict[str, Any]]) -> "CohortGrades":
+        """
+        Puntúa todos los intentos a la vez. Por pregunta se deduplican las respuestas con np.unique, cada
+        respuesta distinta se compara una sola vez con la clave compilada y los créditos y opciones se
+        reparten a toda la cohorte con el índice inverso.
+        """
+        num_students, num_questions = len(answer_dicts), len(self.questions)
+        answer_keys = sorted({key for answers in answer_dicts for key in answers})
+        columns = self.resolve_columns(answer_keys)
+        credits = np.full((num_students, num_questions), np.nan)
+        choices = np.full((num_students, num_questions), -1, dtype=np.int16)
+        raw = np.empty((num_students, num_questions), dtype=object)
+        for j, (question, column) in enumerate(zip(self.questions, columns)):
+            if column is None:
+                if question.gradable:
+                    logger.warning(f"Grading ({self.exam_id}): la pregunta {question.index + 1} no aparece en las respuestas; no se califica.")
+                continue
+            values = np.array(["" if answers.get(column) is None else str(answers.get(column)) for answers in answer_dicts], dtype=object)
+            raw[:, j] = values
+            unique_values, inverse = np.unique(values.astype(str), return_inverse=True)
+            credits[:, j] = np.array([question.credit(value) for value in unique_values])[inverse]
+            choices[:, j] = np.array([question.choice(value) for value in unique_values], dtype=np.int16)[inverse]
+        return CohortGrades(self, columns, credits, choices, raw)
+
+
+class CohortGrades:
+    """Resultado de calificar una cohorte: matrices (estudiantes x preguntas) de créditos, opciones elegidas y respuestas."""
+
+    def __init__(self, key: ExamGradingKey, columns: List[Optional[str]], credits: np.ndarray, choices: np.ndarray, raw: np.ndarray):
+        self.key = key
+        self.columns = columns
+        self.credits = credits
+        self.choices = choices
+        self.raw = raw
+        # Solo cuentan las preguntas calificables que aparecen en las respuestas.
+        self.graded_mask = key.gradable_mask & np.array([column is not None for column in columns], dtype=bool)
+        self.scores = np.nansum(np.where(self.graded_mask, credits, np.nan), axis=1) if len(credits) else np.zeros(0)
+        self.total = int(self.graded_mask.sum())
+        self.percentages = self.scores / self.total * 100 if self.total else np.zeros_like(self.scores)
+
+    def subset(self, rows: Sequence[int]) -> "CohortGrades":
+        """Las calificaciones solo de las filas indicadas (p. ej. los intentos que sí se guardaron)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        return CohortGrades(self.key, self.columns, self.credits[rows], self.choices[rows], self.raw[rows])
+
+    def feedback(self, row: int) -> List[Dict[str, Any]]:
+        """Feedback de un intento con el formato que ya usa el frontend (tipo, enunciado, respuestas, correcto)."""
+        items = []
+        for j, question in enumerate(self.key.questions):
+            credit = self.credits[row, j]
+            items.append({
+                "id": question.id,
+                "tipo": _FEEDBACK_TYPES.get(question.type, question.type),
+                "enunciado": question.text,
+                "respuestaEstudiante": self.raw[row, j] if self.raw[row, j] is not None else "",
+                "respuestaCorrecta": question.correct_display,
+                "correcto": None if np.isnan(credit) else bool(credit >= 1.0),
+                "puntuacion": None if np.isnan(credit) else round(float(credit), 4),
+            })
+        return items
+
+
+def load_exam_attempts(db, exam_id: str, group_id: Optional[str] = None) -> List[Tuple[Any, Dict[str, Any]]]:
+    """(referencia, datos) de los intentos importados del examen en `usuarios/*/examAttempts`, con una consulta de grupo de colecciones."""
+    query = db.collection_group('examAttempts').where('exam_id', '==', exam_id)
+    attempts = []
+    for snapshot in query.stream():
+        data = snapshot.to_dict() or {}
+        if group_id and data.get('group_id') != group_id:
+            continue
+        attempts.append((snapshot.reference, data))
+    return attempts
+
+
+def grade_exam_attempts(
+    exam_id: str,
+    group_id: Optional[str] = None,
+    db=None,
+    write: bool = True,
+    only_new: bool = False,
+    rebuild_analytics: bool = False,
+) -> Tuple[Dict[str, Any], Optional[CohortGrades]]:
+    """
+    Califica los intentos importados de un examen (opcionalmente de un grupo, o solo los aún no calificados
+    con `only_new`) con la clave del examen. Si `write`, guarda score/total/percentage/feedback en cada intento
+    con escrituras por lotes y después actualiza los resúmenes de estadísticas con los intentos guardados. `rebuild_analytics`
+    recalifica todos los intentos del examen y reescribe los resúmenes desde cero.
+
+    Returns:
+        (resumen, calificaciones de la cohorte o None si no hay intentos).
+    """
+    db = db or firestore.client()
+    started = time.perf_counter()
+    key = ExamGradingKey.from_firestore(db, exam_id)
+    attempts = load_exam_attempts(db, exam_id, None if rebuild_analytics else group_id)
+    if only_new and not rebuild_analytics:
+        attempts = [(attempt_ref, data) for attempt_ref, data in attempts if data.get('auto_graded') is not True]
+    if not attempts:
+        return {"exam_id": exam_id, "group_id": group_id, "graded": 0, "written": 0, "errors": []}, None
+    grades = key.score_cohort([data.get('answers') or {} for _, data in attempts])
+
+    written, errors, analytics = 0, [], {}
+    if write:
+        doc_ids_per_row = [analytics_doc_ids(data.get('group_id'), data.get('import_id')) for _, data in attempts]
+
+        # Primero los intentos: los resúmenes solo cuentan los que quedaron guardados (con su contribución),
+        # así un lote fallido no deja contribuciones sumadas a intentos que siguen pendientes de calificar.
+        def operations() -> Iterator[WriteOperation]:
+            for row, (attempt_ref, _) in enumerate(attempts):
+                yield row, attempt_ref, {
+                    'score': round(float(grades.scores[row]), 4),
+                    'total': grades.total,
+                    'percentage': round(float(grades.percentages[row]), 2),
+                    'feedback': grades.feedback(row),
+                    'auto_graded': True,
+                    'graded_at': firestore.SERVER_TIMESTAMP,
+                    # Contribución del intento a los resúmenes, para restarla si se vuelve a calificar.
+                    'graded_credits': [None if np.isnan(c) else round(float(c), 4) for c in grades.credits[row]],
+                    'graded_choices': grades.choices[row].tolist(),
+                    'analytics_docs': doc_ids_per_row[row],
+                }
+        outcome = write_in_batches(db, operations())
+        written = outcome["written"]
+        failed_rows = {row for row, _ in outcome["failed"]}
+        errors.extend(f"{attempts[row][0].path}: {error}" for row, error in outcome["failed"])
+
+        written_rows = [row for row in range(len(attempts)) if row not in failed_rows]
+        if written_rows:
+            try:
+                analytics = update_exam_analytics(
+                    db, grades.subset(written_rows), [attempts[row][1] for row in written_rows],
+                    [doc_ids_per_row[row] for row in written_rows], rebuild=rebuild_analytics,
+                )
+            except Exception as e:
+                logger.error(f"Grading ({exam_id}): no se pudieron actualizar las estadísticas: {e}", exc_info=True)
+                errors.append(f"analytics: {e} (recalcula los resúmenes con rebuild_analytics)")
+
+                # Los intentos no deben declarar una contribución que los resúmenes no tienen.
+                def clear_contributions() -> Iterator[WriteOperation]:
+                    for row in written_rows:
+                        yield row, attempts[row][0], {'analytics_docs': []}
+                write_in_batches(db, clear_contributions())
+
+    summary = {
+        "exam_id": exam_id,
+        "group_id": group_id,
+        "graded": len(attempts),
+        "gradable_questions": grades.total,
+        "ungraded_questions": [q.index + 1 for q, graded in zip(key.questions, grades.graded_mask) if not graded],
+        "mean_score": round(float(grades.scores.mean()), 4),
+        "mean_percentage": round(float(grades.percentages.mean()), 2),
+        "written": written,
+        "analytics": analytics,
+        "errors": errors,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info(
+        f"Grading ({exam_id}): {len(attempts)} intentos, {grades.total} preguntas calificables, "
+        f"media {summary['mean_percentage']}%, {written} escritos en {summary['elapsed_seconds']}s."
+    )
+    return summary, grades
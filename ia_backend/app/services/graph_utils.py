@@ -0,0 +1,419 @@
+# ia_backend/app/services/graph_utils.py
+"""
+Utilidades locales para los grafos de mapas conceptuales y mentales ({"nodes": [...], "edges": [...]}).
+"""
+import logging
+import re
+import unicodedata
+import zlib
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.services.keyword_extractor import singularize
+
+logger = logging.getLogger(__name__)
+
+# Prioridad de los tipos de nodo al fusionar: el nodo fusionado conserva el tipo más alto.
+NODE_TYPE_RANK = {"main": 3, "concept": 2, "subtopic": 2, "subconcept": 1, "detail": 1}
+
+_LABEL_STOPWORDS = {"el", "la", "los", "las", "de", "del", "y", "en", "un", "una", "the", "of", "and", "a", "an"}
+_NON_WORD_PATTERN = re.compile(r"[^\w\s]", re.UNICODE)
+
+
+def normalize_label(label: str) -> str:
+    """Minúsculas, sin tildes, sin puntuación ni artículos, con plural simple recortado: 'Las Células' -> 'celula'."""
+    text = unicodedata.normalize("NFD", str(label).lower())
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+    words = []
+    for word in _NON_WORD_PATTERN.sub(" ", text).split():
+        if word in _LABEL_STOPWORDS:
+            continue
+        words.append(singularize(word))
+    return " ".join(words)
+
+
+def label_ngram_vectors(labels: Sequence[str], n: int = 3, n_features: int = 2048) -> np.ndarray:
+    """Embeddings locales de etiquetas cortas: n-gramas de caracteres con hashing, normalizados L2."""
+    vectors = np.zeros((len(labels), n_features), dtype=np.float32)
+    for row, label in enumerate(labels):
+        padded = f" {normalize_label(label)} "
+        grams = [padded[i:i + n] for i in range(max(1, len(padded) - n + 1))]
+        columns = np.fromiter((zlib.crc32(g.encode("utf-8")) % n_features for g in grams), dtype=np.int64, count=len(grams))
+        np.add.at(vectors[row], columns, 1.0)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, item: int) -> int:
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, a: int, b: int) -> None:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def iter_valid_nodes(graphs: Sequence[Dict[str, Any]]):
+    """(índice de grafo, nodo) de los nodos con id y etiqueta, en orden. Es el orden de `label_embeddings`."""
+    for graph_index, graph in enumerate(graphs):
+        for node in graph.get("nodes", []):
+            if isinstance(node, dict) and node.get("id") is not None and str(node.get("label", "")).strip():
+                yield graph_index, node
+
+
+def merge_partial_graphs(
+    graphs: Sequence[Dict[str, Any]],
+    similarity_threshold: float = 0.85,
+    label_embeddings: Optional[np.ndarray] = None,
+) -> Dict[str, Any]:
+    """
+    Fusiona grafos parciales (p. ej. uno por sección del documento) en uno solo. Dos nodos se unen si
+    su etiqueta normalizada coincide o si la similitud coseno de sus embeddings supera el umbral
+    (`label_embeddings` en el orden de `iter_valid_nodes`; si no se dan, n-gramas de caracteres).
+    Cada nodo fusionado lleva `support` = número de secciones en que apareció.
+    """
+    flat_nodes = list(iter_valid_nodes(graphs))
+    if not flat_nodes:
+        return {"nodes": [], "edges": []}
+
+    labels = [str(node["label"]).strip() for _, node in flat_nodes]
+    union_find = _UnionFind(len(flat_nodes))
+    first_by_label: Dict[str, int] = {}
+    for position, label in enumerate(labels):
+        normalized = normalize_label(label) or label.lower()
+        if normalized in first_by_label:
+            union_find.union(first_by_label[normalized], position)
+        else:
+            first_by_label[normalized] = position
+
+    embeddings = label_embeddings if label_embeddings is not None else label_ngram_vectors(labels)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    embeddings = embeddings / norms
+    similarity = embeddings @ embeddings.T
+    rows, cols = np.nonzero(np.triu(similarity >= similarity_threshold, k=1))
+    for a, b in zip(rows.tolist(), cols.tolist()):
+        union_find.union(a, b)
+
+    groups: Dict[int, List[int]] = {}
+    for position in range(len(flat_nodes)):
+        groups.setdefault(union_find.find(position), []).append(position)
+
+    merged_nodes = []
+    merged_id_by_original: Dict[tuple, str] = {}
+    for new_index, (_, members) in enumerate(sorted(groups.items())):
+        merged_id = f"n{new_index + 1}"
+        member_labels = Counter(labels[m] for m in members)
+        # Etiqueta más repetida; a igualdad, la más corta.
+        label = min(member_labels, key=lambda l: (-member_labels[l], len(l), l))
+        node_type = max((flat_nodes[m][1].get("type") for m in members), key=lambda t: NODE_TYPE_RANK.get(t, 0))
+        merged_nodes.append({
+            "id": merged_id,
+            "label": label,
+            "type": node_type,
+            "support": len({flat_nodes[m][0] for m in members}),
+        })
+        for m in members:
+            graph_index, node = flat_nodes[m]
+            merged_id_by_original[(graph_index, str(node["id"]))] = merged_id
+
+    merged_edges = []
+    seen_pairs = set()
+    for graph_index, graph in enumerate(graphs):
+        for edge in graph.get("edges", []):
+            if not isinstance(edge, dict):
+                continue
+            source = merged_id_by_original.get((graph_index, str(edge.get("source"))))
+            target = merged_id_by_original.get((graph_index, str(edge.get("target"))))
+            if source is None or target is None or source == target or (source, target) in seen_pairs:
+                continue
+            seen_pairs.add((source, target))
+            merged_edge = {"id": f"e{len(merged_edges) + 1}", "source": source, "target": target}
+            if edge.get("label"):
+                merged_edge["label"] = edge["label"]
+            merged_edges.append(merged_edge)
+
+    logger.info(f"GraphUtils: {len(flat_nodes)} nodos de {len(graphs)} grafos parciales fusionados en {len(merged_nodes)}.")
+    return {"nodes": merged_nodes, "edges": merged_edges}
+
+
+def trim_graph(graph: Dict[str, Any], max_nodes: int, root_type: Optional[str] = None, demoted_type: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Conserva los `max_nodes` nodos con más apoyo (`support`) y grado, y las aristas entre ellos. Con
+    `root_type` (p. ej. 'main') garantiza que quede exactamente un nodo de ese tipo; los demás pasan a `demoted_type`.
+    """
+    degree: Counter = Counter()
+    for edge in graph["edges"]:
+        degree[edge["source"]] += 1
+        degree[edge["target"]] += 1
+    ranked = sorted(graph["nodes"], key=lambda n: (n.get("type") == root_type, n.get("support", 1), degree[n["id"]]), reverse=True)
+    kept = [dict(node) for node in ranked[:max_nodes]]
+    if root_type and kept:
+        for position, node in enumerate(kept):
+            if position == 0:
+                node["type"] = root_type
+            elif node.get("type") == root_type:
+                node["type"] = demoted_type or node["type"]
+    kept_ids = {node["id"] for node in kept}
+    edges = [edge for edge in graph["edges"] if edge["source"] in kept_ids and edge["target"] in kept_ids]
+    return {"nodes": kept, "edges": edges}
+
+
+def normalize_graph(graph: Dict[str, Any], root_type: Optional[str] = None, demoted_type: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Limpia un grafo generado por la IA: descarta nodos sin id o sin etiqueta, une los nodos con id repetido
+    o con la misma etiqueta normalizada (gana el primero) y elimina las aristas hacia ids inexistentes, los
+    bucles y las aristas repetidas. Con `root_type` deja un único nodo de ese tipo; los demás pasan a `demoted_type`.
+    """
+    nodes: List[Dict[str, Any]] = []
+    canonical_by_id: Dict[str, str] = {}
+    canonical_by_label: Dict[str, str] = {}
+    node_by_id: Dict[str, Dict[str, Any]] = {}
+    for node in graph.get("nodes", []):
+        if not isinstance(node, dict) or node.get("id") is None or not str(node.get("label", "")).strip():
+            continue
+        node_id = str(node["id"])
+        if node_id in canonical_by_id:
+            continue
+        label = str(node["label"]).strip()
+        normalized = normalize_label(label) or label.lower()
+        canonical = canonical_by_label.get(normalized)
+        if canonical is not None:
+            canonical_by_id[node_id] = canonical
+            kept = node_by_id[canonical]
+            if NODE_TYPE_RANK.get(node.get("type"), 0) > NODE_TYPE_RANK.get(kept.get("type"), 0):
+                kept["type"] = node.get("type")
+            continue
+        clean = dict(node, id=node_id, label=label)
+        canonical_by_id[node_id] = canonical_by_label[normalized] = node_id
+        node_by_id[node_id] = clean
+        nodes.append(clean)
+
+    if root_type and nodes:
+        roots = [node for node in nodes if node.get("type") == root_type] or nodes[:1]
+        for node in nodes:
+            if node is roots[0]:
+                node["type"] = root_type
+            elif node.get("type") == root_type:
+                node["type"] = demoted_type or node["type"]
+
+    edges: List[Dict[str, Any]] = []
+    seen_pairs = set()
+    used_edge_ids = set()
+    for edge in graph.get("edges", []):
+        if not isinstance(edge, dict):
+            continue
+        source = canonical_by_id.get(str(edge.get("source")))
+        target = canonical_by_id.get(str(edge.get("target")))
+        if source is None or target is None or source == target or (source, target) in seen_pairs:
+            continue
+        seen_pairs.add((source, target))
+        edge_id = str(edge["id"]) if edge.get("id") is not None else ""
+        if not edge_id or edge_id in used_edge_ids:
+            edge_id = f"e{len(edges) + 1}"
+            while edge_id in used_edge_ids:
+                edge_id += "_"
+        used_edge_ids.add(edge_id)
+        edges.append(dict(edge, id=edge_id, source=source, target=target))
+
+    dropped_nodes = len(graph.get("nodes", [])) - len(nodes)
+    dropped_edges = len(graph.get("edges", [])) - len(edges)
+    if dropped_nodes or dropped_edges:
+        logger.info(f"GraphUtils: Normalización descartó {dropped_nodes} nodo(s) y {dropped_edges} arista(s).")
+    return {**graph, "nodes": nodes, "edges": edges}
+
+
+def _edge_index_pairs(node_ids: Sequence[str], edges: Sequence[Dict[str, Any]]) -> np.ndarray:
+    position_by_id = {node_id: position for position, node_id in enumerate(node_ids)}
+    pairs = [
+        (position_by_id[edge["source"]], position_by_id[edge["target"]])
+        for edge in edges
+        if edge["source"] in position_by_id and edge["target"] in position_by_id
+    ]
+    return np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+
+
+def force_directed_layout(
+    node_ids: Sequence[str],
+    edges: Sequence[Dict[str, Any]],
+    iterations: int = 100,
+    seed: int = 0,
+    spacing: float = 220.0,
+) -> np.ndarray:
+    """
+    Posiciones (n, 2) por Fruchterman-Reingold vectorizado con NumPy: en cada iteración se calculan a la vez
+    todas las repulsiones (matriz de distancias n x n) y las atracciones de las aristas, con temperatura
+    decreciente. `spacing` es la distancia ideal entre nodos conectados, en píxeles. Determinista por `seed`.
+    """
+    count = len(node_ids)
+    if count == 0:
+        return np.zeros((0, 2))
+    if count == 1:
+        return np.zeros((1, 2))
+    rng = np.random.default_rng(seed)
+    # Arranque en círculo con un poco de ruido: converge antes que uno aleatorio y evita solapamientos iniciales.
+    angles = np.linspace(0.0, 2 * np.pi, count, endpoint=False)
+    radius = spacing * np.sqrt(count) / 2
+    positions = np.column_stack((np.cos(angles), np.sin(angles))) * radius + rng.normal(scale=spacing * 0.05, size=(count, 2))
+    pairs = _edge_index_pairs(node_ids, edges)
+    k = spacing
+    temperature = radius
+    cooling = temperature / (iterations + 1)
+    for _ in range(iterations):
+        delta = positions[:, None, :] - positions[None, :, :]
+        distance = np.linalg.norm(delta, axis=2)
+        np.fill_diagonal(distance, 1.0)
+        distance = np.maximum(distance, 0.01)
+        displacement = (delta / distance[..., None] * (k * k / distance)[..., None]).sum(axis=1)
+        if len(pairs):
+            edge_delta = positions[pairs[:, 0]] - positions[pairs[:, 1]]
+            edge_distance = np.maximum(np.linalg.norm(edge_delta, axis=1), 0.01)
+            attraction = edge_delta * (edge_distance / k)[:, None]
+            np.add.at(displacement, pairs[:, 0], -attraction)
+            np.add.at(displacement, pairs[:, 1], attraction)
+        # Leve atracción al centro para que las componentes desconectadas no se alejen sin límite.
+        displacement -= positions * (0.1 * k / radius)
+        length = np.maximum(np.linalg.norm(displacement, axis=1), 0.01)
+        positions += displacement / length[:, None] * np.minimum(length, temperature)[:, None]
+        temperature -= cooling
+    return positions - positions.mean(axis=0)
+
+
+def tree_layout(
+    node_ids: Sequence[str],
+    edges: Sequence[Dict[str, Any]],
+    root_id: Optional[str] = None,
+    level_distance: float = 240.0,
+) -> np.ndarray:
+    """
+    Posiciones (n, 2) radiales a partir de la raíz: cada nivel del árbol (BFS sobre las aristas, sin
+    dirección) es un anillo y cada subárbol recibe un sector proporcional a sus hojas. Los nodos que no
+    cuelgan de la raíz se enganchan a ella como ramas adicionales.
+    """
+    count = len(node_ids)
+    if count == 0:
+        return np.zeros((0, 2))
+    position_by_id = {node_id: position for position, node_id in enumerate(node_ids)}
+    root = position_by_id.get(root_id, 0) if root_id is not None else 0
+    neighbours: List[List[int]] = [[] for _ in range(count)]
+    for a, b in _edge_index_pairs(node_ids, edges).tolist():
+        neighbours[a].append(b)
+        neighbours[b].append(a)
+
+    children: List[List[int]] = [[] for _ in range(count)]
+    depth = np.zeros(count, dtype=np.int64)
+    visited = np.zeros(count, dtype=bool)
+    order: List[int] = []
+
+    def visit_from(start: int, start_depth: int) -> None:
+        visited[start] = True
+        depth[start] = start_depth
+        queue = deque([start])
+        while queue:
+            current = queue.popleft()
+            order.append(current)
+            for neighbour in neighbours[current]:
+                if not visited[neighbour]:
+                    visited[neighbour] = True
+                    depth[neighbour] = depth[current] + 1
+                    children[current].append(neighbour)
+                    queue.append(neighbour)
+
+    visit_from(root, 0)
+    for start in range(count):
+        if not visited[start]:
+            children[root].append(start)
+            visit_from(start, 1)
+
+    # Hojas por subárbol (en orden inverso de BFS, los hijos antes que los padres).
+    leaves = np.ones(count, dtype=np.float64)
+    for node in reversed(order):
+        if children[node]:
+            leaves[node] = sum(leaves[child] for child in children[node])
+
+    angle = np.zeros(count)
+    sector_start = np.zeros(count)
+    sector_size = np.zeros(count)
+    sector_size[root] = 2 * np.pi
+    for node in order:
+        offset = sector_start[node]
+        for child in children[node]:
+            sector_start[child] = offset
+            sector_size[child] = sector_size[node] * leaves[child] / leaves[node]
+            angle[child] = offset + sector_size[child] / 2
+            offset += sector_size[child]
+    radius = depth * level_distance
+    return np.column_stack((radius * np.cos(angle), radius * np.sin(angle)))
+
+
+def layout_graph(
+    graph: Dict[str, Any],
+    root_type: Optional[str] = None,
+    seed: int = 0,
+    iterations: int = 100,
+    node_width: float = 180.0,
+    node_height: float = 60.0,
+) -> Dict[str, Any]:
+    """
+    Añade a cada nodo `position` = {"x", "y"} (esquina superior izquierda, en píxeles, como la espera
+    React Flow). Con `root_type` se usa el layout radial de árbol desde ese nodo; si no, el de fuerzas.
+    """
+    nodes = graph.get("nodes", [])
+    if not nodes:
+        return graph
+    node_ids = [node["id"] for node in nodes]
+    root = next((node["id"] for node in nodes if node.get("type") == root_type), None) if root_type else None
+    if root_type:
+        positions = tree_layout(node_ids, graph.get("edges", []), root)
+    else:
+        positions = force_directed_layout(node_ids, graph.get("edges", []), iterations=iterations, seed=seed)
+    # Coordenadas positivas con margen, desplazadas al centro de cada caja de nodo.
+    positions = positions - positions.min(axis=0) + np.array([node_width, node_height])
+    positions -= np.array([node_width / 2, node_height / 2])
+    laid_out = [
+        dict(node, position={"x": round(float(x), 1), "y": round(float(y), 1)})
+        for node, (x, y) in zip(nodes, positions.tolist())
+    ]
+    return {**graph, "nodes": laid_out}
+
+
+def path_from_root(graph: Dict[str, Any], node_id: str, root_type: Optional[str] = "main") -> List[Dict[str, Any]]:
+    """Nodos desde la raíz (el nodo de tipo `root_type`, o el primero) hasta `node_id` por BFS sin dirección; [] si no existe."""
+    nodes_by_id = {str(node["id"]): node for node in graph.get("nodes", []) if isinstance(node, dict) and node.get("id") is not None}
+    if node_id not in nodes_by_id:
+        return []
+    root_id = next((i for i, n in nodes_by_id.items() if n.get("type") == root_type), next(iter(nodes_by_id)))
+    neighbours: Dict[str, List[str]] = {}
+    for edge in graph.get("edges", []):
+        source, target = str(edge.get("source")), str(edge.get("target"))
+        if source in nodes_by_id and target in nodes_by_id:
+            neighbours.setdefault(source, []).append(target)
+            neighbours.setdefault(target, []).append(source)
+    parent: Dict[str, Optional[str]] = {root_id: None}
+    queue = deque([root_id])
+    while queue and node_id not in parent:
+        current = queue.popleft()
+        for neighbour in neighbours.get(current, []):
+            if neighbour not in parent:
+                parent[neighbour] = current
+                queue.append(neighbour)
+    if node_id not in parent:
+        # Nodo desconectado de la raíz: se trata como rama directa del tema central.
+        return [nodes_by_id[root_id], nodes_by_id[node_id]] if node_id != root_id else [nodes_by_id[root_id]]
+    path = []
+    current: Optional[str] = node_id
+    while current is not None:
+        path.append(nodes_by_id[current])
+        current = parent[current]
+    return path[::-1]
@@ -0,0 +1,97 @@
+# ia_backend/app/services/json_stream_parser.py
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalQuestionParser:
+    """
+    Parser incremental para respuestas JSON con la forma
+    {"clave_1": [ {...}, {...} ], "clave_2": [ ... ]}.
+
+    Recibe el texto por fragmentos (tal como llega de streamGenerateContent) y
+    devuelve cada objeto del arreglo en cuanto se cierra su llave, junto con la
+    clave del arreglo al que pertenece. Si el flujo se corta, los objetos ya
+    emitidos siguen siendo válidos; `complete` indica si el objeto raíz se cerró.
+    """
+
+    def __init__(self) -> None:
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._reading_key = False
+        self._key_chars: List[str] = []
+        self._last_key: Optional[str] = None
+        self._array_key: Optional[str] = None
+        self._capturing = False
+        self._object_chars: List[str] = []
+        self.complete = False
+        self.emitted_count = 0
+        self.invalid_count = 0
+
+    @property
+    def inside_object(self) -> bool:
+        """True si hay un objeto a medio recibir (útil para detectar truncamiento)."""
+        return self._capturing
+
+    def feed(self, chunk: str) -> List[Tuple[str, Dict[str, Any]]]:
+        completed: List[Tuple[str, Dict[str, Any]]] = []
+        for ch in chunk:
+            if self._capturing:
+                self._object_chars.append(ch)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._reading_key:
+                        self._last_key = "".join(self._key_chars)
+                        self._reading_key = False
+                elif self._reading_key:
+                    self._key_chars.append(ch)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    # En el objeto raíz, las cadenas fuera de arreglos son claves.
+                    self._reading_key = True
+                    self._key_chars = []
+            elif ch == "{" or ch == "[":
+                self._depth += 1
+                if ch == "[" and self._depth == 2:
+                    self._array_key = self._last_key
+                elif ch == "{" and self._depth == 3 and self._array_key and not self._capturing:
+                    self._capturing = True
+                    self._object_chars = ["{"]
+            elif ch == "}" or ch == "]":
+                if ch == "}" and self._depth == 3 and self._capturing:
+                    self._capturing = False
+                    parsed = self._parse_object("".join(self._object_chars))
+                    self._object_chars = []
+                    if parsed is not None and self._array_key:
+                        completed.append((self._array_key, parsed))
+                elif ch == "]" and self._depth == 2:
+                    self._array_key = None
+                self._depth -= 1
+                if self._depth == 0:
+                    self.complete = True
+        return completed
+
+    def _parse_object(self, raw_object: str) -> Optional[Dict[str, Any]]:
+        try:
+            parsed = json.loads(raw_object)
+        except json.JSONDecodeError as e:
+            self.invalid_count += 1
+            logger.warning(f"IncrementalQuestionParser: Objeto JSON inválido descartado ({e}). Texto (primeros 200 chars): {raw_object[:200]}")
+            return None
+        if not isinstance(parsed, dict):
+            self.invalid_count += 1
+            return None
+        self.emitted_count += 1
+        return parsed
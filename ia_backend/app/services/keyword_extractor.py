@@ -0,0 +1,240 @@
+# ia_backend/app/services/keyword_extractor.py
+import gzip
+import json
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.pdf_content_cache import pdf_content_cache, register_pdf_invalidation_listener
+
+logger = logging.getLogger(__name__)
+
+_STATS_FORMAT_VERSION = 2  # v2: claves con singularize (las estadísticas v1 se recalculan)
+_FULL_TEXT_SUFFIX = "_full_text.txt"
+_TOKEN_PATTERN = re.compile(r"[a-záéíóúüñàèìòùâêîôûç]+")
+
+SPANISH_STOPWORDS = frozenset("""
+a al algo algunas algunos ante antes aquel aquella aquellas aquellos aqui aquí asi así aun aún bajo bien cada casi
+como cómo con contra cual cuál cuales cuáles cualquier cuando cuándo cuanto cuánto de del desde donde dónde dos
+durante e el él ella ellas ello ellos en entre era eran eres es esa esas ese eso esos esta está estaba estaban estado
+estamos estan están estar estas estás este esto estos estoy fue fueron fui ha había habían han has hasta hay haya
+he hemos hoy la las le les lo los mas más me mi mí mis mismo misma mismos mismas mucho muchos muchas muy nada ni no
+nos nosotros nuestra nuestro nuestras nuestros o os otra otro otras otros para pero poco por porque puede pueden
+pues que qué quien quién quienes se sea sean según ser si sí siempre sido sin sino sobre sois solo sólo son su sus
+también tan tanto te tener tenía tiene tienen todo todos toda todas tras tu tú tus un una uno unos unas usted ustedes
+va van vez vosotros y ya yo además ahora algún alguna alguno ambos aquí cierto cierta ciertos ciertas cuya cuyo
+debe deben dentro donde embargo encima entonces esta éste ésta etc hacer hace hacia hecho incluso junto lugar manera
+mediante menos mientras mucha nunca parte partir pesar propio puesto sean segun sigue siguiente tal tales tampoco
+través tener toda último última veces forma formas caso casos tipo tipos ejemplo ejemplos través cual cuales uso
+usar usa usan pueda puedan hacen hizo dicho dicha dichos dichas cuenta gran grandes mayor menor mejor bueno buena
+""".split())
+
+ENGLISH_STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+herself him himself his how however i if in into is it its itself just more most my myself no nor not now of off on
+once only or other our ours ourselves out over own same she should so some such than that the their theirs them
+themselves then there these they this those through to too under until up upon very was we were what when where
+which while who whom why will with within without would you your yours yourself yourselves may might must shall
+one two three first second new used use using many much well also example examples thus therefore e g eg ie etc
+""".split())
+
+STOPWORDS = SPANISH_STOPWORDS | ENGLISH_STOPWORDS
+
+
+def _strip_accents(token: str) -> str:
+    return "".join(c if c == "ñ" else unicodedata.normalize("NFD", c)[0] for c in token)
+
+
+_VOWELS = frozenset("aeiou")
+# Consonantes con las que termina un singular que forma el plural con "-es" (red-es, animal-es, funcion-es, mar-es, ley-es).
+_PLURAL_ES_CONSONANTS = frozenset("dlnry")
+
+
+def singularize(word: str) -> str:
+    """
+    Recorta el plural simple de una palabra ya sin tildes: 'clases' -> 'clase', 'redes' -> 'red', 'leyes' -> 'ley',
+    'luces' -> 'luz'. "-es" solo se quita tras vocal + d/l/n/r/y (y "-ces" pasa a "z"); en el resto, solo la "s".
+    """
+    if len(word) <= 4 or not word.endswith("s") or word.endswith("ss"):
+        return word
+    if word.endswith("es") and word[-4] in _VOWELS:
+        if word[-3] in _PLURAL_ES_CONSONANTS:
+            return word[:-2]
+        if word[-3] == "c":
+            return word[:-3] + "z"
+    if word.endswith("sses"):  # classes -> class
+        return word[:-2]
+    return word[:-1]
+
+
+def term_key(token: str) -> str:
+    """Clave de agrupación: sin tildes y sin plural simple, para contar 'célula' y 'células' juntas."""
+    return singularize(_strip_accents(token))
+
+
+def tokenize(text: str, min_length: int = 3) -> List[str]:
+    return [t for t in _TOKEN_PATTERN.findall(text.lower()) if len(t) >= min_length and t not in STOPWORDS]
+
+
+def term_frequencies(text: str) -> Tuple[Counter, Dict[str, str]]:
+    """Frecuencia por clave y la forma superficial más frecuente de cada clave."""
+    surface_counts: Counter = Counter(tokenize(text))
+    frequencies: Counter = Counter()
+    best_surface: Dict[str, Tuple[int, str]] = {}
+    for token, count in surface_counts.items():
+        key = term_key(token)
+        frequencies[key] += count
+        if count > best_surface.get(key, (0, ""))[0]:
+            best_surface[key] = (count, token)
+    return frequencies, {key: surface for key, (_, surface) in best_surface.items()}
+
+
+class KeywordExtractor:
+    """
+    Extractor local de palabras clave por TF-IDF. Las frecuencias de documento se calculan sobre los textos
+    de `PROCESSED_DATA_DIR` de forma incremental (solo se leen los archivos nuevos o modificados) y se
+    persisten en `KEYWORD_STATS_PATH`. Los rankings se cachean por pdf_id hasta que cambia su texto o el corpus.
+    """
+
+    def __init__(self, data_dir: Optional[str] = None, stats_path: Optional[str] = None):
+        self.data_dir = data_dir or settings.PROCESSED_DATA_DIR
+        self.stats_path = stats_path or settings.KEYWORD_STATS_PATH
+        self._docs: Optional[Dict[str, Dict]] = None
+        self._df: Counter = Counter()
+        self._corpus_version = 0
+        self._ranking_cache: Dict[str, Tuple[int, int, int, List[Tuple[str, float]]]] = {}
+        self._lock = threading.RLock()
+
+    def _load_stats(self) -> None:
+        # Debe llamarse con el lock tomado.
+        if self._docs is not None:
+            return
+        self._docs = {}
+        if os.path.exists(self.stats_path):
+            try:
+                with gzip.open(self.stats_path, "rt", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("v") == _STATS_FORMAT_VERSION:
+                    self._docs = data.get("docs", {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"KeywordExtractor: No se pudieron leer las estadísticas ({e}). Se recalculan.")
+        for doc in self._docs.values():
+            self._df.update(doc["terms"])
+
+    def _save_stats(self) -> None:
+        os.makedirs(os.path.dirname(self.stats_path) or ".", exist_ok=True)
+        tmp_path = f"{self.stats_path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump({"v": _STATS_FORMAT_VERSION, "docs": self._docs}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.stats_path)
+
+    def _remove_doc(self, pdf_id: str) -> bool:
+        doc = self._docs.pop(pdf_id, None)
+        if doc is None:
+            return False
+        self._df.subtract(doc["terms"])
+        self._df += Counter()  # descarta los contadores que quedaron en cero
+        return True
+
+    def refresh_corpus(self) -> int:
+        """Incorpora los textos nuevos o modificados y descarta los eliminados. Devuelve cuántos documentos cambiaron."""
+        with self._lock:
+            self._load_stats()
+            try:
+                names = [n for n in os.listdir(self.data_dir) if n.endswith(_FULL_TEXT_SUFFIX)]
+            except FileNotFoundError:
+                names = []
+            present = set()
+            changed = 0
+            for name in names:
+                pdf_id = name[: -len(_FULL_TEXT_SUFFIX)]
+                path = os.path.join(self.data_dir, name)
+                try:
+                    stat_result = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                present.add(pdf_id)
+                doc = self._docs.get(pdf_id)
+                if doc and doc["m"] == stat_result.st_mtime_ns and doc["s"] == stat_result.st_size:
+                    continue
+                text = pdf_content_cache.get_file_text(pdf_id, path)
+                if text is None:
+                    continue
+                self._remove_doc(pdf_id)
+                terms = sorted(term_frequencies(text)[0])
+                self._docs[pdf_id] = {"m": stat_result.st_mtime_ns, "s": stat_result.st_size, "terms": terms}
+                self._df.update(terms)
+                changed += 1
+            for pdf_id in [p for p in self._docs if p not in present]:
+                self._remove_doc(pdf_id)
+                changed += 1
+            if changed:
+                self._corpus_version += 1
+                try:
+                    self._save_stats()
+                except OSError as e:
+                    logger.warning(f"KeywordExtractor: No se pudieron guardar las estadísticas ({e}).")
+                logger.info(f"KeywordExtractor: Corpus actualizado ({changed} documento(s) cambiados, {len(self._docs)} en total).")
+            return changed
+
+    def _rank(self, text: str) -> List[Tuple[str, float]]:
+        # Debe llamarse con el lock tomado.
+        frequencies, surfaces = term_frequencies(text)
+        num_docs = len(self._docs)
+        scored = []
+        for key, count in frequencies.items():
+            idf = math.log((num_docs + 1) / (self._df.get(key, 0) + 1)) + 1.0
+            scored.append((surfaces[key], (1.0 + math.log(count)) * idf))
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[: settings.KEYWORD_CACHE_TOP_N]
+
+    def ranked_keywords(self, pdf_id: Optional[str] = None, text: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Términos del documento ordenados por TF-IDF con su puntuación. Con `pdf_id` se usa su texto
+        completo de processed_data/ (y la caché por pdf_id); si no existe, se usa `text`.
+        """
+        with self._lock:
+            self.refresh_corpus()
+            doc = self._docs.get(pdf_id) if pdf_id else None
+            if doc is not None:
+                cached = self._ranking_cache.get(pdf_id)
+                if cached and cached[:3] == (doc["m"], doc["s"], self._corpus_version):
+                    return cached[3]
+                full_text = pdf_content_cache.get_file_text(pdf_id, os.path.join(self.data_dir, f"{pdf_id}{_FULL_TEXT_SUFFIX}"))
+                if full_text is not None:
+                    ranking = self._rank(full_text)
+                    self._ranking_cache[pdf_id] = (doc["m"], doc["s"], self._corpus_version, ranking)
+                    return ranking
+            return self._rank(text) if text else []
+
+    def extract(
+        self,
+        pdf_id: Optional[str] = None,
+        text: Optional[str] = None,
+        top_n: int = 10,
+        min_length: int = 4,
+        max_length: Optional[int] = None,
+    ) -> List[str]:
+        """Las `top_n` palabras clave con longitud en [min_length, max_length]."""
+        keywords = []
+        for term, _ in self.ranked_keywords(pdf_id, text):
+            if len(term) >= min_length and (max_length is None or len(term) <= max_length):
+                keywords.append(term)
+                if len(keywords) == top_n:
+                    break
+        return keywords
+
+    def invalidate(self, pdf_id: str) -> None:
+        with self._lock:
+            self._ranking_cache.pop(pdf_id, None)
+
+
+keyword_extractor = KeywordExtractor()
+register_pdf_invalidation_listener(keyword_extractor.invalidate)
@@ -1,34 +1,87 @@
+import asyncio
 import google.generativeai as genai
+import httpx
 import os
 import re
 import json
+from typing import Callable, Optional
+
+from app.core.config import settings
+from .gemini_context_cache import CACHED_CONTEXT_PROMPT_PLACEHOLDER, context_cache_manager
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY_BACKEND", "TU_API_KEY_DE_GEMINI")
 genai.configure(api_key=GEMINI_API_KEY)
 
-def call_gemini(prompt: str, model: str = "gemini-1.5-flash-latest", max_tokens: int = 2048, expect_json: bool = True) -> dict | str:
+DEFAULT_LLM_MODEL = "gemini-1.5-flash-latest"
+
+def call_gemini(prompt: str, model: str = DEFAULT_LLM_MODEL, max_tokens: int = 2048, expect_json: bool = True, json_mode: bool = False) -> dict | str:
     try:
+        generation_config = {
+            "max_output_tokens": max_tokens,
+            "temperature": 0.2,
+        }
+        if json_mode:
+            # Salida JSON estructurada: el modelo no añade texto alrededor del objeto.
+            generation_config["response_mime_type"] = "application/json"
         model_instance = genai.GenerativeModel(model)
         response = model_instance.generate_content(
             prompt,
-            generation_config={
-                "max_output_tokens": max_tokens,
-                "temperature": 0.2,
-            }
+            generation_config=generation_config
         )
         # El texto generado puede estar en response.text o en response.candidates[0].content.parts[0].text
         result_text = getattr(response, "text", None)
         if not result_text and hasattr(response, "candidates"):
             # Fallback para otras versiones
             result_text = response.candidates[0].content.parts[0].text
-        if expect_json:
-            match = re.search(r'\{.*\}', result_text, re.DOTALL)
-            if match:
-                return json.loads(match.group(0))
-            else:
-                raise ValueError("No se encontró JSON en la respuesta de Gemini")
+        return _parse_result_text(result_text, expect_json)
+    except Exception as e:
+        print(f"Error llamando a Gemini: {e}")
+        return {"error": str(e)}
+
+def _parse_result_text(result_text: str, expect_json: bool) -> dict | str:
+    if expect_json:
+        match = re.search(r'\{.*\}', result_text, re.DOTALL)
+        if match:
+            return json.loads(match.group(0))
         else:
-            return result_text.strip()
+            raise ValueError("No se encontró JSON en la respuesta de Gemini")
+    else:
+        return result_text.strip()
+
+async def call_gemini_with_pdf_context(build_prompt: Callable[[str], str], pdf_id: Optional[str], pdf_text: str, model: str = DEFAULT_LLM_MODEL, max_tokens: int = 2048, expect_json: bool = True, json_mode: bool = False) -> dict | str:
+    """
+    Como `call_gemini`, con el texto de un PDF como contexto. `build_prompt(texto)` construye el prompt a partir
+    del texto del PDF o, si está cacheado, de una referencia breve a él. Con contenido cacheado la llamada va por
+    la API REST (respeta GEMINI_API_BASE_URL) mediante `post_generate_content`, que recrea el contenido caducado
+    y, si vuelve a fallar, reenvía el texto en línea.
+    """
+    if not pdf_id or not context_cache_manager.should_cache(pdf_text):
+        return await asyncio.to_thread(call_gemini, build_prompt(pdf_text), model, max_tokens, expect_json, json_mode)
+
+    generation_config = {
+        "maxOutputTokens": max_tokens,
+        "temperature": 0.2,
+    }
+    if json_mode:
+        generation_config["responseMimeType"] = "application/json"
+
+    def build_payload(cache_name: Optional[str]) -> dict:
+        prompt = build_prompt(CACHED_CONTEXT_PROMPT_PLACEHOLDER if cache_name else pdf_text)
+        payload = {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": generation_config,
+        }
+        if cache_name:
+            payload["cachedContent"] = cache_name
+        return payload
+
+    api_url = f"{settings.GEMINI_API_BASE_URL}/models/{model}:generateContent?key={settings.GEMINI_API_KEY_BACKEND}"
+    try:
+        async with httpx.AsyncClient(timeout=settings.EXAM_GEN_LLM_TIMEOUT_SECONDS) as client:
+            response = await context_cache_manager.post_generate_content(client, api_url, build_payload, pdf_id, pdf_text, model)
+            response.raise_for_status()
+        parts = response.json()["candidates"][0]["content"]["parts"]
+        return _parse_result_text("".join(part.get("text", "") for part in parts), expect_json)
     except Exception as e:
         print(f"Error llamando a Gemini: {e}")
-        return {"error": str(e)} 
\ No newline at end of file
+        return {"error": str(e)}
@@ -0,0 +1,127 @@
+# ia_backend/app/services/pdf_content_cache.py
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Literal, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _CachedPdfText:
+    __slots__ = ("text", "source", "mtime_ns", "size", "nbytes")
+
+    def __init__(self, text: str, source: Literal["file", "pinecone"], mtime_ns: int, size: int):
+        self.text = text
+        self.source = source
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.nbytes = len(text.encode("utf-8"))
+
+
+class PdfContentCache:
+    """
+    Caché LRU en proceso del texto de los PDFs, indexada por pdf_id y acotada en número de
+    entradas y en bytes. Las entradas leídas de `processed_data/` se validan contra el mtime
+    y tamaño del archivo; las recuperadas de Pinecone (fallback) viven hasta que se invalidan.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries if max_entries is not None else settings.PDF_CONTENT_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes if max_bytes is not None else settings.PDF_CONTENT_CACHE_MAX_BYTES
+        self._entries: "OrderedDict[str, _CachedPdfText]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, pdf_id: str, entry: _CachedPdfText) -> None:
+        if entry.nbytes > self.max_bytes:
+            logger.debug(f"PdfContentCache: Texto de {pdf_id} ({entry.nbytes} bytes) supera el límite de la caché. No se almacena.")
+            self._remove(pdf_id)
+            return
+        self._remove(pdf_id)
+        self._entries[pdf_id] = entry
+        self._total_bytes += entry.nbytes
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            evicted_id, evicted = self._entries.popitem(last=False)
+            self._total_bytes -= evicted.nbytes
+            logger.debug(f"PdfContentCache: Entrada {evicted_id} desalojada (LRU).")
+
+    def _remove(self, pdf_id: str) -> bool:
+        entry = self._entries.pop(pdf_id, None)
+        if entry is None:
+            return False
+        self._total_bytes -= entry.nbytes
+        return True
+
+    def get_file_text(self, pdf_id: str, txt_file_path: str) -> Optional[str]:
+        """Devuelve el texto completo del archivo, leyéndolo solo si cambió su mtime/tamaño. None si no existe."""
+        try:
+            stat_result = os.stat(txt_file_path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            entry = self._entries.get(pdf_id)
+            if entry and entry.source == "file" and entry.mtime_ns == stat_result.st_mtime_ns and entry.size == stat_result.st_size:
+                self._entries.move_to_end(pdf_id)
+                self.hits += 1
+                return entry.text
+            self.misses += 1
+        with open(txt_file_path, "r", encoding="utf-8") as f:
+            full_text = f.read()
+        with self._lock:
+            self._store(pdf_id, _CachedPdfText(full_text, "file", stat_result.st_mtime_ns, stat_result.st_size))
+        return full_text
+
+    def get_fallback_text(self, pdf_id: str) -> Optional[str]:
+        """Texto recuperado previamente de Pinecone para este PDF, si existe."""
+        with self._lock:
+            entry = self._entries.get(pdf_id)
+            if entry and entry.source == "pinecone":
+                self._entries.move_to_end(pdf_id)
+                self.hits += 1
+                return entry.text
+            return None
+
+    def put_fallback_text(self, pdf_id: str, text: str) -> None:
+        with self._lock:
+            self._store(pdf_id, _CachedPdfText(text, "pinecone", 0, len(text)))
+
+    def invalidate(self, pdf_id: str) -> bool:
+        with self._lock:
+            return self._remove(pdf_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Tuple[int, int, int, int]:
+        """(entradas, bytes, hits, misses)"""
+        with self._lock:
+            return len(self._entries), self._total_bytes, self.hits, self.misses
+
+
+pdf_content_cache = PdfContentCache()
+
+# Otras cachés derivadas del texto de un PDF se registran aquí para invalidarse junto con él.
+_invalidation_listeners: List[Callable[[str], None]] = []
+
+
+def register_pdf_invalidation_listener(listener: Callable[[str], None]) -> None:
+    if listener not in _invalidation_listeners:
+        _invalidation_listeners.append(listener)
+
+
+def invalidate_pdf_caches(pdf_id: str) -> None:
+    """Invalida el texto cacheado de un PDF y todo lo derivado de él (llamar al eliminar o re-ingestar)."""
+    removed = pdf_content_cache.invalidate(pdf_id)
+    for listener in _invalidation_listeners:
+        try:
+            listener(pdf_id)
+        except Exception as e:
+            logger.warning(f"PdfContentCache: Error en listener de invalidación para {pdf_id}: {e}")
+    logger.info(f"PdfContentCache: Cachés invalidadas para {pdf_id} (texto en caché: {'sí' if removed else 'no'}).")
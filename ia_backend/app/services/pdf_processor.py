@@ -18,6 +18,7 @@ import firebase_admin
 from firebase_admin import storage, firestore, credentials
 
 from app.core.config import settings
+from app.services.pdf_content_cache import invalidate_pdf_caches
 
 logger = logging.getLogger(__name__)
 
@@ -114,6 +115,8 @@ def extract_text_and_create_chunks(file_path: str, pdf_id: str, user_id: str) ->
             logger.info(f"Successfully saved full text for PDF {pdf_id} to {txt_file_path}")
         except Exception as e_save:
             logger.error(f"Failed to save full text for PDF {pdf_id} to {txt_file_path}: {e_save}")
+        # Re-ingesta: descartar el texto cacheado (y lo derivado de él) de la versión anterior.
+        invalidate_pdf_caches(pdf_id)
 
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=settings.CHUNK_SIZE,
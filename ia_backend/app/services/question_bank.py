@@ -0,0 +1,162 @@
+# ia_backend/app/services/question_bank.py
+import gzip
+import json
+import logging
+import os
+import random
+import threading
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
+
+from pydantic import TypeAdapter, ValidationError
+
+from app.core.config import settings
+from app.models.schemas import QuestionOutput, QuestionType
+from app.services.pdf_content_cache import register_pdf_invalidation_listener
+from app.services.question_similarity import QuestionSimilarityIndex
+
+logger = logging.getLogger(__name__)
+
+_BANK_FORMAT_VERSION = 1
+_question_output_adapter = TypeAdapter(QuestionOutput)
+
+
+def _enum_value(value: Any) -> str:
+    return value.value if hasattr(value, "value") else str(value)
+
+
+class QuestionBank:
+    """
+    Banco de preguntas precalculadas por pdf_id. Cada PDF tiene un archivo JSON comprimido con gzip
+    en `QUESTION_BANK_DIR` con entradas compactas {"t": tipo, "d": dificultad, "l": idioma, "q": pregunta}
+    (la pregunta sin id; se asigna uno nuevo al sacarla del banco). Los bancos se mantienen en memoria
+    tras la primera lectura y se escriben de forma atómica.
+    """
+
+    def __init__(self, base_dir: Optional[str] = None):
+        self.base_dir = base_dir or settings.QUESTION_BANK_DIR
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, pdf_id: str) -> str:
+        return os.path.join(self.base_dir, f"{pdf_id}.json.gz")
+
+    def _load(self, pdf_id: str) -> List[Dict[str, Any]]:
+        # Debe llamarse con el lock tomado.
+        if pdf_id in self._entries:
+            return self._entries[pdf_id]
+        entries: List[Dict[str, Any]] = []
+        path = self._path(pdf_id)
+        if os.path.exists(path):
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("v") == _BANK_FORMAT_VERSION:
+                    entries = data.get("entries", [])
+                else:
+                    logger.warning(f"QuestionBank: Versión de formato desconocida en {path}. Se ignora el banco.")
+            except (OSError, ValueError) as e:
+                logger.warning(f"QuestionBank: No se pudo leer el banco de {pdf_id} ({e}). Se empieza vacío.")
+        self._entries[pdf_id] = entries
+        return entries
+
+    def _save(self, pdf_id: str, entries: List[Dict[str, Any]]) -> None:
+        # Debe llamarse con el lock tomado.
+        os.makedirs(self.base_dir, exist_ok=True)
+        path = self._path(pdf_id)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump({"v": _BANK_FORMAT_VERSION, "entries": entries}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def count_available(self, pdf_id: str, difficulty: str, language: str) -> Dict[str, int]:
+        """Preguntas disponibles por tipo (valor de QuestionType) para una dificultad e idioma."""
+        difficulty, language = _enum_value(difficulty), _enum_value(language)
+        counts = {question_type.value: 0 for question_type in QuestionType}
+        with self._lock:
+            for entry in self._load(pdf_id):
+                if entry["d"] == difficulty and entry["l"] == language:
+                    counts[entry["t"]] = counts.get(entry["t"], 0) + 1
+        return counts
+
+    def add_questions(self, pdf_id: str, questions: Sequence[QuestionOutput], difficulty: str, language: str) -> int:
+        """Añade preguntas al banco descartando las casi duplicadas de las ya guardadas. Devuelve cuántas se añadieron."""
+        if not questions:
+            return 0
+        difficulty, language = _enum_value(difficulty), _enum_value(language)
+        with self._lock:
+            entries = self._load(pdf_id)
+            similarity_index = QuestionSimilarityIndex()
+            similarity_index.extend([entry["q"]["text"] for entry in entries if entry["l"] == language])
+            added = 0
+            for question in questions:
+                if similarity_index.find_near_duplicate(question.text) is not None:
+                    continue
+                entries.append({
+                    "t": _enum_value(question.type),
+                    "d": difficulty,
+                    "l": language,
+                    "q": question.model_dump(mode="json", exclude={"id"}, exclude_none=True),
+                })
+                similarity_index.add(question.text)
+                added += 1
+            if added:
+                self._save(pdf_id, entries)
+        logger.info(f"QuestionBank (pdf_id: {pdf_id}): {added}/{len(questions)} preguntas añadidas ({difficulty}, {language}). Total: {len(entries)}.")
+        return added
+
+    def draw(
+        self,
+        pdf_id: str,
+        counts_by_type: Dict[str, int],
+        difficulty: str,
+        language: str,
+        seed: Optional[int] = None
+    ) -> List[QuestionOutput]:
+        """
+        Saca al azar hasta `counts_by_type[tipo]` preguntas de cada tipo con la dificultad e idioma pedidos.
+        Las preguntas se devuelven con ids nuevos; el banco no se modifica.
+        """
+        difficulty, language = _enum_value(difficulty), _enum_value(language)
+        with self._lock:
+            candidates_by_type: Dict[str, List[Dict[str, Any]]] = {}
+            for entry in self._load(pdf_id):
+                if entry["d"] == difficulty and entry["l"] == language:
+                    candidates_by_type.setdefault(entry["t"], []).append(entry)
+
+        rng = random.Random(seed)
+        drawn: List[QuestionOutput] = []
+        for question_type, count in counts_by_type.items():
+            candidates = candidates_by_type.get(_enum_value(question_type), [])
+            if count <= 0 or not candidates:
+                continue
+            for entry in rng.sample(candidates, min(count, len(candidates))):
+                try:
+                    drawn.append(_question_output_adapter.validate_python({**entry["q"], "id": str(uuid.uuid4()), "type": QuestionType(entry["t"])}))
+                except ValidationError as ve:
+                    logger.warning(f"QuestionBank (pdf_id: {pdf_id}): Entrada inválida omitida: {ve}")
+        return drawn
+
+    def delete(self, pdf_id: str) -> None:
+        with self._lock:
+            self._entries.pop(pdf_id, None)
+            try:
+                os.remove(self._path(pdf_id))
+                logger.info(f"QuestionBank: Banco de preguntas de {pdf_id} eliminado.")
+            except FileNotFoundError:
+                pass
+
+    def stats(self, pdf_id: str) -> Dict[str, Dict[str, int]]:
+        """{"dificultad/idioma": {tipo: cantidad}} para inspección."""
+        summary: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            for entry in self._load(pdf_id):
+                bucket = summary.setdefault(f"{entry['d']}/{entry['l']}", {})
+                bucket[entry["t"]] = bucket.get(entry["t"], 0) + 1
+        return summary
+
+
+question_bank = QuestionBank()
+
+# El banco depende del texto del PDF: se descarta cuando el PDF se re-ingesta o se elimina.
+register_pdf_invalidation_listener(question_bank.delete)
@@ -0,0 +1,199 @@
+# ia_backend/app/services/question_similarity.py
+import logging
+import re
+import unicodedata
+import zlib
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.keyword_extractor import STOPWORDS
+
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+
+
+def normalize_question_text(text: str) -> str:
+    """Minúsculas, sin tildes ni puntuación (los dígitos se conservan): la forma canónica usada para comparar preguntas."""
+    without_accents = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", " ", without_accents.lower()).strip()
+
+
+# Palabras vacías y de plantilla de enunciado ("¿Qué función cumple...?", "Explica cómo se produce..."): dos preguntas
+# que solo comparten estas palabras no son parecidas. Se comparan ya normalizadas (sin tildes).
+_IGNORED_TERMS = frozenset(normalize_question_text(word) for word in STOPWORDS) | frozenset("""
+cual cuales que quien como cuando donde cuanto cuantos cuantas funcion funciones cumple cumplen papel rol
+describe describa explica explique define defina menciona mencione indica indique identifica identifique
+nombra nombre compara compare justifica justifique analiza analice senala senale selecciona seleccione
+completa complete afirmacion afirmaciones enunciado correcta correcto correctas correctos incorrecta
+verdadero falso opcion opciones respuesta siguiente siguientes principal principales importante
+produce producen ocurre ocurren sucede suceden lleva llevan cabo realiza realizan tiene lugar
+significa consiste caracteriza caracterizan encarga encargan relacion diferencia diferencias entre segun
+""".split())
+
+
+def _terms(normalized_text: str) -> List[str]:
+    """Términos con contenido: sin palabras vacías ni de plantilla. Los números se conservan ("Tema 1" != "Tema 2")."""
+    return [
+        word for word in normalized_text.split()
+        if word not in _IGNORED_TERMS and (len(word) > 1 or word.isdigit())
+    ]
+
+
+def _shingles(normalized_text: str, shingle_size: int) -> List[str]:
+    words = _terms(normalized_text)
+    if len(words) < shingle_size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+
+
+class QuestionSimilarityIndex:
+    """
+    Índice local de similitud entre preguntas. Combina dos señales, ambas sobre los términos con contenido:
+    - MinHash sobre shingles de términos (estimación de Jaccard): detecta reformulaciones mínimas.
+    - Coseno TF-IDF con hashing: detecta preguntas con el mismo vocabulario en otro orden. El IDF se
+      calcula sobre `corpus_texts` (p. ej. los fragmentos del PDF) más las preguntas indexadas, así
+      que los términos que aparecen en todo el documento pesan poco.
+    Una pregunta es casi duplicada si supera cualquiera de los dos umbrales.
+    """
+
+    def __init__(
+        self,
+        num_perm: int = 64,
+        shingle_size: int = 2,
+        n_features: int = 2048,
+        jaccard_threshold: Optional[float] = None,
+        cosine_threshold: Optional[float] = None,
+        seed: int = 1,
+        corpus_texts: Sequence[str] = (),
+    ):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.n_features = n_features
+        self.jaccard_threshold = jaccard_threshold if jaccard_threshold is not None else settings.QUESTION_DEDUP_JACCARD_THRESHOLD
+        self.cosine_threshold = cosine_threshold if cosine_threshold is not None else settings.QUESTION_DEDUP_COSINE_THRESHOLD
+        rng = np.random.default_rng(seed)
+        self._perm_a = rng.integers(1, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+        self._perm_b = rng.integers(0, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+        self.texts: List[str] = []
+        self._signatures = np.empty((0, num_perm), dtype=np.uint64)
+        self._term_weights = np.empty((0, n_features), dtype=np.float32)  # log(1 + tf) por pregunta, sin IDF
+        self._document_frequency = np.zeros(n_features, dtype=np.float64)
+        self._num_documents = 0
+        for text in corpus_texts:
+            self._count_document(self._tf(normalize_question_text(text)))
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def _signature(self, normalized_text: str) -> np.ndarray:
+        shingles = _shingles(normalized_text, self.shingle_size)
+        if not shingles:
+            return np.full(self.num_perm, _MERSENNE_PRIME, dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        # (a * x + b) mod p para cada permutación; a, x < 2^32 así que el producto no desborda uint64.
+        permuted = (hashes[:, None] * self._perm_a[None, :] + self._perm_b[None, :]) % _MERSENNE_PRIME
+        return permuted.min(axis=0)
+
+    def _tf(self, normalized_text: str) -> np.ndarray:
+        counts = np.zeros(self.n_features, dtype=np.float32)
+        terms = _terms(normalized_text)
+        if terms:
+            columns = np.fromiter((zlib.crc32(term.encode("utf-8")) % self.n_features for term in terms), dtype=np.int64, count=len(terms))
+            np.add.at(counts, columns, 1.0)
+        return np.log1p(counts)
+
+    def _count_document(self, tf: np.ndarray) -> None:
+        self._document_frequency += tf > 0
+        self._num_documents += 1
+
+    def _idf(self) -> np.ndarray:
+        return (np.log((1.0 + self._num_documents) / (1.0 + self._document_frequency)) + 1.0).astype(np.float32)
+
+    def scores(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(Jaccard estimado, coseno) de `text` contra cada pregunta del índice."""
+        normalized = normalize_question_text(text)
+        if not self.texts:
+            return np.empty(0), np.empty(0)
+        jaccard = (self._signatures == self._signature(normalized)[None, :]).mean(axis=1)
+        # El IDF cambia al añadir preguntas, así que los vectores se ponderan en cada consulta.
+        idf = self._idf()
+        vectors = self._term_weights * idf
+        norms = np.linalg.norm(vectors, axis=1)
+        norms[norms == 0] = 1.0
+        query = self._tf(normalized) * idf
+        query_norm = float(np.linalg.norm(query)) or 1.0
+        cosine = (vectors @ query) / (norms * query_norm)
+        return jaccard, cosine
+
+    def add(self, text: str) -> int:
+        normalized = normalize_question_text(text)
+        tf = self._tf(normalized)
+        self.texts.append(text)
+        self._signatures = np.vstack([self._signatures, self._signature(normalized)[None, :]])
+        self._term_weights = np.vstack([self._term_weights, tf[None, :]])
+        self._count_document(tf)
+        return len(self.texts) - 1
+
+    def extend(self, texts: Sequence[str]) -> None:
+        for text in texts:
+            self.add(text)
+
+    def find_near_duplicate(self, text: str) -> Optional[int]:
+        """Índice de la pregunta más parecida si `text` es casi duplicada de alguna; None si no."""
+        jaccard, cosine = self.scores(text)
+        if jaccard.size == 0:
+            return None
+        matches = (jaccard >= self.jaccard_threshold) | (cosine >= self.cosine_threshold)
+        if not matches.any():
+            return None
+        return int(np.argmax(np.where(matches, np.maximum(jaccard, cosine), -1.0)))
+
+    def most_similar(self, text: str, k: int) -> List[Tuple[int, float]]:
+        """Las `k` preguntas más parecidas a `text` como (índice, puntuación), de mayor a menor."""
+        jaccard, cosine = self.scores(text)
+        if jaccard.size == 0 or k <= 0:
+            return []
+        scores = np.maximum(jaccard, cosine)
+        order = np.argsort(-scores, kind="stable")[:k]
+        return [(int(i), float(scores[i])) for i in order]
+
+
+def filter_near_duplicates(texts: Sequence[str], existing_texts: Sequence[str] = (), corpus_texts: Sequence[str] = ()) -> List[int]:
+    """
+    Índices de `texts` que se conservan: se descarta cada texto casi duplicado de uno anterior
+    de la misma lista o de `existing_texts`. `corpus_texts` solo aporta las frecuencias para el IDF.
+    """
+    index = QuestionSimilarityIndex(corpus_texts=corpus_texts)
+    index.extend(existing_texts)
+    kept: List[int] = []
+    for position, text in enumerate(texts):
+        if not normalize_question_text(text):
+            continue
+        duplicate_of = index.find_near_duplicate(text)
+        if duplicate_of is not None:
+            logger.debug(f"QuestionSimilarity: '{text[:80]}' descartada por parecido con '{index.texts[duplicate_of][:80]}'.")
+            continue
+        index.add(text)
+        kept.append(position)
+    return kept
+
+
+def select_similar_negatives(query_texts: Sequence[str], candidate_texts: Sequence[str], k: Optional[int] = None) -> List[str]:
+    """
+    Las preguntas de `candidate_texts` más parecidas a alguna de `query_texts` (como máximo `k`,
+    en el orden original). Son las únicas que vale la pena enviar al LLM como ejemplos a evitar.
+    """
+    limit = k if k is not None else settings.REGEN_MAX_NEGATIVE_QUESTIONS
+    if len(candidate_texts) <= limit:
+        return list(candidate_texts)
+    index = QuestionSimilarityIndex()
+    index.extend(candidate_texts)
+    best_scores = np.zeros(len(candidate_texts))
+    for query in query_texts:
+        jaccard, cosine = index.scores(query)
+        best_scores = np.maximum(best_scores, np.maximum(jaccard, cosine))
+    chosen = np.sort(np.argsort(-best_scores, kind="stable")[:limit])
+    return [candidate_texts[i] for i in chosen]
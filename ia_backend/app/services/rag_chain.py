@@ -261,6 +261,33 @@ async def get_rag_response(
         logger.error(f"RAG get_rag_response: Error general: {e}", exc_info=True)
         return ChatResponse(answer=f"Error interno al obtener respuesta del RAG.", sources=[], error=str(e))
 
+def fetch_chunk_embeddings(pdf_id: str, batch_size: int = 100) -> Optional[Tuple[List[str], List[List[float]]]]:
+    """
+    Recupera (textos, vectores) de todos los fragmentos de un PDF almacenados en su namespace de
+    Pinecone, ordenados por chunk_index. Devuelve None si el índice no está disponible.
+    This function is synchronous.
+    """
+    if not pinecone_sdk_client_rag or not settings.PINECONE_INDEX_NAME:
+        return None
+    try:
+        index_instance = pinecone_sdk_client_rag.Index(settings.PINECONE_INDEX_NAME)
+        rows: List[Tuple[int, str, List[float]]] = []
+        for id_batch in index_instance.list(namespace=pdf_id, limit=batch_size):
+            fetched = index_instance.fetch(ids=list(id_batch), namespace=pdf_id)
+            for vector in fetched.vectors.values():
+                metadata = vector.metadata or {}
+                text = metadata.get("text")
+                if text:
+                    rows.append((int(metadata.get("chunk_index", len(rows))), text, list(vector.values)))
+        if not rows:
+            return None
+        rows.sort(key=lambda row: row[0])
+        logger.info(f"RAG: Recuperados {len(rows)} vectores de fragmentos del namespace '{pdf_id}'.")
+        return [row[1] for row in rows], [row[2] for row in rows]
+    except Exception as e:
+        logger.warning(f"RAG: No se pudieron recuperar los vectores del namespace '{pdf_id}': {e}")
+        return None
+
 # FUNCIÓN REINCORPORADA (SÍNCRONA)
 def delete_pdf_vector_store_namespace(pdf_id: str) -> bool:
     """
@@ -0,0 +1,114 @@
+# ia_backend/app/services/result_store.py
+import json
+import logging
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.services.gemini_context_cache import compute_text_hash
+from app.services.pdf_content_cache import register_pdf_invalidation_listener
+
+logger = logging.getLogger(__name__)
+
+# (pdf_id, hash del texto, tipo de resultado, parámetros serializados, semilla)
+ResultKey = Tuple[str, str, str, str, Optional[int]]
+
+
+class ActivityResultStore:
+    """
+    Almacén LRU en proceso de resultados de actividades y herramientas (sopas de letras, crucigramas,
+    mapas...). Cada resultado se guarda como JSON compacto comprimido con zlib, acotado en número de
+    entradas y en bytes. La clave incluye el hash del texto usado, así que un PDF re-ingestado con otro
+    contenido genera una versión nueva; además las entradas del PDF se descartan al re-ingestarlo o borrarlo.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries if max_entries is not None else settings.RESULT_STORE_MAX_ENTRIES
+        self.max_bytes = max_bytes if max_bytes is not None else settings.RESULT_STORE_MAX_BYTES
+        self._entries: "OrderedDict[ResultKey, bytes]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(pdf_id: str, text: str, kind: str, params: Optional[Dict[str, Any]] = None, seed: Optional[int] = None) -> ResultKey:
+        params_json = json.dumps(params or {}, sort_keys=True, separators=(",", ":"), default=str)
+        return (pdf_id, compute_text_hash(text), kind, params_json, seed)
+
+    def _remove(self, key: ResultKey) -> None:
+        payload = self._entries.pop(key, None)
+        if payload is not None:
+            self._total_bytes -= len(payload)
+
+    def get(self, key: ResultKey) -> Optional[Dict[str, Any]]:
+        """Copia nueva del resultado almacenado (el llamador puede modificarla), o None."""
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return json.loads(zlib.decompress(payload))
+
+    def put(self, key: ResultKey, result: Dict[str, Any]) -> None:
+        payload = zlib.compress(json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            self._remove(key)
+            if len(payload) > self.max_bytes:
+                return
+            self._entries[key] = payload
+            self._total_bytes += len(payload)
+            while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted)
+                logger.debug(f"ActivityResultStore: Resultado {evicted_key[2]} de {evicted_key[0]} desalojado (LRU).")
+
+    def invalidate_pdf(self, pdf_id: str) -> int:
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == pdf_id]
+            for key in keys:
+                self._remove(key)
+        if keys:
+            logger.info(f"ActivityResultStore: {len(keys)} resultado(s) de {pdf_id} invalidados.")
+        return len(keys)
+
+    def stats(self) -> Tuple[int, int, int, int]:
+        with self._lock:
+            return len(self._entries), self._total_bytes, self.hits, self.misses
+
+    async def get_or_create(
+        self,
+        pdf_id: Optional[str],
+        text: str,
+        kind: str,
+        producer: Callable[[], Awaitable[Dict[str, Any]]],
+        params: Optional[Dict[str, Any]] = None,
+        seed: Optional[int] = None,
+        force_new: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Devuelve el resultado almacenado para (pdf_id, texto, tipo, parámetros, semilla) o lo genera con
+        `producer` y lo guarda (salvo que contenga errores). `force_new` ignora el resultado almacenado y lo
+        reemplaza por uno nuevo.
+        """
+        if not settings.RESULT_STORE_ENABLED or not pdf_id:
+            return await producer()
+        key = self.make_key(pdf_id, text, kind, params, seed)
+        if not force_new:
+            cached = self.get(key)
+            if cached is not None:
+                logger.info(f"ActivityResultStore: Resultado {kind} de {pdf_id} servido desde el almacén.")
+                return cached
+        result = await producer()
+        # Los resultados con errores (totales o parciales) no se guardan para que el siguiente intento los regenere.
+        if isinstance(result, dict) and not result.get("error") and not result.get("errors"):
+            self.put(key, result)
+        return result
+
+
+activity_result_store = ActivityResultStore()
+register_pdf_invalidation_listener(activity_result_store.invalidate_pdf)
@@ -0,0 +1,33 @@
+# ia_backend/app/services/sse_utils.py
+import asyncio
+import json
+from typing import Any, AsyncIterator, Tuple
+
+
+def format_sse_event(event: str, data: Any) -> str:
+    """Serializa un evento Server-Sent Events (`event:` + `data:` en JSON de una línea)."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def sse_stream_with_heartbeat(events: AsyncIterator[Tuple[str, Any]], heartbeat_seconds: float) -> AsyncIterator[str]:
+    """
+    Convierte un iterador de (evento, datos) en texto SSE. Mientras no llegue ningún evento (p. ej. esperando
+    el primer token del LLM) envía comentarios ": keep-alive" para que los proxies no corten la conexión.
+    """
+    iterator = events.__aiter__()
+    next_event = asyncio.ensure_future(iterator.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({next_event}, timeout=heartbeat_seconds)
+            if not done:
+                yield ": keep-alive\n\n"
+                continue
+            try:
+                event, data = next_event.result()
+            except StopAsyncIteration:
+                return
+            yield format_sse_event(event, data)
+            next_event = asyncio.ensure_future(iterator.__anext__())
+    finally:
+        if not next_event.done():
+            next_event.cancel()
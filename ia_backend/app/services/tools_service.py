@@ -1,22 +1,84 @@
-from typing import List, Dict, Any
+from typing import Awaitable, Callable, List, Dict, Any, Optional
 import google.generativeai as genai
 from ..core.config import settings
-from .llm import call_gemini
+from .llm import call_gemini, call_gemini_with_pdf_context
+from .context_selector import split_text_into_chunks
+from .graph_utils import iter_valid_nodes, layout_graph, merge_partial_graphs, normalize_graph, normalize_label, path_from_root, trim_graph
+from .keyword_extractor import term_key, tokenize
+from .rag_chain import embeddings_model_rag_instance, get_vector_store_for_pdf_retrieval
+import asyncio
 import json
 import logging
+import math
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Descripción de cada tipo de mapa para los prompts del modo jerárquico.
+_MAP_SPECS = {
+    "concept": {
+        "name": "mapa conceptual",
+        "node_types": "1. Conceptos principales (nodos tipo 'concept') 2. Subconceptos (nodos tipo 'subconcept') 3. Relaciones entre conceptos (edges con etiquetas)",
+        "format": '{"nodes": [{"id": "1", "label": "Concepto", "type": "concept"}, ...], "edges": [{"id": "e1", "source": "1", "target": "2", "label": "relación"}, ...]}',
+        "root_type": None,
+        "demoted_type": None,
+    },
+    "mind": {
+        "name": "mapa mental",
+        "node_types": "1. Un único tema central (nodo tipo 'main') 2. Subtemas principales (nodos tipo 'subtopic') 3. Detalles y ejemplos (nodos tipo 'detail')",
+        "format": '{"nodes": [{"id": "1", "label": "Tema", "type": "main"}, ...], "edges": [{"id": "e1", "source": "1", "target": "2"}, ...]}',
+        "root_type": "main",
+        "demoted_type": "subtopic",
+    },
+}
+
 class ToolsService:
     def __init__(self):
         self.model = genai.GenerativeModel('gemini-pro')
         
-    async def generate_concept_map(self, pdf_content: str) -> Dict[str, Any]:
+    def _validate_graph_response(self, response: Any) -> Dict[str, Any]:
+        # Validar que la respuesta sea un JSON válido
+        if isinstance(response, str):
+            try:
+                response = json.loads(response)
+            except json.JSONDecodeError as e:
+                logger.error(f"Error al decodificar JSON de Gemini: {e}")
+                raise ValueError("La respuesta de la IA no es un JSON válido")
+        
+        # Validar estructura básica
+        if not isinstance(response, dict):
+            raise ValueError("La respuesta debe ser un objeto")
+        
+        if "nodes" not in response or "edges" not in response:
+            raise ValueError("La respuesta debe contener 'nodes' y 'edges'")
+        
+        if not isinstance(response["nodes"], list) or not isinstance(response["edges"], list):
+            raise ValueError("'nodes' y 'edges' deben ser listas")
+        
+        return response
+
+    def _use_hierarchical(self, full_text: Optional[str], hierarchical: Optional[bool]) -> bool:
+        if not full_text:
+            return False
+        if hierarchical is None:
+            return len(full_text) > settings.TOOLS_HIERARCHICAL_MIN_CHARS
+        return hierarchical
+
+    async def generate_concept_map(
+        self,
+        pdf_content: str,
+        pdf_id: Optional[str] = None,
+        full_text: Optional[str] = None,
+        hierarchical: Optional[bool] = None,
+    ) -> Dict[str, Any]:
         try:
-            prompt = f"""
+            if self._use_hierarchical(full_text, hierarchical):
+                return await self._postprocess_graph("concept", await self._generate_map_hierarchical("concept", full_text))
+            def build_prompt(prompt_content: str) -> str:
+                return f"""
             Analiza el siguiente contenido y genera un mapa conceptual:
             
-            {pdf_content}
+            {prompt_content}
             
             Genera un mapa conceptual con:
             1. Conceptos principales (nodos tipo 'concept')
@@ -37,38 +99,28 @@ class ToolsService:
             }}
             """
             
-            response = call_gemini(prompt)
-            
-            # Validar que la respuesta sea un JSON válido
-            if isinstance(response, str):
-                try:
-                    response = json.loads(response)
-                except json.JSONDecodeError as e:
-                    logger.error(f"Error al decodificar JSON de Gemini: {e}")
-                    raise ValueError("La respuesta de la IA no es un JSON válido")
-            
-            # Validar estructura básica
-            if not isinstance(response, dict):
-                raise ValueError("La respuesta debe ser un objeto")
-            
-            if "nodes" not in response or "edges" not in response:
-                raise ValueError("La respuesta debe contener 'nodes' y 'edges'")
-            
-            if not isinstance(response["nodes"], list) or not isinstance(response["edges"], list):
-                raise ValueError("'nodes' y 'edges' deben ser listas")
-            
-            return response
+            response = await call_gemini_with_pdf_context(build_prompt, pdf_id, pdf_content)
+            return await self._postprocess_graph("concept", self._validate_graph_response(response))
             
         except Exception as e:
             logger.error(f"Error al generar mapa conceptual: {str(e)}")
             raise
         
-    async def generate_mind_map(self, pdf_content: str) -> Dict[str, Any]:
+    async def generate_mind_map(
+        self,
+        pdf_content: str,
+        pdf_id: Optional[str] = None,
+        full_text: Optional[str] = None,
+        hierarchical: Optional[bool] = None,
+    ) -> Dict[str, Any]:
         try:
-            prompt = f"""
+            if self._use_hierarchical(full_text, hierarchical):
+                return await self._postprocess_graph("mind", await self._generate_map_hierarchical("mind", full_text))
+            def build_prompt(prompt_content: str) -> str:
+                return f"""
             Analiza el siguiente contenido y genera un mapa mental:
             
-            {pdf_content}
+            {prompt_content}
             
             Genera un mapa mental con:
             1. Tema central (nodo tipo 'main')
@@ -91,30 +143,247 @@ class ToolsService:
             }}
             """
             
-            response = call_gemini(prompt)
-            
-            # Validar que la respuesta sea un JSON válido
-            if isinstance(response, str):
-                try:
-                    response = json.loads(response)
-                except json.JSONDecodeError as e:
-                    logger.error(f"Error al decodificar JSON de Gemini: {e}")
-                    raise ValueError("La respuesta de la IA no es un JSON válido")
-            
-            # Validar estructura básica
-            if not isinstance(response, dict):
-                raise ValueError("La respuesta debe ser un objeto")
-            
-            if "nodes" not in response or "edges" not in response:
-                raise ValueError("La respuesta debe contener 'nodes' y 'edges'")
-            
-            if not isinstance(response["nodes"], list) or not isinstance(response["edges"], list):
-                raise ValueError("'nodes' y 'edges' deben ser listas")
-            
-            return response
+            response = await call_gemini_with_pdf_context(build_prompt, pdf_id, pdf_content)
+            return await self._postprocess_graph("mind", self._validate_graph_response(response))
             
         except Exception as e:
             logger.error(f"Error al generar mapa mental: {str(e)}")
             raise
 
+    def _normalize_and_layout(self, kind: str, graph: Dict[str, Any]) -> Dict[str, Any]:
+        spec = _MAP_SPECS[kind]
+        graph = normalize_graph(graph, spec['root_type'], spec['demoted_type'])
+        if settings.TOOLS_MAP_LAYOUT_ENABLED:
+            graph = layout_graph(graph, spec['root_type'], iterations=settings.TOOLS_MAP_LAYOUT_ITERATIONS)
+        return graph
+
+    async def _postprocess_graph(self, kind: str, graph: Dict[str, Any]) -> Dict[str, Any]:
+        """Deduplica nodos, descarta aristas inválidas y añade `position` {x, y} a cada nodo (fuerzas o árbol radial)."""
+        return await asyncio.to_thread(self._normalize_and_layout, kind, graph)
+
+    # --- Modo jerárquico (map-reduce) para documentos largos ---
+    def _split_sections(self, full_text: str) -> List[str]:
+        """Agrupa fragmentos consecutivos en secciones de ~TOOLS_MAP_SECTION_CHARS (como máximo TOOLS_MAP_MAX_SECTIONS)."""
+        section_chars = max(settings.TOOLS_MAP_SECTION_CHARS, math.ceil(len(full_text) / settings.TOOLS_MAP_MAX_SECTIONS))
+        sections: List[str] = []
+        current: List[str] = []
+        current_len = 0
+        for chunk in split_text_into_chunks(full_text, settings.CHUNK_SIZE):
+            if current and current_len + len(chunk) > section_chars:
+                sections.append("".join(current))
+                current, current_len = [], 0
+            current.append(chunk)
+            current_len += len(chunk)
+        if current:
+            sections.append("".join(current))
+        return sections
+
+    async def _generate_section_graph(self, kind: str, section_text: str, section_number: int, total_sections: int, semaphore: asyncio.Semaphore) -> Optional[Dict[str, Any]]:
+        spec = _MAP_SPECS[kind]
+        prompt = f"""
+        Analiza la sección {section_number} de {total_sections} de un documento y genera un {spec['name']} parcial de esa sección:
+        
+        {section_text}
+        
+        Genera como máximo {settings.TOOLS_MAP_SECTION_MAX_NODES} nodos con:
+        {spec['node_types']}
+        
+        Usa etiquetas breves (1 a 5 palabras). Formato de respuesta JSON:
+        {spec['format']}
+        """
+        async with semaphore:
+            response = await asyncio.to_thread(call_gemini, prompt, json_mode=True)
+        try:
+            return self._validate_graph_response(response)
+        except ValueError as e:
+            logger.warning(f"Mapa jerárquico: sección {section_number}/{total_sections} descartada ({e}).")
+            return None
+
+    async def _label_embeddings(self, graphs: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Embeddings de las etiquetas con el modelo del índice; None (n-gramas locales) si no está disponible."""
+        if not settings.TOOLS_MAP_USE_EMBEDDINGS or embeddings_model_rag_instance is None:
+            return None
+        labels = [str(node["label"]).strip() for _, node in iter_valid_nodes(graphs)]
+        try:
+            vectors = await asyncio.to_thread(embeddings_model_rag_instance.embed_documents, labels)
+            return np.asarray(vectors, dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Mapa jerárquico: no se pudieron calcular embeddings de etiquetas ({e}). Se usan n-gramas locales.")
+            return None
+
+    async def _consolidate_graph(self, kind: str, merged: Dict[str, Any]) -> Dict[str, Any]:
+        """Llamada final pequeña (solo etiquetas y relaciones, sin el texto) que poda y unifica el grafo fusionado."""
+        spec = _MAP_SPECS[kind]
+        max_nodes = settings.TOOLS_MAP_FINAL_MAX_NODES
+        node_lines = "\n".join(f"{n['id']} | {n['label']} | {n['type']} | apariciones: {n['support']}" for n in merged["nodes"])
+        edge_lines = "\n".join(f"{e['source']} -> {e['target']}" + (f" ({e['label']})" if e.get("label") else "") for e in merged["edges"])
+        prompt = f"""
+        Estos nodos y relaciones se extrajeron por secciones de un mismo documento para un {spec['name']}:
+        
+        Nodos (id | etiqueta | tipo | apariciones):
+        {node_lines}
+        
+        Relaciones:
+        {edge_lines}
+        
+        Consolida un único {spec['name']} de como máximo {max_nodes} nodos con:
+        {spec['node_types']}
+        Reutiliza los ids existentes, une nodos que sean el mismo concepto, prioriza los que aparecen en más secciones
+        y puedes añadir relaciones entre nodos existentes. Formato de respuesta JSON:
+        {spec['format']}
+        """
+        response = await asyncio.to_thread(call_gemini, prompt, max_tokens=4096, json_mode=True)
+        try:
+            consolidated = self._validate_graph_response(response)
+        except ValueError as e:
+            logger.warning(f"Mapa jerárquico: consolidación fallida ({e}). Se recorta el grafo fusionado localmente.")
+            return trim_graph(merged, max_nodes, spec['root_type'], spec['demoted_type'])
+        if not consolidated["nodes"]:
+            return trim_graph(merged, max_nodes, spec['root_type'], spec['demoted_type'])
+        return consolidated
+
+    async def _generate_map_hierarchical(self, kind: str, full_text: str) -> Dict[str, Any]:
+        """
+        Map-reduce: un grafo parcial por sección (en paralelo, acotado por TOOLS_MAP_MAX_CONCURRENCY), fusión
+        local de nodos por etiqueta normalizada y similitud de embeddings, y una consolidación final pequeña.
+        """
+        sections = self._split_sections(full_text)
+        semaphore = asyncio.Semaphore(settings.TOOLS_MAP_MAX_CONCURRENCY)
+        partial_graphs = await asyncio.gather(*(
+            self._generate_section_graph(kind, section, index + 1, len(sections), semaphore)
+            for index, section in enumerate(sections)
+        ))
+        partial_graphs = [graph for graph in partial_graphs if graph]
+        if not partial_graphs:
+            raise ValueError("No se pudo generar ningún grafo parcial del documento")
+        logger.info(f"Mapa jerárquico ({kind}): {len(partial_graphs)}/{len(sections)} secciones con grafo parcial.")
+
+        label_embeddings = await self._label_embeddings(partial_graphs)
+        merged = await asyncio.to_thread(
+            merge_partial_graphs, partial_graphs, settings.TOOLS_MAP_SIMILARITY_THRESHOLD, label_embeddings
+        )
+        if len(partial_graphs) == 1 and len(merged["nodes"]) <= settings.TOOLS_MAP_FINAL_MAX_NODES:
+            return merged
+        return await self._consolidate_graph(kind, merged)
+
+    # --- Expansión bajo demanda de nodos del mapa mental ---
+    def _rank_chunks_locally(self, query: str, text: str, max_chunks: int) -> List[str]:
+        """Fragmentos del texto con más términos de la consulta (respaldo cuando no hay índice vectorial)."""
+        query_terms = {term_key(token) for token in tokenize(query)}
+        if not query_terms:
+            return []
+        scored = []
+        for position, chunk in enumerate(split_text_into_chunks(text, settings.CHUNK_SIZE)):
+            chunk_terms = [term_key(token) for token in tokenize(chunk)]
+            score = sum(1 for term in chunk_terms if term in query_terms)
+            if score:
+                scored.append((score, position, chunk))
+        top = sorted(scored, key=lambda item: (-item[0], item[1]))[:max_chunks]
+        return [chunk for _, _, chunk in sorted(top, key=lambda item: item[1])]
+
+    async def _retrieve_node_context(
+        self,
+        pdf_id: str,
+        query: str,
+        load_fallback_text: Optional[Callable[[], Awaitable[Optional[str]]]] = None,
+    ) -> str:
+        """
+        Solo los fragmentos del PDF relevantes para el nodo: búsqueda en el índice vectorial o, si no devuelve
+        nada, ranking léxico local sobre el texto completo (que solo entonces se carga con `load_fallback_text`).
+        """
+        num_chunks = settings.TOOLS_EXPAND_NUM_CHUNKS
+        chunks: List[str] = []
+        vector_store = await asyncio.to_thread(get_vector_store_for_pdf_retrieval, pdf_id)
+        if vector_store:
+            try:
+                retriever = vector_store.as_retriever(search_kwargs={"k": num_chunks})
+                docs = await retriever.aget_relevant_documents(query)
+                chunks = [doc.page_content for doc in docs if doc.page_content]
+            except Exception as e:
+                logger.warning(f"Expansión de nodo ({pdf_id}): búsqueda vectorial fallida ({e}). Se usa ranking local.")
+        if not chunks and load_fallback_text:
+            fallback_text = await load_fallback_text()
+            if fallback_text:
+                chunks = await asyncio.to_thread(self._rank_chunks_locally, query, fallback_text, num_chunks)
+        return "\n\n---\n\n".join(chunks)[: settings.TOOLS_EXPAND_MAX_CONTEXT_CHARS]
+
+    async def expand_mind_map_node(
+        self,
+        pdf_id: str,
+        mind_map: Dict[str, Any],
+        node_id: str,
+        max_children: Optional[int] = None,
+        load_fallback_text: Optional[Callable[[], Awaitable[Optional[str]]]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Genera solo los hijos de `node_id` en un mapa mental existente, con el contexto recuperado para la
+        rama (ruta desde el tema central). Devuelve el mapa completo actualizado, con posiciones, y los ids nuevos.
+        Lanza una excepción si la IA falla o no propone ningún hijo nuevo, para que no se guarde el resultado.
+        """
+        graph = normalize_graph(self._validate_graph_response(mind_map), "main", "subtopic")
+        node_id = str(node_id)
+        path = path_from_root(graph, node_id)
+        if not path:
+            raise ValueError(f"El nodo '{node_id}' no existe en el mapa")
+        node = path[-1]
+        parent_id = path[-2]["id"] if len(path) > 1 else None
+        neighbour_ids = {e["target"] for e in graph["edges"] if e["source"] == node_id} | {e["source"] for e in graph["edges"] if e["target"] == node_id}
+        existing_children = [n["label"] for n in graph["nodes"] if n["id"] in neighbour_ids and n["id"] != parent_id]
+        branch = " > ".join(n["label"] for n in path)
+        max_children = max_children or settings.TOOLS_EXPAND_MAX_CHILDREN
+
+        context = await self._retrieve_node_context(pdf_id, branch, load_fallback_text)
+        if not context:
+            raise ValueError("No se pudo recuperar contenido del PDF para expandir el nodo")
+        child_type = "subtopic" if node.get("type") == "main" else "detail"
+        existing_text = ", ".join(existing_children) if existing_children else "ninguno"
+        prompt = f"""
+        En un mapa mental sobre un documento, expande la rama "{branch}" con los fragmentos relevantes del documento:
+        
+        {context}
+        
+        Genera como máximo {max_children} hijos del nodo "{node['label']}": subtemas, detalles o ejemplos que aparezcan
+        en los fragmentos. No repitas los hijos que ya tiene ({existing_text}) ni otros nodos de la rama.
+        Usa etiquetas breves (1 a 5 palabras). Formato de respuesta JSON:
+        {{"children": [{{"label": "Hijo"}}, ...]}}
+        """
+        response = await asyncio.to_thread(call_gemini, prompt, json_mode=True)
+        if not isinstance(response, dict) or "error" in response:
+            error = response.get("error") if isinstance(response, dict) else "respuesta no válida"
+            raise RuntimeError(f"La IA no pudo expandir el nodo '{node['label']}': {error}")
+        children = response.get("children") or []
+
+        known_labels = {normalize_label(n["label"]) for n in graph["nodes"]}
+        used_ids = {n["id"] for n in graph["nodes"]}
+        used_edge_ids = {e["id"] for e in graph["edges"]}
+        new_node_ids: List[str] = []
+        for child in children:
+            label = str(child.get("label", "")).strip() if isinstance(child, dict) else str(child).strip()
+            normalized = normalize_label(label)
+            if not label or normalized in known_labels:
+                continue
+            known_labels.add(normalized)
+            child_id = f"{node_id}.{len(new_node_ids) + 1}"
+            while child_id in used_ids:
+                child_id += "_"
+            edge_id = f"e{node_id}.{len(new_node_ids) + 1}"
+            while edge_id in used_edge_ids:
+                edge_id += "_"
+            used_ids.add(child_id)
+            used_edge_ids.add(edge_id)
+            graph["nodes"].append({"id": child_id, "label": label, "type": child_type})
+            graph["edges"].append({"id": edge_id, "source": node_id, "target": child_id})
+            new_node_ids.append(child_id)
+            if len(new_node_ids) == max_children:
+                break
+        if not new_node_ids:
+            raise ValueError(f"La IA no propuso hijos nuevos para el nodo '{node['label']}'")
+        node["expanded"] = True
+        logger.info(f"Expansión de nodo ({pdf_id}): '{node['label']}' con {len(new_node_ids)} hijo(s) nuevos.")
+
+        result = await self._postprocess_graph("mind", graph)
+        result["expandedNodeId"] = node_id
+        result["newNodeIds"] = new_node_ids
+        return result
+
 tools_service = ToolsService() 
\ No newline at end of file
@@ -0,0 +1,299 @@
+# ia_backend/app/services/word_search_engine.py
+"""
+Motor de colocación de sopas de letras.
+
+Coloca las palabras con búsqueda con retroceso (backtracking) sobre una cuadrícula NumPy: para cada
+palabra se calculan de forma vectorizada todas las posiciones válidas en las direcciones permitidas,
+se ordenan por letras compartidas con palabras ya colocadas (más un desempate aleatorio con semilla)
+y se exploran las mejores. Si una palabra bloquea la búsqueda se marca como no colocada y se reintenta
+con el resto; agotado el presupuesto de nodos, las palabras restantes se colocan de forma voraz. El
+informe `placed`/`unplaced` siempre refleja la cuadrícula devuelta.
+Con la misma semilla, palabras y parámetros el resultado es idéntico.
+"""
+import logging
+import random
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.exam_variants import variant_seed
+
+logger = logging.getLogger(__name__)
+
+# (fila, columna) por paso. Las cuatro primeras son las direcciones "hacia delante" del generador anterior.
+DIRECTIONS: Dict[str, Tuple[int, int]] = {
+    "derecha": (0, 1),
+    "abajo": (1, 0),
+    "abajo_derecha": (1, 1),
+    "arriba_derecha": (-1, 1),
+    "izquierda": (0, -1),
+    "arriba": (-1, 0),
+    "arriba_izquierda": (-1, -1),
+    "abajo_izquierda": (1, -1),
+}
+FORWARD_DIRECTIONS = ("derecha", "abajo", "abajo_derecha", "arriba_derecha")
+
+MIN_GRID_SIZE = 5
+_BASE_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_EMPTY = ""
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def normalize_word(word: str) -> str:
+    """Mayúsculas, sin tildes ni espacios/guiones; conserva la Ñ."""
+    letters = []
+    for char in str(word).upper():
+        if char == "Ñ":
+            letters.append(char)
+            continue
+        base = unicodedata.normalize("NFD", char)[0]
+        if base.isalpha() and base.isascii():
+            letters.append(base)
+    return "".join(letters)
+
+
+def _clamp_size(size: int) -> int:
+    return max(MIN_GRID_SIZE, min(int(size), settings.WORD_SEARCH_MAX_SIZE))
+
+
+def _start_range(step: int, length: int, size: int) -> np.ndarray:
+    if step > 0:
+        return np.arange(0, size - length + 1)
+    if step < 0:
+        return np.arange(length - 1, size)
+    return np.arange(0, size)
+
+
+def _candidate_placements(
+    grid: np.ndarray,
+    letters: np.ndarray,
+    direction_steps: Sequence[Tuple[int, int]],
+    rng: np.random.Generator,
+    branching: int,
+) -> List[Tuple[int, int, int]]:
+    """Hasta `branching` colocaciones (fila, columna, índice de dirección) válidas, de mejor a peor."""
+    size = grid.shape[0]
+    length = len(letters)
+    steps = np.arange(length)
+    starts_r, starts_c, dirs, overlaps = [], [], [], []
+    for direction_index, (dr, dc) in enumerate(direction_steps):
+        rows0 = _start_range(dr, length, size)
+        cols0 = _start_range(dc, length, size)
+        if rows0.size == 0 or cols0.size == 0:
+            continue
+        rows = rows0[:, None, None] + dr * steps
+        cols = cols0[None, :, None] + dc * steps
+        cells = grid[rows, cols]
+        matches = cells == letters
+        valid = np.all(matches | (cells == _EMPTY), axis=-1)
+        overlap = matches.sum(axis=-1)
+        # Una palabra cubierta por completo por otra quedaría "escondida" dentro de ella.
+        valid &= overlap < length
+        r_idx, c_idx = np.nonzero(valid)
+        if r_idx.size == 0:
+            continue
+        starts_r.append(rows0[r_idx])
+        starts_c.append(cols0[c_idx])
+        dirs.append(np.full(r_idx.size, direction_index))
+        overlaps.append(overlap[r_idx, c_idx])
+    if not starts_r:
+        return []
+    all_r = np.concatenate(starts_r)
+    all_c = np.concatenate(starts_c)
+    all_d = np.concatenate(dirs)
+    # El desempate aleatorio (< 1) nunca supera a una letra compartida más.
+    scores = np.concatenate(overlaps) + rng.random(all_r.size) * 0.99
+    best = np.argsort(-scores, kind="stable")[:branching]
+    return [(int(all_r[i]), int(all_c[i]), int(all_d[i])) for i in best]
+
+
+def _path(row: int, col: int, step: Tuple[int, int], length: int) -> Tuple[np.ndarray, np.ndarray]:
+    steps = np.arange(length)
+    return row + step[0] * steps, col + step[1] * steps
+
+
+def _backtrack_place(
+    grid: np.ndarray,
+    words: List[str],
+    direction_steps: Sequence[Tuple[int, int]],
+    rng: np.random.Generator,
+    branching: int,
+    node_budget: int,
+) -> Tuple[List[Optional[Tuple[int, int, int]]], int, int]:
+    """
+    Intenta colocar todas las palabras (en orden) con retroceso. Devuelve las colocaciones (None donde
+    no se llegó), el índice de la palabra más profunda que no se pudo colocar (-1 si todas) y los nodos usados.
+    Si falla, la cuadrícula queda con la rama que más palabras colocó.
+    """
+    letter_arrays = [np.array(list(word)) for word in words]
+    placements: List[Optional[Tuple[int, int, int]]] = [None] * len(words)
+    best_placements: List[Optional[Tuple[int, int, int]]] = list(placements)
+    state = {"nodes": 0, "deepest": -1}
+
+    def search(index: int) -> bool:
+        if index == len(words):
+            return True
+        if index > state["deepest"]:
+            state["deepest"] = index
+            best_placements[:] = placements
+        for row, col, direction_index in _candidate_placements(grid, letter_arrays[index], direction_steps, rng, branching):
+            if state["nodes"] >= node_budget:
+                return False
+            state["nodes"] += 1
+            rows, cols = _path(row, col, direction_steps[direction_index], len(words[index]))
+            newly_filled = grid[rows, cols] == _EMPTY
+            grid[rows, cols] = letter_arrays[index]
+            placements[index] = (row, col, direction_index)
+            if search(index + 1):
+                return True
+            grid[rows[newly_filled], cols[newly_filled]] = _EMPTY
+            placements[index] = None
+        return False
+
+    if search(0):
+        return placements, -1, state["nodes"]
+    # Se deja la cuadrícula en el estado de la rama que más palabras colocó.
+    grid[:] = _EMPTY
+    for word, letters, placement in zip(words, letter_arrays, best_placements):
+        if placement is None:
+            break
+        rows, cols = _path(placement[0], placement[1], direction_steps[placement[2]], len(word))
+        grid[rows, cols] = letters
+    return best_placements, state["deepest"], state["nodes"]
+
+
+def _greedy_complete(
+    grid: np.ndarray,
+    words: List[str],
+    placements: List[Optional[Tuple[int, int, int]]],
+    start_index: int,
+    direction_steps: Sequence[Tuple[int, int]],
+    rng: np.random.Generator,
+) -> None:
+    """Coloca las palabras desde `start_index` en su mejor posición disponible, sin retroceso."""
+    for index in range(start_index, len(words)):
+        letters = np.array(list(words[index]))
+        candidates = _candidate_placements(grid, letters, direction_steps, rng, 1)
+        if not candidates:
+            continue
+        row, col, direction_index = candidates[0]
+        rows, cols = _path(row, col, direction_steps[direction_index], len(words[index]))
+        grid[rows, cols] = letters
+        placements[index] = candidates[0]
+
+
+def generate_word_search(
+    words: Sequence[str],
+    size: int = 15,
+    seed: Optional[int] = None,
+    allow_reverse: bool = True,
+    branching: Optional[int] = None,
+    node_budget: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Genera una sopa de letras reproducible.
+
+    Devuelve `grid` (lista de filas), `placed` (palabra, fila, columna, dirección y celda final de cada
+    palabra presente en la cuadrícula), `unplaced` (palabras que no caben o bloqueaban la búsqueda),
+    `size` y `seed` (la usada, también si se generó aleatoriamente).
+    """
+    size = _clamp_size(size)
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**31)
+    branching = branching or settings.WORD_SEARCH_BRANCHING
+    node_budget = node_budget or settings.WORD_SEARCH_NODE_BUDGET
+    rng = np.random.default_rng(seed)
+    direction_names = list(DIRECTIONS) if allow_reverse else list(FORWARD_DIRECTIONS)
+    direction_steps = [DIRECTIONS[name] for name in direction_names]
+
+    original_by_normalized: Dict[str, str] = {}
+    unplaced: List[str] = []
+    for word in words:
+        normalized = normalize_word(word)
+        if len(normalized) < 2 or normalized in original_by_normalized:
+            continue
+        if len(normalized) > size:
+            unplaced.append(str(word))
+            continue
+        original_by_normalized[normalized] = str(word)
+    # Las palabras largas son las más restringidas: se colocan primero.
+    pending = sorted(original_by_normalized, key=len, reverse=True)
+
+    grid = np.full((size, size), _EMPTY, dtype="<U1")
+    placements: List[Optional[Tuple[int, int, int]]] = []
+    remaining_budget = node_budget
+    while pending:
+        grid[:] = _EMPTY
+        placements, blocking_index, used_nodes = _backtrack_place(grid, pending, direction_steps, rng, branching, remaining_budget)
+        remaining_budget -= used_nodes
+        if blocking_index < 0:
+            break
+        if remaining_budget > 0:
+            # La palabra que bloquea se descarta y se repite la búsqueda con el resto.
+            unplaced.append(original_by_normalized[pending.pop(blocking_index)])
+            continue
+        # Presupuesto agotado: se completa de forma voraz a partir de la mejor rama encontrada.
+        _greedy_complete(grid, pending, placements, blocking_index, direction_steps, rng)
+        break
+
+    placed = []
+    placed_words = []
+    for word, placement in zip(pending, placements):
+        if placement is None:
+            unplaced.append(original_by_normalized[word])
+            continue
+        placed_words.append(word)
+        row, col, direction_index = placement
+        dr, dc = direction_steps[direction_index]
+        placed.append({
+            "word": word,
+            "original": original_by_normalized[word],
+            "row": row,
+            "col": col,
+            "direction": direction_names[direction_index],
+            "end_row": row + dr * (len(word) - 1),
+            "end_col": col + dc * (len(word) - 1),
+        })
+
+    alphabet = _BASE_ALPHABET + ("Ñ" if any("Ñ" in word for word in placed_words) else "")
+    empty_cells = grid == _EMPTY
+    grid[empty_cells] = rng.choice(list(alphabet), size=int(empty_cells.sum()))
+
+    if unplaced:
+        logger.info(f"WordSearch: {len(unplaced)} palabra(s) sin colocar en {size}x{size} (semilla {seed}): {unplaced}")
+    return {"size": size, "seed": seed, "grid": grid.tolist(), "placed": placed, "unplaced": unplaced}
+
+
+def _generate_variant(args: Tuple[Tuple[str, ...], int, int, bool]) -> Dict[str, Any]:
+    words, size, seed, allow_reverse = args
+    return generate_word_search(words, size=size, seed=seed, allow_reverse=allow_reverse)
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=settings.WORD_SEARCH_PROCESS_WORKERS or None)
+    return _process_pool
+
+
+def generate_word_search_variants(
+    words: Sequence[str],
+    num_variants: int,
+    size: int = 15,
+    base_seed: Optional[int] = None,
+    allow_reverse: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Genera `num_variants` sopas de letras con las mismas palabras y semillas derivadas de `base_seed`.
+    A partir de WORD_SEARCH_PROCESS_MIN_VARIANTS se reparten en un pool de procesos (la búsqueda es CPU pura).
+    """
+    if base_seed is None:
+        base_seed = random.SystemRandom().randrange(2**31)
+    jobs = [(tuple(words), size, variant_seed(base_seed, index), allow_reverse) for index in range(num_variants)]
+    if num_variants < settings.WORD_SEARCH_PROCESS_MIN_VARIANTS:
+        return [_generate_variant(job) for job in jobs]
+    return list(_get_process_pool().map(_generate_variant, jobs))
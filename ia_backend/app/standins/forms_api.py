@@ -0,0 +1,146 @@
+# ia_backend/app/standins/forms_api.py
+"""
+Stand-in local de la API de Google Forms (v1) para probar la sincronización de respuestas sin red.
+
+Implementa la creación de formularios (forms.create / forms.batchUpdate con createItem), forms.get y
+forms.responses.list con `filter` ("timestamp > N" / "timestamp >= N"), `pageSize` y `pageToken`.
+Las respuestas se envían con un endpoint propio del stand-in, que también permite editar una respuesta
+existente (actualiza su lastSubmittedTime, como cuando un alumno reenvía el formulario). Uso:
+
+    uvicorn app.standins.forms_api:app --port 8766
+    GOOGLE_FORMS_API_BASE_URL=http://127.0.0.1:8766/ ...
+    curl -X POST http://127.0.0.1:8766/standin/forms/{formId}/responses \\
+         -H 'Content-Type: application/json' -d '{"respondentEmail": "a@b.c", "answers": {"1. Pregunta": "Verdadero"}}'
+"""
+import base64
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException
+
+app = FastAPI(title="Google Forms API stand-in")
+
+# formId -> formulario (con items)
+_forms: Dict[str, Dict[str, Any]] = {}
+# formId -> respuestas, en orden de envío
+_responses: Dict[str, List[Dict[str, Any]]] = {}
+_DEFAULT_PAGE_SIZE = int(os.getenv("STANDIN_FORMS_PAGE_SIZE", "5000"))
+_FILTER_PATTERN = re.compile(r"^\s*timestamp\s*(>=|>)\s*(\S+)\s*$")
+
+
+def _rfc3339(epoch_seconds: float) -> str:
+    return datetime.fromtimestamp(epoch_seconds, tz=timezone.utc).isoformat(timespec="microseconds").replace("+00:00", "Z")
+
+
+def _parse_rfc3339(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _get_form(form_id: str) -> Dict[str, Any]:
+    form = _forms.get(form_id)
+    if form is None:
+        raise HTTPException(status_code=404, detail=f"Requested entity was not found: {form_id}")
+    return form
+
+
+@app.post("/v1/forms")
+async def create_form(body: Dict[str, Any]):
+    form_id = uuid.uuid4().hex
+    form = {
+        "formId": form_id,
+        "info": dict(body.get("info", {})),
+        "items": [],
+        "responderUri": f"https://docs.google.com/forms/d/e/{form_id}/viewform",
+    }
+    _forms[form_id] = form
+    _responses[form_id] = []
+    return form
+
+
+@app.post("/v1/forms/{form_id}:batchUpdate")
+async def batch_update_form(form_id: str, body: Dict[str, Any]):
+    form = _get_form(form_id)
+    replies = []
+    for request in body.get("requests", []):
+        create_item = request.get("createItem")
+        if not create_item:
+            replies.append({})
+            continue
+        item = dict(create_item["item"])
+        item["itemId"] = uuid.uuid4().hex[:8]
+        question_ids = []
+        if "questionItem" in item:
+            question = dict(item["questionItem"].get("question", {}))
+            question["questionId"] = uuid.uuid4().hex[:8]
+            item["questionItem"] = {**item["questionItem"], "question": question}
+            question_ids.append(question["questionId"])
+        index = create_item.get("location", {}).get("index", len(form["items"]))
+        form["items"].insert(index, item)
+        replies.append({"createItem": {"itemId": item["itemId"], "questionId": question_ids}})
+    return {"replies": replies, "form": form}
+
+
+@app.get("/v1/forms/{form_id}")
+async def get_form(form_id: str):
+    return _get_form(form_id)
+
+
+@app.get("/v1/forms/{form_id}/responses")
+async def list_responses(form_id: str, filter: Optional[str] = None, pageSize: Optional[int] = None, pageToken: Optional[str] = None):
+    _get_form(form_id)
+    responses = sorted(_responses[form_id], key=lambda r: r["lastSubmittedTime"])
+    if filter:
+        match = _FILTER_PATTERN.match(filter)
+        if not match:
+            raise HTTPException(status_code=400, detail=f"Invalid filter: {filter}")
+        operator, bound = match.group(1), _parse_rfc3339(match.group(2))
+        responses = [
+            r for r in responses
+            if (_parse_rfc3339(r["lastSubmittedTime"]) > bound if operator == ">" else _parse_rfc3339(r["lastSubmittedTime"]) >= bound)
+        ]
+    offset = int(base64.urlsafe_b64decode(pageToken.encode()).decode()) if pageToken else 0
+    page_size = min(pageSize or _DEFAULT_PAGE_SIZE, 5000)
+    page = responses[offset: offset + page_size]
+    body: Dict[str, Any] = {"responses": page} if page else {}
+    if offset + page_size < len(responses):
+        body["nextPageToken"] = base64.urlsafe_b64encode(str(offset + page_size).encode()).decode()
+    return body
+
+
+@app.post("/standin/forms/{form_id}/responses")
+async def submit_response(form_id: str, body: Dict[str, Any]):
+    """
+    Solo del stand-in: registra (o edita, si se indica `responseId`) una respuesta. `answers` va indexado
+    por questionId o por título de la pregunta; cada valor es un texto o una lista de textos.
+    """
+    form = _get_form(form_id)
+    question_id_by_title = {
+        item.get("title"): item["questionItem"]["question"]["questionId"]
+        for item in form["items"] if "questionItem" in item
+    }
+    answers = {}
+    for key, value in (body.get("answers") or {}).items():
+        question_id = question_id_by_title.get(key, key)
+        values = value if isinstance(value, list) else [value]
+        answers[question_id] = {"questionId": question_id, "textAnswers": {"answers": [{"value": str(v)} for v in values]}}
+
+    now = _rfc3339(time.time())
+    existing = next((r for r in _responses[form_id] if r["responseId"] == body.get("responseId")), None)
+    if existing is not None:
+        existing.update({"lastSubmittedTime": now, "answers": answers})
+        return existing
+    response = {
+        "formId": form_id,
+        "responseId": body.get("responseId") or uuid.uuid4().hex,
+        "createTime": now,
+        "lastSubmittedTime": now,
+        "answers": answers,
+    }
+    if body.get("respondentEmail"):
+        response["respondentEmail"] = body["respondentEmail"]
+    _responses[form_id].append(response)
+    return response
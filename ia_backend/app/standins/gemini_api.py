@@ -0,0 +1,236 @@
+# ia_backend/app/standins/gemini_api.py
+"""
+Stand-in local de la API REST de Gemini para pruebas sin red.
+
+Implementa los endpoints de contenido cacheado (cachedContents), una versión mínima de
+generateContent / streamGenerateContent que responde con datos de ejemplo construidos a
+partir del responseSchema de la petición, y el modo por lotes (batchGenerateContent +
+GET batches/{id}), que completa cada lote unos segundos después de crearlo. Uso:
+
+    uvicorn app.standins.gemini_api:app --port 8765
+    GEMINI_API_BASE_URL=http://127.0.0.1:8765/v1beta GEMINI_CONTEXT_CACHE_ENABLED=true ...
+"""
+import json
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI(title="Gemini API stand-in")
+
+# name -> recurso cachedContent (con "_expire_at" interno en epoch)
+_cached_contents: Dict[str, Dict[str, Any]] = {}
+# name -> lote (con "_requests" y "_ready_at" internos)
+_batches: Dict[str, Dict[str, Any]] = {}
+_BATCH_PROCESSING_SECONDS = float(os.getenv("STANDIN_BATCH_PROCESSING_SECONDS", "2"))
+
+
+def _rfc3339(epoch_seconds: float) -> str:
+    return datetime.fromtimestamp(epoch_seconds, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _parse_ttl(ttl: Optional[str], default_seconds: float = 3600.0) -> float:
+    if not ttl:
+        return default_seconds
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)s", ttl.strip())
+    if not match:
+        raise HTTPException(status_code=400, detail=f"Invalid ttl '{ttl}'.")
+    return float(match.group(1))
+
+
+def _public(resource: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in resource.items() if not k.startswith("_") and k != "contents"}
+
+
+def _get_live_cached_content(name: str) -> Dict[str, Any]:
+    resource = _cached_contents.get(name)
+    if not resource or resource["_expire_at"] <= time.time():
+        _cached_contents.pop(name, None)
+        raise HTTPException(status_code=404, detail=f"CachedContent not found (or expired): {name}")
+    return resource
+
+
+@app.post("/v1beta/cachedContents")
+async def create_cached_content(body: Dict[str, Any]):
+    if not body.get("model") or not body.get("contents"):
+        raise HTTPException(status_code=400, detail="'model' and 'contents' are required.")
+    now = time.time()
+    expire_at = now + _parse_ttl(body.get("ttl"))
+    name = f"cachedContents/{uuid.uuid4().hex[:16]}"
+    total_chars = sum(len(part.get("text", "")) for content in body["contents"] for part in content.get("parts", []))
+    resource = {
+        "name": name,
+        "model": body["model"],
+        "displayName": body.get("displayName", ""),
+        "createTime": _rfc3339(now),
+        "updateTime": _rfc3339(now),
+        "expireTime": _rfc3339(expire_at),
+        "usageMetadata": {"totalTokenCount": total_chars // 4},
+        "contents": body["contents"],
+        "_expire_at": expire_at,
+    }
+    _cached_contents[name] = resource
+    return _public(resource)
+
+
+@app.get("/v1beta/cachedContents")
+async def list_cached_contents():
+    live = []
+    for name in list(_cached_contents):
+        try:
+            live.append(_public(_get_live_cached_content(name)))
+        except HTTPException:
+            continue
+    return {"cachedContents": live}
+
+
+@app.get("/v1beta/cachedContents/{cache_id}")
+async def get_cached_content(cache_id: str):
+    return _public(_get_live_cached_content(f"cachedContents/{cache_id}"))
+
+
+@app.patch("/v1beta/cachedContents/{cache_id}")
+async def update_cached_content(cache_id: str, body: Dict[str, Any]):
+    resource = _get_live_cached_content(f"cachedContents/{cache_id}")
+    now = time.time()
+    resource["_expire_at"] = now + _parse_ttl(body.get("ttl"))
+    resource["expireTime"] = _rfc3339(resource["_expire_at"])
+    resource["updateTime"] = _rfc3339(now)
+    return _public(resource)
+
+
+@app.delete("/v1beta/cachedContents/{cache_id}")
+async def delete_cached_content(cache_id: str):
+    name = f"cachedContents/{cache_id}"
+    if name not in _cached_contents:
+        raise HTTPException(status_code=404, detail=f"CachedContent not found: {name}")
+    _cached_contents.pop(name)
+    return {}
+
+
+def sample_from_schema(schema: Dict[str, Any], index: int = 1) -> Any:
+    """Construye un valor de ejemplo que cumple un responseSchema de Gemini (OBJECT/ARRAY/STRING/...)."""
+    schema_type = (schema.get("type") or "STRING").upper()
+    if schema_type == "OBJECT":
+        result = {key: sample_from_schema(sub_schema, index) for key, sub_schema in (schema.get("properties") or {}).items()}
+        if isinstance(result.get("options"), list) and "correct_option_text" in result:
+            result["correct_option_text"] = result["options"][0]
+        return result
+    if schema_type == "ARRAY":
+        match = re.search(r"(\d+)", schema.get("description", ""))
+        count = int(match.group(1)) if match else 3
+        return [sample_from_schema(schema.get("items") or {}, i + 1) for i in range(count)]
+    if schema_type == "BOOLEAN":
+        return index % 2 == 1
+    if schema_type in ("INTEGER", "NUMBER"):
+        return index
+    return f"Texto de ejemplo {index}"
+
+
+def _resolve_generation(model_action: str, body: Dict[str, Any]) -> str:
+    model, _, _ = model_action.partition(":")
+    cache_name = body.get("cachedContent")
+    if cache_name:
+        resource = _get_live_cached_content(cache_name)
+        if resource["model"] != f"models/{model}":
+            raise HTTPException(status_code=400, detail=f"Model '{model}' does not match cached content model '{resource['model']}'.")
+    schema = (body.get("generationConfig") or {}).get("responseSchema")
+    if schema:
+        return json.dumps(sample_from_schema(schema), ensure_ascii=False)
+    return "Respuesta de ejemplo del stand-in de Gemini."
+
+
+def _candidate(text: str, finish_reason: Optional[str]) -> Dict[str, Any]:
+    candidate: Dict[str, Any] = {"content": {"role": "model", "parts": [{"text": text}]}}
+    if finish_reason:
+        candidate["finishReason"] = finish_reason
+    return {"candidates": [candidate]}
+
+
+def _batch_operation(batch: Dict[str, Any]) -> Dict[str, Any]:
+    """Representación del lote como operación de larga duración; al cumplirse `_ready_at` se procesan las peticiones."""
+    done = time.time() >= batch["_ready_at"]
+    operation: Dict[str, Any] = {
+        "name": batch["name"],
+        "metadata": {
+            "@type": "type.googleapis.com/google.ai.generativelanguage.v1beta.GenerateContentBatch",
+            "name": batch["name"],
+            "model": batch["model"],
+            "displayName": batch["displayName"],
+            "createTime": batch["createTime"],
+            "state": "BATCH_STATE_SUCCEEDED" if done else "BATCH_STATE_RUNNING",
+        },
+        "done": done,
+    }
+    if done:
+        inlined_responses = []
+        for item in batch["_requests"]:
+            try:
+                response: Dict[str, Any] = {"response": _candidate(_resolve_generation(batch["_model_action"], item.get("request") or {}), "STOP")}
+            except HTTPException as e:
+                response = {"error": {"code": e.status_code, "message": e.detail}}
+            if item.get("metadata"):
+                response["metadata"] = item["metadata"]
+            inlined_responses.append(response)
+        operation["response"] = {
+            "@type": "type.googleapis.com/google.ai.generativelanguage.v1beta.GenerateContentBatchOutput",
+            "inlinedResponses": {"inlinedResponses": inlined_responses},
+        }
+    return operation
+
+
+@app.get("/v1beta/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    batch = _batches.get(f"batches/{batch_id}")
+    if not batch:
+        raise HTTPException(status_code=404, detail=f"Batch not found: batches/{batch_id}")
+    return _batch_operation(batch)
+
+
+@app.delete("/v1beta/batches/{batch_id}")
+async def delete_batch(batch_id: str):
+    if _batches.pop(f"batches/{batch_id}", None) is None:
+        raise HTTPException(status_code=404, detail=f"Batch not found: batches/{batch_id}")
+    return {}
+
+
+@app.post("/v1beta/models/{model_action}")
+async def generate_content(model_action: str, request: Request):
+    body = await request.json()
+    if model_action.endswith(":batchGenerateContent"):
+        batch_body = body.get("batch") or {}
+        inlined = ((batch_body.get("inputConfig") or {}).get("requests") or {}).get("requests")
+        if not inlined:
+            raise HTTPException(status_code=400, detail="batch.inputConfig.requests.requests is required.")
+        model, _, _ = model_action.partition(":")
+        now = time.time()
+        name = f"batches/{uuid.uuid4().hex[:16]}"
+        _batches[name] = {
+            "name": name,
+            "model": f"models/{model}",
+            "displayName": batch_body.get("displayName", ""),
+            "createTime": _rfc3339(now),
+            "_model_action": f"{model}:generateContent",
+            "_requests": inlined,
+            "_ready_at": now + _BATCH_PROCESSING_SECONDS,
+        }
+        return _batch_operation(_batches[name])
+    if model_action.endswith(":generateContent"):
+        return _candidate(_resolve_generation(model_action, body), "STOP")
+    if model_action.endswith(":streamGenerateContent"):
+        text = _resolve_generation(model_action, body)
+        chunk_size = 64
+
+        async def event_stream():
+            chunks: List[str] = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)] or [""]
+            for i, chunk in enumerate(chunks):
+                finish_reason = "STOP" if i == len(chunks) - 1 else None
+                yield f"data: {json.dumps(_candidate(chunk, finish_reason), ensure_ascii=False)}\r\n\r\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+    raise HTTPException(status_code=404, detail=f"Unsupported method: {model_action}")
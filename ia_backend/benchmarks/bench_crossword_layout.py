@@ -0,0 +1,77 @@
+# ia_backend/benchmarks/bench_crossword_layout.py
+"""
+Benchmark del motor de crucigramas sobre conjuntos de palabras clave extraídos de processed_data/.
+
+Para cada texto se toman las palabras más frecuentes (>= 5 letras, sin palabras vacías) y se mide
+el tiempo de disposición, las palabras colocadas, los cruces y la densidad con varios anchos de haz.
+Además se valida que toda secuencia de 2+ letras de la cuadrícula sea una palabra colocada. Ejecutar
+desde ia_backend/:
+
+    python -m benchmarks.bench_crossword_layout [num_palabras] [repeticiones]
+"""
+import os
+import re
+import sys
+import time
+from collections import Counter
+from typing import Dict, List
+
+from app.core.config import settings
+from app.services.crossword_engine import BLOCK, generate_crossword_layout
+
+_STOPWORDS = {
+    "sobre", "entre", "cuando", "donde", "desde", "hasta", "también", "porque", "puede", "pueden", "todos",
+    "todas", "otros", "otras", "cada", "tiene", "tienen", "estos", "estas", "siendo", "hacer", "forma",
+    "parte", "mismo", "misma", "según", "durante", "además", "través", "mediante", "aunque", "había",
+    "which", "their", "there", "these", "those", "would", "could", "should", "about", "other",
+}
+
+
+def extract_keywords(text: str, count: int) -> List[str]:
+    tokens = re.findall(r"[a-záéíóúüñ]{5,}", text.lower())
+    frequencies = Counter(token for token in tokens if token not in _STOPWORDS)
+    return [word for word, _ in frequencies.most_common(count)]
+
+
+def find_invalid_runs(grid: List[List[str]], placed: List[Dict]) -> List[str]:
+    """Secuencias horizontales/verticales de 2+ letras que no son palabras colocadas."""
+    expected = {(p["word"], p["direction"]) for p in placed}
+    invalid = []
+    lines = [("across", "".join(row)) for row in grid]
+    lines += [("down", "".join(column)) for column in zip(*grid)] if grid else []
+    for direction, line in lines:
+        for run in line.split(BLOCK):
+            if len(run) >= 2 and (run, direction) not in expected:
+                invalid.append(run)
+    return invalid
+
+
+def main() -> None:
+    num_words = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    data_dir = settings.PROCESSED_DATA_DIR
+    files = sorted(name for name in os.listdir(data_dir) if name.endswith("_full_text.txt"))
+    if not files:
+        print(f"No hay textos en {data_dir}")
+        return
+
+    print(f"{'PDF':<22} {'haz':>4} {'ms':>8} {'colocadas':>10} {'cruces':>7} {'densidad':>9} {'tamaño':>8} {'inválidas':>9}")
+    for name in files:
+        with open(os.path.join(data_dir, name), encoding="utf-8") as handle:
+            keywords = extract_keywords(handle.read(), num_words)
+        if len(keywords) < 2:
+            continue
+        for beam_width in (1, 4, settings.CROSSWORD_BEAM_WIDTH, 32):
+            start = time.perf_counter()
+            for _ in range(repetitions):
+                layout = generate_crossword_layout(keywords, beam_width=beam_width)
+            elapsed_ms = (time.perf_counter() - start) / repetitions * 1000
+            invalid = find_invalid_runs(layout["grid"], layout["placed"])
+            print(
+                f"{name[:20]:<22} {beam_width:>4} {elapsed_ms:>8.1f} {len(layout['placed']):>4}/{len(keywords):<5} "
+                f"{layout['intersections']:>7} {layout['density']:>9.3f} {layout['rows']:>3}x{layout['cols']:<4} {len(invalid):>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# ia_backend/benchmarks/bench_response_parsing.py
+"""
+Micro-benchmark del camino de parseo de respuestas de generación de exámenes.
+
+Compara el parseo anterior (json del sobre -> json.loads del texto -> modelo Pydantic) con la
+validación directa desde los bytes mediante el TypeAdapter cacheado, y la construcción de
+schema + prompt sin y con el registro precompilado. Ejecutar desde ia_backend/:
+
+    python -m benchmarks.bench_response_parsing [num_preguntas_por_tipo] [repeticiones]
+"""
+import json
+import sys
+import timeit
+
+from app.models.schemas import LLMGeneratedQuestions
+from app.services import exam_prompt_registry
+from app.services.exam_prompt_registry import parse_generate_content_bytes, render_full_exam_prompt
+
+
+def build_sample_response(per_type: int) -> bytes:
+    questions = {
+        "true_false_questions": [
+            {"question_text": f"Afirmación de ejemplo número {i} sobre el documento.", "answer": i % 2 == 0, "explanation": "Explicación breve."}
+            for i in range(per_type)
+        ],
+        "multiple_choice_questions": [
+            {
+                "question_text": f"¿Cuál es la opción correcta en la pregunta {i}?",
+                "options": ["Opción A", "Opción B", "Opción C", "Opción D"],
+                "correct_option_text": "Opción B",
+                "explanation": "La opción B es la correcta según el texto.",
+            }
+            for i in range(per_type)
+        ],
+        "open_questions": [
+            {"question_text": f"Explica el concepto {i} del documento.", "explanation_or_answer_guide": "Guía de respuesta."}
+            for i in range(per_type)
+        ],
+        "fill_in_the_blank_questions": [
+            {"question_text_with_placeholders": f"El concepto {i} se define como __BLANK__.", "correct_answers": ["respuesta"], "explanation": "Definición."}
+            for i in range(per_type)
+        ],
+    }
+    envelope = {"candidates": [{"content": {"role": "model", "parts": [{"text": json.dumps(questions, ensure_ascii=False)}]}, "finishReason": "STOP"}]}
+    return json.dumps(envelope, ensure_ascii=False).encode("utf-8")
+
+
+def parse_previous(raw_response: bytes) -> LLMGeneratedQuestions:
+    response_json = json.loads(raw_response)
+    json_text = response_json["candidates"][0]["content"]["parts"][0]["text"]
+    return LLMGeneratedQuestions(**json.loads(json_text))
+
+
+def parse_direct(raw_response: bytes) -> LLMGeneratedQuestions:
+    return parse_generate_content_bytes(raw_response, LLMGeneratedQuestions)
+
+
+def build_uncached(text: str) -> None:
+    exam_prompt_registry.get_full_exam_response_schema.cache_clear()
+    exam_prompt_registry._full_exam_prompt_head.cache_clear()
+    exam_prompt_registry.get_full_exam_response_schema(5, 5, 2, 2)
+    render_full_exam_prompt(text, 5, 5, 2, 2, "medio", "es")
+
+
+def build_cached(text: str) -> None:
+    exam_prompt_registry.get_full_exam_response_schema(5, 5, 2, 2)
+    render_full_exam_prompt(text, 5, 5, 2, 2, "medio", "es")
+
+
+def report(label: str, seconds: float, repetitions: int) -> None:
+    print(f"{label:<45} {seconds / repetitions * 1e6:10.1f} µs/iter")
+
+
+def main() -> None:
+    per_type = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    raw_response = build_sample_response(per_type)
+    assert parse_previous(raw_response) == parse_direct(raw_response)
+
+    print(f"Respuesta de {len(raw_response)} bytes, {per_type * 4} preguntas, {repetitions} repeticiones")
+    report("Parseo anterior (json + json.loads + modelo)", timeit.timeit(lambda: parse_previous(raw_response), number=repetitions), repetitions)
+    report("Validación directa (TypeAdapter cacheado)", timeit.timeit(lambda: parse_direct(raw_response), number=repetitions), repetitions)
+
+    text = "Texto de referencia del documento. " * 1000
+    report("Schema + prompt sin caché", timeit.timeit(lambda: build_uncached(text), number=repetitions), repetitions)
+    report("Schema + prompt con registro precompilado", timeit.timeit(lambda: build_cached(text), number=repetitions), repetitions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# ia_backend/tests/test_forms_sync.py
+"""
+Sincronización incremental de respuestas de Google Forms contra el stand-in de la API
+(app/standins/forms_api.py) y un Firestore en memoria.
+"""
+import time
+from typing import Any, Dict, List
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services.forms_sync_service import sync_form_responses
+from app.standins.forms_api import app as forms_standin_app
+
+EXAM_ID = "exam1"
+GROUP_ID = "group1"
+QUESTION_TITLES = ["1. Capital de Francia", "2. Verdadero o falso"]
+
+
+# --- Firestore en memoria (solo lo que usan sync_form_responses y write_in_batches) ---
+class FakeSnapshot:
+    def __init__(self, data):
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db: "FakeFirestore", path: str):
+        self._db = db
+        self.path = path
+
+    def collection(self, name: str) -> "FakeCollection":
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+    def get(self) -> FakeSnapshot:
+        return FakeSnapshot(self._db.docs.get(self.path))
+
+    def set(self, data: Dict[str, Any], merge: bool = False) -> None:
+        self._db.write(self.path, data, merge)
+
+
+class FakeCollection:
+    def __init__(self, db: "FakeFirestore", path: str):
+        self._db = db
+        self.path = path
+
+    def document(self, doc_id: str) -> FakeDocument:
+        return FakeDocument(self._db, f"{self.path}/{doc_id}")
+
+
+class FakeBatch:
+    def __init__(self, db: "FakeFirestore"):
+        self._db = db
+        self._writes = []
+
+    def set(self, doc_ref: FakeDocument, data: Dict[str, Any], merge: bool = False) -> None:
+        self._writes.append((doc_ref.path, data, merge))
+
+    def commit(self) -> None:
+        if self._db.fail_commits:
+            raise RuntimeError("commit rechazado")
+        for path, data, merge in self._writes:
+            self._db.write(path, data, merge)
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.fail_commits = False
+
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self, name)
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch(self)
+
+    def write(self, path: str, data: Dict[str, Any], merge: bool) -> None:
+        self.docs[path] = {**self.docs.get(path, {}), **data} if merge else dict(data)
+
+    def attempts(self) -> Dict[str, Dict[str, Any]]:
+        suffix = f"/examAttempts/{EXAM_ID}"
+        return {path.split("/")[1]: data for path, data in self.docs.items() if path.endswith(suffix)}
+
+
+# --- Cliente de la API de Forms (misma forma que googleapiclient) sobre el stand-in ---
+class _Request:
+    def __init__(self, client: TestClient, path: str, params: Dict[str, Any]):
+        self._client = client
+        self._path = path
+        self._params = params
+
+    def execute(self) -> Dict[str, Any]:
+        response = self._client.get(self._path, params=self._params)
+        response.raise_for_status()
+        return response.json()
+
+
+class StandinFormsService:
+    def __init__(self, client: TestClient):
+        self._client = client
+        self.list_calls: List[Dict[str, Any]] = []
+
+    def forms(self) -> "StandinFormsService":
+        return self
+
+    def responses(self) -> "StandinFormsService":
+        return self
+
+    def get(self, formId: str) -> _Request:
+        return _Request(self._client, f"/v1/forms/{formId}", {})
+
+    def list(self, formId: str, **params: Any) -> _Request:
+        self.list_calls.append(params)
+        return _Request(self._client, f"/v1/forms/{formId}/responses", params)
+
+
+@pytest.fixture
+def client() -> TestClient:
+    return TestClient(forms_standin_app)
+
+
+@pytest.fixture
+def form_id(client: TestClient) -> str:
+    form_id = client.post("/v1/forms", json={"info": {"title": "Examen"}}).json()["formId"]
+    requests = [
+        {"createItem": {"item": {"title": title, "questionItem": {"question": {"textQuestion": {}}}}, "location": {"index": i}}}
+        for i, title in enumerate(QUESTION_TITLES)
+    ]
+    client.post(f"/v1/forms/{form_id}:batchUpdate", json={"requests": requests})
+    return form_id
+
+
+def submit(client: TestClient, form_id: str, email: str, answer: str, response_id: str = None) -> Dict[str, Any]:
+    body = {"respondentEmail": email, "answers": {QUESTION_TITLES[0]: answer, QUESTION_TITLES[1]: "Verdadero"}}
+    if response_id:
+        body["responseId"] = response_id
+    return client.post(f"/standin/forms/{form_id}/responses", json=body).json()
+
+
+def sync(db: FakeFirestore, forms_service: StandinFormsService, form_id: str, page_size: int = 2) -> Dict[str, Any]:
+    return sync_form_responses(EXAM_ID, GROUP_ID, form_id=form_id, db=db, forms_service=forms_service, page_size=page_size)
+
+
+def test_sync_pages_through_all_responses(client, form_id):
+    for i in range(5):
+        submit(client, form_id, f"alumno{i}@example.com", f"París {i}")
+    db, forms_service = FakeFirestore(), StandinFormsService(client)
+
+    result = sync(db, forms_service, form_id)
+
+    assert result["errors"] == []
+    assert (result["imported"], result["fetched"], result["pages"]) == (5, 5, 3)
+    assert all(call["pageSize"] == 2 for call in forms_service.list_calls)
+    assert "filter" not in forms_service.list_calls[0]
+    attempts = db.attempts()
+    assert sorted(attempts) == [f"alumno{i}@example.com" for i in range(5)]
+    assert attempts["alumno3@example.com"]["answers"] == {QUESTION_TITLES[0]: "París 3", QUESTION_TITLES[1]: "Verdadero"}
+    assert attempts["alumno3@example.com"]["group_id"] == GROUP_ID
+    state = db.docs[f"exams/{EXAM_ID}/formsSync/{form_id}"]
+    assert state["watermark"] == result["watermark"]
+    assert state["synced_total"] == 5
+
+
+def test_second_sync_skips_responses_at_watermark(client, form_id):
+    for i in range(3):
+        submit(client, form_id, f"alumno{i}@example.com", "París")
+    db, forms_service = FakeFirestore(), StandinFormsService(client)
+    first = sync(db, forms_service, form_id)
+    forms_service.list_calls.clear()
+
+    second = sync(db, forms_service, form_id)
+
+    assert forms_service.list_calls[0]["filter"] == f"timestamp >= {first['watermark']}"
+    assert second["imported"] == 0
+    assert second["fetched"] == second["skipped"] >= 1
+    assert second["watermark"] == first["watermark"]
+    assert db.docs[f"exams/{EXAM_ID}/formsSync/{form_id}"]["synced_total"] == 3
+
+
+def test_edited_response_is_synced_again(client, form_id):
+    edited = submit(client, form_id, "alumno0@example.com", "Lyon")
+    submit(client, form_id, "alumno1@example.com", "París")
+    db, forms_service = FakeFirestore(), StandinFormsService(client)
+    first = sync(db, forms_service, form_id)
+    time.sleep(0.01)  # el stand-in usa la hora actual (microsegundos) como lastSubmittedTime
+
+    submit(client, form_id, "alumno0@example.com", "París", response_id=edited["responseId"])
+    second = sync(db, forms_service, form_id)
+
+    assert second["imported"] == 1
+    assert second["watermark"] > first["watermark"]
+    assert db.attempts()["alumno0@example.com"]["answers"][QUESTION_TITLES[0]] == "París"
+    assert db.docs[f"exams/{EXAM_ID}/formsSync/{form_id}"]["response_ids_at_watermark"] == [edited["responseId"]]
+
+
+def test_failed_batch_keeps_previous_watermark(client, form_id):
+    submit(client, form_id, "alumno0@example.com", "París")
+    db, forms_service = FakeFirestore(), StandinFormsService(client)
+    first = sync(db, forms_service, form_id)
+    time.sleep(0.01)
+    submit(client, form_id, "alumno1@example.com", "París")
+    db.fail_commits = True
+
+    failed = sync(db, forms_service, form_id)
+
+    assert failed["imported"] == 0
+    assert len(failed["errors"]) == 1
+    assert failed["watermark"] == first["watermark"]
+    state = db.docs[f"exams/{EXAM_ID}/formsSync/{form_id}"]
+    assert state["watermark"] == first["watermark"]
+    assert "alumno1@example.com" not in db.attempts()
+
+    db.fail_commits = False
+    retried = sync(db, forms_service, form_id)
+    assert retried["imported"] == 1
+    assert "alumno1@example.com" in db.attempts()